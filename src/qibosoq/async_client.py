@@ -0,0 +1,106 @@
+"""Asynchronous qibosoq client, to drive several boards concurrently.
+
+The functions mirror the ones of :mod:`qibosoq.client`, but use non-blocking
+asyncio streams, so that the commands sent to different boards are executed
+in parallel and the total time is the one of the slowest board.
+"""
+
+import asyncio
+from typing import Dict, Optional, Tuple, Union
+
+from qibosoq.client import convert_commands, decode_results, encode_commands
+from qibosoq.transport import LENGTH_SIZE, configure_socket
+
+Target = Tuple[str, Optional[int]]
+"""Host and port of a qibosoq server (or Unix socket path and None)."""
+
+
+async def send_commands(
+    server_commands: dict,
+    host: str,
+    port: Optional[int],
+    compression: Optional[int] = None,
+):
+    """Open a connection with the server, send the commands and return the reply.
+
+    If port is None, host is the path of the Unix domain socket of the server.
+    The results are the ones of :func:`qibosoq.client.send_commands`.
+    """
+    if port is None:
+        reader, writer = await asyncio.open_unix_connection(host)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        configure_socket(writer.get_extra_info("socket"))
+        level = 0 if compression is None else compression
+        writer.write(encode_commands(server_commands, level))
+        await writer.drain()
+        length = int.from_bytes(await reader.readexactly(LENGTH_SIZE), "big")
+        received = await reader.readexactly(length)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return decode_results(received, negotiated=True, shared=port is None)
+
+
+async def connect(
+    server_commands: dict,
+    host: str,
+    port: Optional[int],
+    compression: Optional[int] = None,
+) -> Tuple[list, list]:
+    """Open a connection with the server and executes the commands."""
+    results = await send_commands(server_commands, host, port, compression)
+    return results["i"], results["q"]
+
+
+async def execute(
+    obj_dictionary: dict,
+    host: str,
+    port: Optional[int],
+    compression: Optional[int] = None,
+) -> Tuple[list, list]:
+    """Convert a dictionary of objects and run experiment."""
+    server_commands = convert_commands(obj_dictionary)
+    return await connect(server_commands, host, port, compression)
+
+
+async def execute_many(
+    obj_dictionaries: Dict[Target, dict],
+    timeout: Optional[float] = None,
+    compression: Optional[int] = None,
+) -> Dict[Target, Union[Tuple[list, list], BaseException]]:
+    """Execute experiments on many boards concurrently and gather the results.
+
+    Args:
+        obj_dictionaries: experiment to execute for each board (host, port)
+        timeout: maximum time (seconds) waited for each board, if given
+        compression: zlib level of the compression of large messages, if given
+
+    Returns:
+        (dict): for each board, the (i, q) results or the error it raised,
+        `asyncio.TimeoutError` if the board did not reply in time
+    """
+    targets = list(obj_dictionaries)
+    results = await asyncio.gather(
+        *(
+            asyncio.wait_for(
+                execute(obj_dictionaries[target], *target, compression), timeout
+            )
+            for target in targets
+        ),
+        return_exceptions=True,
+    )
+    return dict(zip(targets, results))
+
+
+def execute_boards(
+    obj_dictionaries: Dict[Target, dict],
+    timeout: Optional[float] = None,
+    compression: Optional[int] = None,
+) -> Dict[Target, Union[Tuple[list, list], BaseException]]:
+    """Execute experiments on many boards concurrently, from synchronous code.
+
+    See :func:`execute_many`.
+    """
+    return asyncio.run(execute_many(obj_dictionaries, timeout, compression))
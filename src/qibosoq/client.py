@@ -2,11 +2,22 @@
 
 import json
 import re
-import socket
-from dataclasses import asdict
-from typing import List, Tuple
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from qibosoq.components.base import Parameter
+from qibosoq.codec import (
+    encode_columns,
+    encode_config,
+    encode_qubit,
+    encode_sequence,
+    encode_sweeper,
+)
+from qibosoq.components.base import OperationCode, Parameter
+from qibosoq.compression import Codec, compress, decompress, encode_header
+from qibosoq.estimator import merge_sequences
+from qibosoq.shared import attach_results
+from qibosoq.transport import open_socket, recv_frame
+from qibosoq.validation import convert_batch, merged_sweepers, validate_command
 
 
 class QibosoqError(RuntimeError):
@@ -33,47 +44,128 @@ class BufferLengthError(QibosoqError):
     """
 
 
-def connect(server_commands: dict, host: str, port: int) -> Tuple[list, list]:
+def send_commands(
+    server_commands: dict,
+    host: str,
+    port: Optional[int],
+    compression: Optional[int] = None,
+):
+    """Open a connection with the server, send the commands and return the reply.
+
+    If compression is given, large commands and replies are compressed with
+    zlib at that level (see :mod:`qibosoq.compression`). The reply is always
+    negotiated, so that it is preceded by its length.
+    If port is None, host is the path of the Unix domain socket of a server
+    on the same machine, which shares large results in memory: the i and q
+    values larger than `configuration.SHARED_MEMORY_THRESHOLD` bytes are then
+    `np.ndarray` mapped on the shared segments, while the smaller ones (and
+    all the values received over TCP) are nested lists.
+    """
+    level = 0 if compression is None else compression
+    with open_socket(host, port) as sock:
+        sock.sendall(encode_commands(server_commands, level))
+        return decode_results(recv_frame(sock), negotiated=True, shared=port is None)
+
+
+def encode_commands(server_commands: dict, compression: Optional[int] = None) -> bytes:
+    """Encode the commands, preceded by the length of the encoded dictionary.
+
+    If compression is given, the header negotiates the compression of the reply.
+    """
+    msg_encoded = bytes(json.dumps(server_commands), "utf-8")
+    codec = Codec.NONE
+    if compression is not None:
+        codec, msg_encoded = compress(msg_encoded, compression)
+    return encode_header(len(msg_encoded), codec, compression) + msg_encoded
+
+
+def decode_results(
+    received: Union[bytes, bytearray], negotiated: bool = False, shared: bool = False
+):
+    """Decode the reply of the server, raising the errors it reported.
+
+    Replies to commands negotiating the compression start with their codec.
+    If `shared`, the reply was received on the Unix domain socket, and the
+    shared arrays of the results are mapped (see :mod:`qibosoq.shared`).
+    """
+    message: Union[bytes, bytearray, memoryview] = received
+    if negotiated:
+        message = decompress(received[0], memoryview(received)[1:])
+    results = json.loads(str(message, "utf-8"))
+    if isinstance(results, str):
+        if "exception in readout loop" in results:
+            raise RuntimeLoopError(results)
+        buffer_overflow = r"buffer length must be \d+ samples or less"
+        if re.search(buffer_overflow, results) is not None:
+            raise BufferLengthError(results)
+        raise QibosoqError(results)
+    if not shared:
+        return results
+    return attach_results(results)
+
+
+def connect(
+    server_commands: dict,
+    host: str,
+    port: Optional[int],
+    compression: Optional[int] = None,
+) -> Tuple[list, list]:
     """Open a connection with the server and executes the commands."""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.connect((host, port))
-        msg_encoded = bytes(json.dumps(server_commands), "utf-8")
-
-        # send the length of the encoded dictionry before the dict itself
-        sock.send(len(msg_encoded).to_bytes(4, "big"))
-        sock.send(msg_encoded)
-
-        # receive and decode the results
-        received = bytearray()
-        while True:
-            tmp = sock.recv(4096)
-            if not tmp:
-                break
-            received.extend(tmp)
-        results = json.loads(received.decode("utf-8"))
-        if isinstance(results, str):
-            if "exception in readout loop" in results:
-                raise RuntimeLoopError(results)
-            buffer_overflow = r"buffer length must be \d+ samples or less"
-            if re.search(buffer_overflow, results) is not None:
-                raise BufferLengthError(results)
-            raise QibosoqError(results)
-        return results["i"], results["q"]
-
-
-def convert_commands(obj_dictionary: dict) -> dict:
-    """Convert the contents of a commands dictionary from object to dict."""
+    results = send_commands(server_commands, host, port, compression)
+    return results["i"], results["q"]
+
+
+def convert_commands(
+    obj_dictionary: dict, binary: bool = False, columnar: bool = False
+) -> dict:
+    """Convert the contents of a commands dictionary from object to dict.
+
+    Instead of a single "sequence", a list of "sequences" on disjoint channels
+    can be given: the server merges them in a single program, and sweeper
+    indexes refer to the concatenation of the sequences.
+    A list of "interleaved" sequences is executed by a single program instead,
+    selecting one of them in every shot.
+
+    If binary, arbitrary waveforms and sweeper values are sent as raw buffers.
+    If columnar, sequences are sent by columns (see
+    :func:`qibosoq.codec.encode_columns`), much more compact for long sequences.
+    """
+    parts = obj_dictionary.get("sequences", obj_dictionary.get("interleaved"))
+    encoded: Union[List[dict], dict]
+    encoded_parts: Union[List[List[dict]], List[dict]]
+    if parts is not None:
+        sequence = [elem for seq in parts for elem in seq]
+        if columnar:
+            encoded_parts = [encode_columns(seq, binary) for seq in parts]
+            encoded = encode_columns(sequence, binary)
+        else:
+            encoded_parts = [encode_sequence(seq, binary) for seq in parts]
+            encoded = [elem for seq in encoded_parts for elem in seq]
+    else:
+        sequence = obj_dictionary["sequence"]
+        if columnar:
+            encoded = encode_columns(sequence, binary)
+        else:
+            encoded = encode_sequence(sequence, binary)
     dict_dictionary = {
         "operation_code": obj_dictionary["operation_code"],
-        "cfg": asdict(obj_dictionary["cfg"]),
-        "sequence": [asdict(element) for element in obj_dictionary["sequence"]],
-        "qubits": [asdict(qubit) for qubit in obj_dictionary["qubits"]],
+        "cfg": encode_config(obj_dictionary["cfg"]),
+        "sequence": encoded,
+        "qubits": [encode_qubit(qubit, binary) for qubit in obj_dictionary["qubits"]],
     }
+    for key in ("sequences", "interleaved"):
+        if key in obj_dictionary:
+            dict_dictionary[key] = encoded_parts
     if "sweepers" in obj_dictionary:
         dict_dictionary["sweepers"] = [
-            sweep.serialized for sweep in obj_dictionary["sweepers"]
+            encode_sweeper(sweep, binary) for sweep in obj_dictionary["sweepers"]
+        ]
+        check_valid_swept_seq(obj_dictionary["sweepers"], sequence)
+    if "software_sweepers" in obj_dictionary:
+        dict_dictionary["software_sweepers"] = [
+            encode_sweeper(sweep, binary)
+            for sweep in obj_dictionary["software_sweepers"]
         ]
-        check_valid_swept_seq(obj_dictionary["sweepers"], obj_dictionary["sequence"])
 
     return dict_dictionary
 
@@ -92,7 +184,242 @@ def check_valid_swept_seq(sweepers: List, sequence: List):
                 raise RuntimeError("In sweepers, DAC must be uniquely used.")
 
 
-def execute(obj_dictionary: dict, host: str, port: int) -> Tuple[list, list]:
-    """Convert a dictionary of objects and run experiment."""
+def execute(
+    obj_dictionary: dict,
+    host: str,
+    port: Optional[int],
+    compression: Optional[int] = None,
+) -> Tuple[list, list]:
+    """Convert a dictionary of objects and run experiment.
+
+    If compression is given, large messages are compressed with zlib at that level.
+    """
+    server_commands = convert_commands(obj_dictionary)
+    return connect(server_commands, host, port, compression)
+
+
+def validate(obj_dictionary: dict, host: str, port: Optional[int]) -> dict:
+    """Estimate on the server the resources needed by an experiment.
+
+    The experiment is not compiled nor executed, the returned dictionary is the
+    serialized form of a :class:`qibosoq.estimator.ProgramEstimate`.
+    """
+    server_commands = convert_commands(obj_dictionary)
+    server_commands["raw"] = (
+        obj_dictionary["operation_code"] is OperationCode.EXECUTE_PULSE_SEQUENCE_RAW
+    )
+    server_commands["operation_code"] = OperationCode.VALIDATE
+    return send_commands(server_commands, host, port)
+
+
+def compile_program(obj_dictionary: dict, host: str, port: Optional[int]) -> dict:
+    """Compile on the server the program of an experiment, without executing it.
+
+    The server can also be a compile-only one, running without a board.
+    The returned dictionary contains the program dumped by
+    `QickProgram.dump_prog` in "program", its assembly and the timeline.
+    """
+    server_commands = convert_commands(obj_dictionary)
+    server_commands["raw"] = (
+        obj_dictionary["operation_code"] is OperationCode.EXECUTE_PULSE_SEQUENCE_RAW
+    )
+    server_commands["operation_code"] = OperationCode.COMPILE
+    return send_commands(server_commands, host, port)
+
+
+def submit_job(obj_dictionary: dict, host: str, port: Optional[int]) -> str:
+    """Submit an experiment as a job of the server and return the job ID.
+
+    The server replies at once, the results are then fetched with
+    :func:`fetch_results` (also more than once, until they expire).
+    """
+    server_commands = {
+        "operation_code": OperationCode.SUBMIT_JOB,
+        "command": convert_commands(obj_dictionary),
+    }
+    return send_commands(server_commands, host, port)["job_id"]
+
+
+def job_status(job_id: str, host: str, port: Optional[int]) -> dict:
+    """Return the status of a job, its ETA and the number of jobs queued before it."""
+    server_commands = {"operation_code": OperationCode.JOB_STATUS, "job_id": job_id}
+    return send_commands(server_commands, host, port)
+
+
+def fetch_results(job_id: str, host: str, port: Optional[int]) -> Tuple[list, list]:
+    """Return the (i, q) results of a finished job, raising its errors."""
+    server_commands = {"operation_code": OperationCode.FETCH_RESULTS, "job_id": job_id}
+    results = send_commands(server_commands, host, port)
+    return results["i"], results["q"]
+
+
+def cancel_job(job_id: str, host: str, port: Optional[int]) -> dict:
+    """Cancel a job, and return its status.
+
+    Queued jobs are never executed, while running ones only stop between the
+    points of their software sweepers.
+    """
+    server_commands = {"operation_code": OperationCode.CANCEL_JOB, "job_id": job_id}
+    return send_commands(server_commands, host, port)
+
+
+board_configs: Dict[Tuple[str, Optional[int]], dict] = {}
+"""Configurations of the boards, fetched once for each server."""
+_soccfgs: Dict[str, Any] = {}
+"""QickConfig of the boards, by fingerprint, reused to compile programs."""
+
+
+def get_config(host: str, port: Optional[int]) -> dict:
+    """Return the configuration of the board of a server, fetched only once.
+
+    The dictionary contains the QickConfig of the board ("soccfg"), if the
+    readout is "multiplexed" and the "fingerprint" of the firmware.
+    """
+    if (host, port) not in board_configs:
+        server_commands = {"operation_code": OperationCode.GET_CONFIG}
+        board_configs[(host, port)] = send_commands(server_commands, host, port)
+    return board_configs[(host, port)]
+
+
+def ping(host: str, port: Optional[int]) -> dict:
+    """Check that the server is alive, returning its uptime (seconds)."""
+    return send_commands({"operation_code": OperationCode.PING}, host, port)
+
+
+def get_status(host: str, port: Optional[int]) -> dict:
+    """Return the job running on the board, its ETA and the queued ones.
+
+    The server answers also while acquiring.
+    """
+    return send_commands({"operation_code": OperationCode.STATUS}, host, port)
+
+
+def get_stats(host: str, port: Optional[int]) -> dict:
+    """Return the number of commands served by the server, and its traffic."""
+    return send_commands({"operation_code": OperationCode.STATS}, host, port)
+
+
+def compile_locally(obj_dictionary: dict, host: str, port: Optional[int]) -> dict:
+    """Compile the program of an experiment in this process, for a server board.
+
+    The program is built as the server would, from the cached configuration
+    of the board and for its readout mode, and the result is the same of
+    `compile_program`. It requires qick to be installed.
+    """
+    # pylint: disable=import-outside-toplevel
+    from qick import QickConfig
+    from qick.helpers import NpEncoder
+
+    from qibosoq.compiler import compile_command
+
+    config = get_config(host, port)
+    if config["fingerprint"] not in _soccfgs:
+        _soccfgs[config["fingerprint"]] = QickConfig(config["soccfg"])
+    server_commands = convert_commands(obj_dictionary)
+    server_commands["raw"] = (
+        obj_dictionary["operation_code"] is OperationCode.EXECUTE_PULSE_SEQUENCE_RAW
+    )
+    server_commands["operation_code"] = OperationCode.COMPILE
+    compiled = compile_command(
+        server_commands, _soccfgs[config["fingerprint"]], config["multiplexed"]
+    )
+    compiled["fingerprint"] = config["fingerprint"]
+    # same encoding of the programs compiled by the server
+    return json.loads(json.dumps(compiled, cls=NpEncoder))
+
+
+def execute_compiled(
+    obj_dictionary: dict, compiled: dict, host: str, port: Optional[int]
+) -> Tuple[list, list]:
+    """Execute an experiment with its program, compiled by `compile_locally`.
+
+    The server only loads the program and acquires, after checking that it
+    was compiled for its firmware.
+    """
     server_commands = convert_commands(obj_dictionary)
+    server_commands["operation_code"] = OperationCode.EXECUTE_COMPILED
+    server_commands["compiled"] = compiled
     return connect(server_commands, host, port)
+
+
+def check_experiment(obj_dictionary: dict, soccfg: dict, is_mux: bool):
+    """Check an experiment with the rules of the server, for a board configuration.
+
+    As on the server, the programs of the points of software sweepers are
+    checked at the extremes of the swept values.
+    """
+    opcode = obj_dictionary["operation_code"]
+    raw = opcode is OperationCode.EXECUTE_PULSE_SEQUENCE_RAW
+    qpcfg = obj_dictionary["cfg"]
+    qubits = obj_dictionary["qubits"]
+    sweepers = obj_dictionary.get("sweepers", [])
+    software = obj_dictionary.get("software_sweepers", [])
+    interleaved = obj_dictionary.get("interleaved", [])
+    parts = obj_dictionary.get("sequences", interleaved)
+    if len(parts) > 0:
+        sequence = [elem for seq in parts for elem in seq]
+    else:
+        sequence = obj_dictionary["sequence"]
+    check_valid_swept_seq(sweepers, sequence)
+    if opcode is not OperationCode.EXECUTE_SWEEPS:
+        sweepers = []
+
+    if "sequences" in obj_dictionary:
+        if raw:
+            raise NotImplementedError(
+                "Raw acquisitions of merged sequences are not supported."
+            )
+        qpcfg = replace(qpcfg, sync_readouts=False)
+        sequence, origins = merge_sequences(
+            soccfg, qpcfg, obj_dictionary["sequences"], qubits, is_mux
+        )
+        sweepers = merged_sweepers(sweepers, origins)
+        software = merged_sweepers(software, origins)
+    if raw:
+        qpcfg = replace(qpcfg, soft_avgs=qpcfg.reps, reps=1)
+
+    validate_command(
+        soccfg,
+        qpcfg,
+        sequence,
+        qubits,
+        sweepers,
+        raw=raw,
+        is_mux=is_mux,
+        interleaved=interleaved,
+        software=software,
+    )
+
+
+def preflight(
+    obj_dictionaries: List[dict], host: str, port: Optional[int]
+) -> List[Optional[Exception]]:
+    """Check a batch of experiments before sending them to a server.
+
+    The rules of the server are applied locally, with the configuration of
+    the board fetched only once, so invalid experiments are rejected without
+    any round trip. The values of all the sequences are converted together.
+
+    Returns:
+        (list): for each experiment, the error the server would raise, or None
+    """
+    config = get_config(host, port)
+    soccfg = config["soccfg"]
+    convert_batch(
+        soccfg,
+        [
+            seq
+            for obj in obj_dictionaries
+            for seq in obj.get("sequences", obj.get("interleaved", []))
+            + ([obj["sequence"]] if "sequence" in obj else [])
+        ],
+    )
+    errors: List[Optional[Exception]] = []
+    for obj_dictionary in obj_dictionaries:
+        try:
+            check_experiment(obj_dictionary, soccfg, config["multiplexed"])
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(exc)
+        else:
+            errors.append(None)
+    return errors
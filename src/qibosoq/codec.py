@@ -0,0 +1,277 @@
+"""Encoding of the commands objects, in the form sent to the server.
+
+The fields of every class are read once from its dataclass schema, so objects
+are encoded reading their attributes directly, without the recursive copies
+of `dataclasses.asdict`. Arrays of values (arbitrary waveforms and sweeper
+values) can be sent as raw little-endian float64 buffers, encoded in base64,
+instead of lists of numbers.
+"""
+
+import base64
+from dataclasses import fields
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple, Type, Union
+
+import numpy as np
+
+from qibosoq.components.base import ActiveReset, Config, Parameter, Qubit, Sweeper
+from qibosoq.components.pulses import Arbitrary, Element, Measurement, Shape
+
+ARRAY_KEY = "__ndarray__"
+"""Key of the base64 buffer of an encoded array."""
+ARRAY_DTYPE = "<f8"
+"""Type of the values of encoded arrays."""
+ARRAY_FIELDS = ("i_values", "q_values")
+"""Fields of the elements containing arrays of values."""
+
+SHAPES: Dict[str, Type[Element]] = {shape.name.lower(): shape.value for shape in Shape}
+"""Element classes by the name of their shape."""
+
+Array = Union[list, dict]
+"""Array of values, as a list or as an encoded buffer."""
+
+
+_schemas: Dict[type, Tuple[str, ...]] = {}
+
+
+def schema(cls: type) -> Tuple[str, ...]:
+    """Return the names of the fields of a dataclass, read only once."""
+    try:
+        return _schemas[cls]
+    except KeyError:
+        names = _schemas[cls] = tuple(field.name for field in fields(cls))
+        return names
+
+
+def encode_array(values, binary: bool = False, dtype: str = ARRAY_DTYPE) -> Array:
+    """Encode an array of values, as a list or as a raw buffer if binary."""
+    if binary:
+        array = np.ascontiguousarray(values, dtype=dtype)
+        encoded = {
+            ARRAY_KEY: base64.b64encode(array.data).decode("ascii"),
+            "shape": list(array.shape),
+        }
+        if dtype != ARRAY_DTYPE:
+            encoded["dtype"] = dtype
+        return encoded
+    if isinstance(values, np.ndarray):
+        return values.tolist()
+    return list(values)
+
+
+def decode_array(value: Array) -> np.ndarray:
+    """Decode an array of values encoded by :func:`encode_array`."""
+    if isinstance(value, dict):
+        buffer = base64.b64decode(value[ARRAY_KEY])
+        dtype = value.get("dtype", ARRAY_DTYPE)
+        array = np.frombuffer(buffer, dtype=dtype).reshape(value["shape"])
+        return array.copy()  # arrays on the received buffer are read-only
+    return np.array(value, dtype=np.float64)
+
+
+def encode_element(element: Element, binary: bool = False) -> dict:
+    """Encode an element (pulse or measurement) in dictionary form."""
+    encoded = {name: getattr(element, name) for name in schema(type(element))}
+    for name in ARRAY_FIELDS:
+        if name in encoded:
+            encoded[name] = encode_array(encoded[name], binary)
+    return encoded
+
+
+def decode_element(encoded: dict) -> Element:
+    """Decode an element encoded by :func:`encode_element`.
+
+    Shape names are case insensitive, as the names of the parameters.
+    """
+    if "amplitude" not in encoded:  # if element is a measurement
+        return Measurement(**encoded)
+    shape = encoded["shape"].lower()
+    if shape != encoded["shape"]:
+        encoded = {**encoded, "shape": shape}
+    cls = SHAPES[shape]
+    if cls is Arbitrary and isinstance(encoded["i_values"], dict):
+        # elements store waveforms as lists
+        buffers = {name: decode_array(encoded[name]).tolist() for name in ARRAY_FIELDS}
+        encoded = {**encoded, **buffers}
+    return cls(**encoded)
+
+
+def encode_qubit(qubit: Qubit, binary: bool = False) -> dict:
+    """Encode a qubit, and its active reset, in dictionary form."""
+    reset: Optional[dict] = None
+    if qubit.reset is not None:
+        reset = {name: getattr(qubit.reset, name) for name in schema(ActiveReset)}
+        reset["readout"] = encode_element(qubit.reset.readout, binary)
+        reset["pi_pulse"] = encode_element(qubit.reset.pi_pulse, binary)
+    return {"bias": qubit.bias, "dac": qubit.dac, "reset": reset}
+
+
+def decode_qubit(encoded: dict) -> Qubit:
+    """Decode a qubit encoded by :func:`encode_qubit`."""
+    reset = encoded.get("reset")
+    if reset is None:
+        return Qubit(**encoded)
+    readout, pi_pulse = decode_sequence([reset["readout"], reset["pi_pulse"]])
+    reset = ActiveReset(**{**reset, "readout": readout, "pi_pulse": pi_pulse})
+    return Qubit(**{**encoded, "reset": reset})
+
+
+def encode_config(config: Config) -> dict:
+    """Encode a configuration in dictionary form."""
+    return {name: getattr(config, name) for name in schema(Config)}
+
+
+def encode_sweeper(sweeper: Sweeper, binary: bool = False) -> dict:
+    """Encode a sweeper in dictionary form, as `Sweeper.serialized` does."""
+    encoded = {
+        "expts": sweeper.expts,
+        "parameters": sweeper.parameters,
+        "indexes": sweeper.indexes,
+        "starts": encode_array(sweeper.starts, binary),
+        "stops": encode_array(sweeper.stops, binary),
+    }
+    if sweeper.values is not None:
+        encoded["values"] = encode_array(sweeper.values, binary)
+    return encoded
+
+
+def decode_sweeper(encoded: dict) -> Sweeper:
+    """Decode a sweeper encoded by :func:`encode_sweeper`."""
+    values = encoded.get("values")
+    return Sweeper(
+        expts=encoded["expts"],
+        parameters=[Parameter(par) for par in encoded["parameters"]],
+        starts=decode_array(encoded["starts"]),
+        stops=decode_array(encoded["stops"]),
+        indexes=encoded["indexes"],
+        values=decode_array(values) if values is not None else None,
+    )
+
+
+def encode_sequence(sequence: List[Element], binary: bool = False) -> List[dict]:
+    """Encode all the elements of a sequence."""
+    return [encode_element(element, binary) for element in sequence]
+
+
+def decode_sequence(encoded: Union[List[dict], dict]) -> List[Element]:
+    """Decode all the elements of a sequence, also if encoded by columns."""
+    if isinstance(encoded, dict):
+        return decode_columns(encoded)
+    return [decode_element(element) for element in encoded]
+
+
+def codes_dtype(categories: int) -> str:
+    """Return the smallest integer type for the codes of the categories."""
+    if categories <= 2**8:
+        return "|u1"
+    if categories <= 2**16:
+        return "<u2"
+    return "<i4"
+
+
+def encode_column(values: list, binary: bool = False) -> dict:
+    """Encode the values of a field of all the elements.
+
+    The values are dictionary-encoded, as a list of "categories" and the
+    "codes" of the values, or the "runs" of equal codes as pairs of code and
+    length, when they are fewer. Columns without repetitions are sent as they
+    are, as raw buffers if binary and made of floats. Missing values are null.
+    """
+    categories = list(dict.fromkeys(values))
+    if len(categories) == len(values):
+        if binary and all(isinstance(value, float) for value in values):
+            return {"values": encode_array(values, binary)}
+        return {"categories": categories}
+    index = {category: idx for idx, category in enumerate(categories)}
+    codes = [index[value] for value in values]
+    dtype = codes_dtype(max(len(categories), len(values)))
+    runs = [
+        item for code, group in groupby(codes) for item in (code, sum(1 for _ in group))
+    ]
+    if len(runs) < len(codes):
+        return {"categories": categories, "runs": encode_array(runs, binary, dtype)}
+    return {"categories": categories, "codes": encode_array(codes, binary, dtype)}
+
+
+def decode_column(encoded: dict) -> list:
+    """Decode a column encoded by :func:`encode_column`."""
+    if "values" in encoded:
+        return decode_array(encoded["values"]).tolist()
+    categories = encoded["categories"]
+    if "runs" in encoded:
+        runs = encoded["runs"]
+        if isinstance(runs, dict):
+            runs = decode_array(runs).tolist()
+        values = []
+        for code, count in zip(runs[::2], runs[1::2]):
+            values += [categories[code]] * count
+        return values
+    if "codes" not in encoded:
+        return categories
+    codes = encoded["codes"]
+    if isinstance(codes, dict):
+        codes = decode_array(codes).tolist()
+    return [categories[code] for code in codes]
+
+
+def encode_columns(sequence: List[Element], binary: bool = False) -> dict:
+    """Encode a sequence by columns, with the values of each field together.
+
+    The fields missing in some elements (e.g. `rel_sigma` of rectangular
+    pulses) are null, arrays of values are encoded element by element.
+    """
+    classes = list(map(type, sequence))
+    names = dict.fromkeys(name for cls in set(classes) for name in schema(cls))
+    columns: Dict[str, Union[list, dict]] = {}
+    for name in names:
+        # some classes have methods named as the fields of others (`i_values`)
+        owners = {cls for cls in set(classes) if name in schema(cls)}
+        values = [
+            getattr(element, name) if cls in owners else None
+            for cls, element in zip(classes, sequence)
+        ]
+        if name in ARRAY_FIELDS:
+            columns[name] = [
+                None if value is None else encode_array(value, binary)
+                for value in values
+            ]
+        else:
+            columns[name] = encode_column(values, binary)
+    return {"length": len(sequence), "columns": columns}
+
+
+def decode_columns(encoded: dict) -> List[Element]:
+    """Decode a sequence encoded by :func:`encode_columns`."""
+    length = encoded["length"]
+    columns: Dict[str, list] = {}
+    for name, column in encoded["columns"].items():
+        if name in ARRAY_FIELDS:
+            columns[name] = [
+                decode_array(value).tolist() if isinstance(value, dict) else value
+                for value in column
+            ]
+        else:
+            if name == "shape":
+                # shape names are case insensitive
+                categories = column["categories"]
+                column = {
+                    **column,
+                    "categories": [
+                        cat if cat is None else cat.lower() for cat in categories
+                    ],
+                }
+            columns[name] = decode_column(column)
+
+    # the fields of each class, in the order of their positional arguments
+    names = list(columns)
+    getters = {
+        shape: itemgetter(*(names.index(name) for name in schema(cls)))
+        for shape, cls in [(None, Measurement), *SHAPES.items()]
+        if all(name in columns for name in schema(cls))
+    }
+    shapes = columns.get("shape", [None] * length)
+    return [
+        (Measurement if shape is None else SHAPES[shape])(*getters[shape](row))
+        for shape, row in zip(shapes, zip(*columns.values()))
+    ]
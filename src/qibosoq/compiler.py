@@ -0,0 +1,295 @@
+"""Build of the qick programs of the commands received by the server.
+
+The programs are built from the configuration of a board, so that clients
+can also compile them locally (see `client.compile_locally`), without
+importing the server. The readout is multiplexed if `is_mux`, by default as
+configured for the server.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from qick import QickConfig
+
+import qibosoq.configuration as cfg
+from qibosoq.codec import decode_qubit, decode_sequence, decode_sweeper, encode_sequence
+from qibosoq.components.base import Config, OperationCode, Parameter, Qubit, Sweeper
+from qibosoq.components.pulses import Element
+from qibosoq.estimator import (
+    ProgramEstimate,
+    Timeline,
+    estimate_resources,
+    merge_sequences,
+)
+from qibosoq.programs.base import BaseProgram
+from qibosoq.programs.pulse_sequence import ExecutePulseSequence, ExecuteSequences
+from qibosoq.programs.sweepers import ExecuteSweeps
+from qibosoq.validation import merged_indexes, validate_command
+
+qick_logger = logging.getLogger(cfg.PROGRAM_LOGGER_NAME)
+qick_logger_lock = threading.Lock()
+"""Lock of the program log, rolled over by the programs built concurrently."""
+
+
+def load_elements(list_sequence: List[Dict]) -> List[Element]:
+    """Convert a list of elements in dict form to a list of Pulse objects."""
+    return decode_sequence(list_sequence)
+
+
+def load_qubits(list_qubits: List[Dict]) -> List[Qubit]:
+    """Convert a list of qubits (in dict form) to a list of Qubit objects."""
+    return [decode_qubit(qubit) for qubit in list_qubits]
+
+
+def load_sweeps(list_sweepers: List[Dict]) -> List[Sweeper]:
+    """Convert a list of sweepers (in dict form) to a list of Sweeper objects."""
+    return [decode_sweeper(sweep) for sweep in list_sweepers]
+
+
+def load_interleaved(data: dict) -> List[List[Element]]:
+    """Load the interleaved sequences of a command, if any."""
+    if "interleaved" not in data:
+        return []
+    opcode = OperationCode(data["operation_code"])
+    supported = (
+        OperationCode.EXECUTE_PULSE_SEQUENCE,
+        OperationCode.VALIDATE,
+        OperationCode.COMPILE,
+        OperationCode.EXECUTE_COMPILED,
+    )
+    if (
+        opcode not in supported
+        or data.get("raw", False)
+        or any(key in data for key in ("sweepers", "software_sweepers", "sequences"))
+    ):
+        raise NotImplementedError(
+            "Interleaved sequences can only be executed as integrated "
+            "acquisitions, without sweepers."
+        )
+    return [load_elements(sequence) for sequence in data["interleaved"]]
+
+
+def estimate(
+    data: dict,
+    qick_soc: QickConfig,
+    raw: bool = False,
+    held: Optional[Mapping[int, int]] = None,
+    is_mux: Optional[bool] = None,
+) -> Tuple[ProgramEstimate, Timeline]:
+    """Estimate the resources and the timeline of a command, without compiling it.
+
+    The biases held by the board before the program are `held`, none by default.
+    """
+    estimated, expected = estimate_resources(
+        qick_soc,
+        Config(**data["cfg"]),
+        load_elements(data["sequence"]),
+        load_qubits(data["qubits"]),
+        load_sweeps(data.get("sweepers", [])),
+        raw=raw,
+        is_mux=is_mux,
+        interleaved=load_interleaved(data),
+        held=held,
+    )
+    # every point of the software sweepers is a whole acquisition
+    for sweeper in load_sweeps(data.get("software_sweepers", [])):
+        expected.rounds *= sweeper.expts
+    return estimated, expected
+
+
+def validate(
+    data: dict,
+    qick_soc: QickConfig,
+    raw: bool = False,
+    held: Optional[Mapping[int, int]] = None,
+    is_mux: Optional[bool] = None,
+) -> Timeline:
+    """Validate the programs of a command once, and estimate their timeline.
+
+    See :func:`qibosoq.validation.validate_command`. The biases held by the
+    board before the program are `held`, none by default.
+    """
+    return validate_command(
+        qick_soc,
+        Config(**data["cfg"]),
+        load_elements(data["sequence"]),
+        load_qubits(data["qubits"]),
+        load_sweeps(data.get("sweepers", [])),
+        raw,
+        is_mux,
+        load_interleaved(data),
+        held,
+        load_sweeps(data.get("software_sweepers", [])),
+    )
+
+
+def log_asm(asm: str):
+    """Log the assembly of the last program executed, in a file of its own."""
+    with qick_logger_lock:
+        # clients compiling programs locally may have no handlers
+        for handler in qick_logger.handlers:
+            handler.doRollover()  # type: ignore
+        qick_logger.info(asm)
+
+
+def build_program(
+    programcls: type,
+    qick_soc: QickConfig,
+    qpcfg: Config,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: List[Sweeper],
+    interleaved: Optional[List[List[Element]]] = None,
+    compiled: Optional[dict] = None,
+    held: Optional[Mapping[int, int]] = None,
+    is_mux: Optional[bool] = None,
+) -> BaseProgram:
+    """Build a qick program, checking that it fits in the tProc memory.
+
+    The command is validated once before building its programs, with
+    `validate`, that rejects the ones that would not fit in the board.
+    Interleaved sequences, if any, are executed in place of `sequence`, that
+    is their concatenation. A program already compiled is loaded instead of
+    being generated, without logging its assembly.
+    The biases held by the board before the program are `held`, none by
+    default: only the programs executed at once depend on `held_biases`,
+    which is updated by the board worker.
+    """
+    held = {} if held is None else held
+    program = programcls(
+        qick_soc,
+        qpcfg,
+        interleaved or sequence,
+        qubits,
+        *sweepers,
+        compiled=compiled,
+        held=held,
+        is_mux=is_mux,
+    )
+
+    if compiled is None:
+        log_asm(program.asm())
+
+    num_instructions = len(program.prog_list)
+    max_mem = qick_soc["tprocs"][0]["pmem_size"]
+    if num_instructions > max_mem:
+        raise MemoryError(
+            f"The tproc has a max memory size of {max_mem}, "
+            f"but the program had {num_instructions} instructions"
+        )
+    return program
+
+
+def merge_commands(
+    data: dict, qick_soc: QickConfig, is_mux: Optional[bool] = None
+) -> Optional[List[List[int]]]:
+    """Merge the sequences of a command, if more than one is given.
+
+    The command is updated in place with the merged sequence, and the indexes
+    of the sweepers, which refer to the concatenation of the sequences, are
+    moved to the merged elements.
+
+    Returns:
+        (list): the ADCs acquired by each sequence, in order of acquisition
+    """
+    if "sequences" not in data:
+        return None
+    if data["operation_code"] == OperationCode.EXECUTE_PULSE_SEQUENCE_RAW or data.get(
+        "raw", False
+    ):
+        raise NotImplementedError(
+            "Raw acquisitions of merged sequences are not supported."
+        )
+
+    sequences = [load_elements(sequence) for sequence in data["sequences"]]
+    qubits = load_qubits(data["qubits"])
+    data["cfg"]["sync_readouts"] = False
+    merged, origins = merge_sequences(
+        qick_soc, Config(**data["cfg"]), sequences, qubits, is_mux
+    )
+    data["sequence"] = encode_sequence(merged)
+
+    for sweeper in data.get("sweepers", []) + data.get("software_sweepers", []):
+        parameters = [Parameter(par) for par in sweeper["parameters"]]
+        sweeper["indexes"] = merged_indexes(parameters, sweeper["indexes"], origins)
+
+    return [
+        list(dict.fromkeys(elem.adc for elem in sequence if elem.type == "readout"))
+        for sequence in sequences
+    ]
+
+
+def config_fingerprint(qick_soc: QickConfig, is_mux: Optional[bool] = None) -> str:
+    """Return a hash identifying the firmware of the board and the readout mode."""
+    if is_mux is None:
+        is_mux = cfg.IS_MULTIPLEXED
+    description = json.dumps([qick_soc.get_cfg(), is_mux], sort_keys=True)
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+def board_config(qick_soc: QickConfig) -> dict:
+    """Return what is needed to compile programs for the board elsewhere."""
+    return {
+        "soccfg": qick_soc.get_cfg(),
+        "multiplexed": cfg.IS_MULTIPLEXED,
+        "fingerprint": config_fingerprint(qick_soc),
+    }
+
+
+def compile_command(
+    data: dict, qick_soc: QickConfig, is_mux: Optional[bool] = None
+) -> dict:
+    """Compile the program of a command, without executing it.
+
+    The command contains the same keys of the command to compile and, like
+    `VALIDATE`, an optional "raw" key for non integrated acquisitions.
+    Since no board is needed, it is served also from a QickConfig.
+
+    Returns:
+        (dict): the program dumped by `BaseProgram.dump_compiled` in "program",
+        its assembly in "asm", the expected timeline in "timeline" and, to
+        execute it with `EXECUTE_COMPILED`, the "operation_code" of the
+        execution and the "fingerprint" of the board
+    """
+    if "software_sweepers" in data:
+        raise NotImplementedError(
+            "Commands with software sweepers execute more programs "
+            "and cannot be compiled."
+        )
+    merge_commands(data, qick_soc, is_mux)
+    raw = data.get("raw", False)
+    if raw:
+        data["cfg"]["soft_avgs"] = data["cfg"]["reps"]
+        data["cfg"]["reps"] = 1
+    expected = validate(data, qick_soc, raw, is_mux=is_mux)
+    interleaved = load_interleaved(data)
+    sweepers = load_sweeps(data.get("sweepers", []))
+    if len(sweepers) > 0:
+        programcls: type = ExecuteSweeps
+        opcode = OperationCode.EXECUTE_SWEEPS
+    else:
+        programcls = ExecuteSequences if interleaved else ExecutePulseSequence
+        opcode = OperationCode.EXECUTE_PULSE_SEQUENCE
+    if raw:
+        opcode = OperationCode.EXECUTE_PULSE_SEQUENCE_RAW
+
+    program = build_program(
+        programcls,
+        qick_soc,
+        Config(**data["cfg"]),
+        load_elements(data["sequence"]),
+        load_qubits(data["qubits"]),
+        sweepers,
+        interleaved,
+        is_mux=is_mux,
+    )
+    return {
+        "program": program.dump_compiled(),
+        "asm": program.asm(),
+        "timeline": expected.serialized,
+        "operation_code": opcode,
+        "fingerprint": config_fingerprint(qick_soc, is_mux),
+    }
@@ -7,6 +7,8 @@ from typing import Iterable, List, Optional, overload
 import numpy as np
 import numpy.typing as npt
 
+from qibosoq.components.pulses import Pulse
+
 
 @dataclass
 class Config:
@@ -22,6 +24,18 @@ class Config:
     """Number of software averages."""
     average: bool = True
     """Returns integrated results if true."""
+    persistent_bias: bool = False
+    """Set the biases once per program, instead of every shot, and hold them.
+
+    Consecutive commands with the same biases do not set them again.
+    """
+    sync_readouts: bool = True
+    """Wait for the end of all the pulses after each readout pulse.
+
+    Disabled for merged sequences, whose elements are timed only by their delays.
+    """
+    interleave_block: int = 1
+    """Number of consecutive shots of each sequence, for interleaved sequences."""
 
 
 class OperationCode(IntEnum):
@@ -30,6 +44,37 @@ class OperationCode(IntEnum):
     EXECUTE_PULSE_SEQUENCE = auto()
     EXECUTE_PULSE_SEQUENCE_RAW = auto()
     EXECUTE_SWEEPS = auto()
+    VALIDATE = auto()
+    COMPILE = auto()
+    GET_CONFIG = auto()
+    EXECUTE_COMPILED = auto()
+    SUBMIT_JOB = auto()
+    JOB_STATUS = auto()
+    FETCH_RESULTS = auto()
+    CANCEL_JOB = auto()
+    PING = auto()
+    STATUS = auto()
+    STATS = auto()
+
+
+@dataclass
+class ActiveReset:
+    """Reset of a qubit at the end of every shot, replacing the relaxation time.
+
+    The qubit is measured and, if found in the excited state, brought back to
+    the ground state with a pi pulse, fired conditionally by the tProc.
+    """
+
+    readout: Pulse
+    """Readout pulse, acquired by an ADC already used in the sequence."""
+    pi_pulse: Pulse
+    """Drive pulse exciting the qubit."""
+    threshold: float
+    """Threshold on the I value separating the states, in the units of the results."""
+    excited_above: bool = True
+    """If true, the excited state is the one with I above the threshold."""
+    settle_time: float = 1.0
+    """Time to wait after the reset, in place of the relaxation time (us)."""
 
 
 @dataclass
@@ -40,6 +85,8 @@ class Qubit:
     """Amplitude factor, for sweetspot."""
     dac: Optional[int] = None
     """DAC responsible for flux control."""
+    reset: Optional[ActiveReset] = None
+    """Active reset of the qubit, if any."""
 
 
 class Parameter(str, Enum):
@@ -51,6 +98,8 @@ class Parameter(str, Enum):
     DELAY = "t"
     BIAS = "bias"
     DURATION = "duration"
+    REL_SIGMA = "rel_sigma"
+    BETA = "beta"
 
     @overload
     @classmethod
@@ -84,18 +133,54 @@ class Sweeper:
     """Start value for each parameter to sweep."""
     stops: npt.NDArray[np.float64]
     """Stop value for each parameter to sweep."""
+    values: Optional[npt.NDArray[np.float64]] = None
+    """Explicit values for each parameter to sweep (one row per parameter).
+
+    If given, the points are swept in this order instead of the linear ranges.
+    """
 
     def __post_init__(self):
-        """Convert starts and stops in np.arrays if needed."""
+        """Convert starts, stops and values in np.arrays if needed."""
         if isinstance(self.starts, list):
             self.starts = np.array(self.starts, dtype=np.float64)
         if isinstance(self.stops, list):
             self.stops = np.array(self.stops, dtype=np.float64)
+        if self.values is not None:
+            self.values = np.array(self.values, dtype=np.float64)
+            if self.values.shape != (len(self.parameters), self.expts):
+                raise ValueError(
+                    f"Sweeper values must have shape {(len(self.parameters), self.expts)}, "
+                    f"got {self.values.shape}."
+                )
 
         for idx, par in enumerate(self.parameters):
             if par == Parameter.AMPLITUDE:
                 if self.stops[idx] > 1:
                     raise ValueError("Amplitude sweep cannot exceed 1.")
+                if self.values is not None and np.any(self.values[idx] > 1):
+                    raise ValueError("Amplitude sweep cannot exceed 1.")
+
+    @classmethod
+    def from_values(
+        cls, parameters: List[Parameter], indexes: List[int], values
+    ) -> "Sweeper":
+        """Create a sweeper over explicit values (one list per parameter)."""
+        values = np.array(values, dtype=np.float64)
+        return cls(
+            expts=values.shape[1],
+            parameters=parameters,
+            indexes=indexes,
+            starts=values[:, 0],
+            stops=values[:, -1],
+            values=values,
+        )
+
+    @property
+    def points(self) -> npt.NDArray[np.float64]:
+        """Return the swept values of each parameter (one row per parameter)."""
+        if self.values is not None:
+            return self.values
+        return np.linspace(self.starts, self.stops, self.expts, axis=1)
 
     @property
     def serialized(self) -> dict:
@@ -103,10 +188,13 @@ class Sweeper:
 
         In particular, takes care of the convertion arrays -> lists.
         """
-        return {
+        serialized = {
             "expts": self.expts,
             "parameters": self.parameters,
             "indexes": self.indexes,
             "starts": self.starts.tolist(),
             "stops": self.stops.tolist(),
         }
+        if self.values is not None:
+            serialized["values"] = self.values.tolist()
+        return serialized
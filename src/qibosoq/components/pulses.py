@@ -181,3 +181,37 @@ class Shape(Enum):
     FLUXEXPONENTIAL = FluxExponential
     FLATTOP = FlatTop
     ARBITRARY = Arbitrary
+
+
+def group_mux_ro(sequence: List[Element]) -> List[List[Element]]:
+    """Create a list containing readout elements grouped by start time.
+
+    Example of list:
+    [[pulse1, pulse2], [pulse3]]
+
+    Readout pulses are considered to be correctly organized.
+    """
+    mux_list: List[List[Element]] = []
+    group: List[Element] = []
+
+    for pulse in sequence:
+        readout = pulse.type == "readout"
+        if (not readout) or pulse.start_delay != 0:
+            if len(group) > 0:
+                mux_list.append(group)
+                group = []
+
+        if readout:
+            group.append(pulse)
+
+    if len(group) > 0:
+        mux_list.append(group)
+
+    # check that all the readout pulses share the same duration
+    for group in mux_list:
+        durations = {pulse.duration for pulse in group}
+        if len(durations) > 1:
+            raise RuntimeError(
+                f"Muxed readout pulses must share same duration.: {mux_list}"
+            )
+    return mux_list
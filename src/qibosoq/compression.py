@@ -0,0 +1,80 @@
+"""Compression of the messages exchanged by clients and server.
+
+Clients negotiate the compression setting the most significant bit of the
+4 bytes length of the command: two more bytes then follow, with the codec of
+the command and the zlib level accepted for the reply (0 for none).
+The reply of a negotiated command is preceded by its 4 bytes length, and
+starts with one byte, the codec of the rest.
+Messages are compressed only above `configuration.COMPRESSION_THRESHOLD` bytes,
+and commands without the bit set are exchanged uncompressed, as before.
+Decompressed messages are limited to `configuration.MAX_MESSAGE_SIZE` bytes.
+"""
+
+import zlib
+from enum import IntEnum
+from typing import Optional, Tuple, Union
+
+import qibosoq.configuration as cfg
+
+NEGOTIATE = 1 << 31
+"""Bit of the length of the commands negotiating the compression."""
+OPTIONS_SIZE = 2
+"""Bytes of the options following the length of the negotiated commands."""
+
+
+class Codec(IntEnum):
+    """Available codecs of the messages."""
+
+    NONE = 0
+    ZLIB = 1
+
+
+def compress(message: bytes, level: int) -> Tuple[Codec, bytes]:
+    """Compress a message with zlib, if larger than the threshold."""
+    if level == 0 or len(message) < cfg.COMPRESSION_THRESHOLD:
+        return Codec.NONE, message
+    return Codec.ZLIB, zlib.compress(message, level)
+
+
+def decompress(
+    codec: int, message: Union[bytes, bytearray, memoryview]
+) -> Union[bytes, bytearray, memoryview]:
+    """Decompress a message encoded with codec.
+
+    Messages decompressing to more than `configuration.MAX_MESSAGE_SIZE`
+    bytes are rejected, without decompressing them entirely.
+    """
+    if Codec(codec) is Codec.ZLIB:
+        decompressor = zlib.decompressobj()
+        decompressed = decompressor.decompress(message, cfg.MAX_MESSAGE_SIZE)
+        if decompressor.unconsumed_tail:
+            raise ValueError(
+                f"Decompressed message larger than {cfg.MAX_MESSAGE_SIZE} bytes"
+            )
+        if not decompressor.eof:
+            raise zlib.error("Incomplete compressed message")
+        return decompressed
+    return message
+
+
+def encode_header(length: int, codec: Codec, level: Optional[int]) -> bytes:
+    """Encode the header of a command of length bytes.
+
+    If level is None the compression is not negotiated.
+    """
+    if level is None:
+        return length.to_bytes(4, "big")
+    if not 0 <= level <= 9:
+        raise ValueError(f"The zlib compression level must be in [0, 9], got {level}")
+    return (NEGOTIATE | length).to_bytes(4, "big") + bytes([codec, level])
+
+
+def decode_length(header: Union[bytes, bytearray]) -> Tuple[int, bool]:
+    """Decode the length of a command, and if it negotiates the compression."""
+    value = int.from_bytes(header, "big")
+    return value & ~NEGOTIATE, bool(value & NEGOTIATE)
+
+
+def encode_reply(codec: Codec, message: bytes) -> bytes:
+    """Encode the reply to a negotiated command, preceded by its length."""
+    return (len(message) + 1).to_bytes(4, "big") + bytes([codec]) + message
@@ -36,3 +36,30 @@ EXT_CLK = from_env("EXT_CLK", "False") in ("True", "true", "1")
 
 IS_MULTIPLEXED = from_env("IS_MULTIPLEXED", "True") in ("True", "true", "1")
 """Whether the readout is multiplexed or not."""
+
+SOCCFG_LOCATION = from_env("SOCCFG")
+"""Path of a QickConfig JSON to load in place of the board.
+
+If set, the server only compiles and validates commands, without executing them.
+"""
+
+COMPRESSION_THRESHOLD = int(from_env("COMPRESSION_THRESHOLD", 2**16))
+"""Minimum size (bytes) of the compressed messages, if compression is negotiated."""
+
+MAX_MESSAGE_SIZE = int(from_env("MAX_MESSAGE_SIZE", 2**30))
+"""Maximum size (bytes) of the received and decompressed messages, larger ones are rejected."""
+
+SOCKET_BUFFER_SIZE = int(from_env("SOCKET_BUFFER_SIZE", 2**22))
+"""Size (bytes) of the send and receive buffers of the sockets."""
+
+UNIX_SOCKET = from_env("UNIX_SOCKET")
+"""Path of a Unix domain socket where the server also listens, if set."""
+
+SHARED_MEMORY_THRESHOLD = int(from_env("SHARED_MEMORY_THRESHOLD", 2**16))
+"""Minimum size (bytes) of the results shared with clients on the Unix socket."""
+
+JOB_RESULTS_TTL = float(from_env("JOB_RESULTS_TTL", 3600))
+"""Time (seconds) the results of the jobs are kept after their end."""
+
+JOB_RESULTS_MEMORY = int(from_env("JOB_RESULTS_MEMORY", 2**28))
+"""Maximum size (bytes) of the results of the jobs kept by the server."""
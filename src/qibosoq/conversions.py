@@ -0,0 +1,181 @@
+"""Unit conversions of a board, with per-channel constants precomputed.
+
+The conversions reproduce `QickConfig.us2cycles`, `QickConfig.freq2reg` and
+`QickConfig.deg2reg`, but the channel constants are computed only once per
+board, whole arrays are converted in a single vectorized call and repeated
+scalar values are memoized. Converters can be used by more threads at once.
+This module does not depend on qick, so it can be used also without a board.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+Value = Union[float, Sequence[float], np.ndarray]
+"""Scalar or array of values to convert."""
+
+MAX_CACHED_BOARDS = 8
+"""Maximum number of boards for which a converter is kept in memory."""
+MAX_CACHED_VALUES = 2**16
+"""Maximum number of converted values memoized by a converter.
+
+The least recently used values are evicted first.
+"""
+
+
+class Converter:
+    """Convert times, frequencies and phases in register values for a board."""
+
+    def __init__(self, soccfg: Mapping):
+        """Precompute the conversion constants of all the channels."""
+        self.soccfg = soccfg
+        self.refclk = soccfg["refclk_freq"]
+        self.f_time = soccfg["tprocs"][0]["f_time"]
+        self.gen_fclk = [gen["f_fabric"] for gen in soccfg["gens"]]
+        self.ro_fclk = [ro["f_output"] for ro in soccfg["readouts"]]
+        self.freq_scales = [1 / self.fstep(gen) for gen in soccfg["gens"]]
+        self.phase_scales = [
+            2 ** gen["b_phase"] / 360 if "b_phase" in gen else None
+            for gen in soccfg["gens"]
+        ]
+        self.quantizations: Dict[Tuple[int, int], int] = {}
+        self.cache: "OrderedDict[Hashable, int]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def fstep(self, channel: Mapping) -> float:
+        """Return the frequency step of a channel (MHz)."""
+        return (
+            channel["fs_mult"]
+            * (self.refclk / channel["fdds_div"])
+            / 2 ** channel["b_dds"]
+        )
+
+    def quantization(self, gen_ch: int, ro_ch: Optional[int]) -> int:
+        """Return the frequency step multiplier to match a generator and a readout."""
+        if ro_ch is None:
+            return 1
+        if (gen_ch, ro_ch) not in self.quantizations:
+            channels = [self.soccfg["gens"][gen_ch], self.soccfg["readouts"][ro_ch]]
+            max_div = np.lcm.reduce([ch["fdds_div"] for ch in channels])
+            b_max = max(ch["b_dds"] for ch in channels)
+            mults = [
+                ch["fs_mult"] * (max_div // ch["fdds_div"]) * 2 ** (b_max - ch["b_dds"])
+                for ch in channels
+            ]
+            self.quantizations[(gen_ch, ro_ch)] = int(np.lcm.reduce(mults) // mults[0])
+        return self.quantizations[(gen_ch, ro_ch)]
+
+    def convert(self, key: Hashable, value: Value, scalar_fn, array_fn):
+        """Memoize the conversion of scalars, convert arrays with a single call.
+
+        The values of the converted arrays are memoized as well, so that
+        precomputing a whole sequence makes the following scalar calls lookups.
+        """
+        if np.ndim(value) == 0:
+            with self.lock:
+                if (key, value) in self.cache:
+                    self.cache.move_to_end((key, value))
+                    return self.cache[(key, value)]
+            result = scalar_fn(value)
+            with self.lock:
+                self.cache[(key, value)] = result
+                self.evict()
+            return result
+        values = np.asarray(value, dtype=float)
+        results = array_fn(values)
+        with self.lock:
+            for val, res in zip(values.tolist(), results.tolist()):
+                self.cache[(key, val)] = int(res)
+                self.cache.move_to_end((key, val))
+            self.evict()
+        return results
+
+    def evict(self):
+        """Drop the least recently used values exceeding `MAX_CACHED_VALUES`.
+
+        To be called holding the lock.
+        """
+        while len(self.cache) > MAX_CACHED_VALUES:
+            self.cache.popitem(last=False)
+
+    def us2cycles(
+        self, us: Value, gen_ch: Optional[int] = None, ro_ch: Optional[int] = None
+    ):
+        """Convert microseconds to clock cycles, as `QickConfig.us2cycles` does."""
+        if gen_ch is not None and ro_ch is not None:
+            raise RuntimeError("can't specify both gen_ch and ro_ch!")
+        if gen_ch is not None:
+            fclk = self.gen_fclk[gen_ch]
+        elif ro_ch is not None:
+            fclk = self.ro_fclk[ro_ch]
+        else:
+            fclk = self.f_time
+        return self.convert(
+            ("us", fclk),
+            us,
+            lambda val: int(np.round(val * fclk)),
+            lambda vals: np.round(vals * fclk).astype(np.int64),
+        )
+
+    def freq2reg(self, freq: Value, gen_ch: int = 0, ro_ch: Optional[int] = None):
+        """Convert MHz to generator register values, as `QickConfig.freq2reg` does."""
+        gen = self.soccfg["gens"][gen_ch]
+        scale = self.freq_scales[gen_ch]
+        quantize = self.quantization(gen_ch, ro_ch)
+        modulo = 2 ** gen["b_dds"]
+
+        def check(vals):
+            if gen["interpolation"] != 1 and np.any(np.abs(vals) > gen["f_dds"] / 2):
+                raise RuntimeError(
+                    f"requested frequency {vals} is outside of [-range/2, range/2]"
+                )
+
+        def scalar_fn(val):
+            check(val)
+            return int(quantize * np.round(val * scale / quantize)) % modulo
+
+        def array_fn(vals):
+            check(vals)
+            regs = quantize * np.round(vals * scale / quantize).astype(np.int64)
+            return regs % modulo
+
+        return self.convert(("freq", gen_ch, ro_ch), freq, scalar_fn, array_fn)
+
+    def deg2reg(self, deg: Value, gen_ch: int = 0):
+        """Convert degrees to phase register values, as `QickConfig.deg2reg` does."""
+        scale = self.phase_scales[gen_ch]
+        modulo = 2 ** self.soccfg["gens"][gen_ch]["b_phase"]
+        return self.convert(
+            ("deg", gen_ch),
+            deg,
+            lambda val: int(np.round(val * scale)) % modulo,
+            lambda vals: np.round(vals * scale).astype(np.int64) % modulo,
+        )
+
+
+_converters: List[Tuple[Mapping, Converter]] = []
+_converters_lock = threading.Lock()
+
+
+def converter(soccfg: Mapping) -> Converter:
+    """Return the converter of a board, creating it the first time it is needed."""
+    with _converters_lock:
+        for cached_soccfg, cached_converter in _converters:
+            if cached_soccfg is soccfg:
+                return cached_converter
+        new_converter = Converter(soccfg)
+        _converters.insert(0, (soccfg, new_converter))
+        del _converters[MAX_CACHED_BOARDS:]
+        return new_converter
+
+
+def swept_cycles(start: int, stop: int, expts: int) -> np.ndarray:
+    """Return the clock cycles of a sweep, equally spaced with an integer step.
+
+    Registers are swept adding a constant integer, so the step between start
+    and stop is rounded to the closest number of clock cycles.
+    """
+    step = int(np.round((stop - start) / (expts - 1))) if expts > 1 else 0
+    return start + step * np.arange(expts)
@@ -0,0 +1,986 @@
+"""Static estimation of the resources used by qibosoq programs.
+
+The functions in this module mirror the instructions and waveforms that
+:class:`qibosoq.programs.flux.FluxProgram` and its subclasses would generate,
+but they only need the QickConfig (as a dictionary) and never build a program.
+They can therefore run before the compilation, or even on the client side.
+The parts of the programs in :mod:`qibosoq.layout` are shared, not mirrored.
+"""
+
+from dataclasses import asdict, dataclass, field, replace
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+import qibosoq.configuration as qibosoq_cfg
+from qibosoq.components.base import Config, Parameter, Qubit, Sweeper
+from qibosoq.components.pulses import (
+    Arbitrary,
+    Drag,
+    Element,
+    FlatTop,
+    FluxExponential,
+    Gaussian,
+    Hann,
+    Pulse,
+    Rectangular,
+    group_mux_ro,
+)
+from qibosoq.conversions import converter, swept_cycles
+from qibosoq.layout import FluxLayoutMixin
+
+POINTS_ADDRESS = 64
+"""First address of the tProc data memory used for the values of point-list sweeps.
+
+The lower addresses are left to qick, that stores there the shots counter.
+"""
+
+
+@dataclass
+class ProgramEstimate:
+    """Resources needed by a program, estimated without compiling it."""
+
+    instructions: int
+    """Number of tProc instructions."""
+    pmem_size: int
+    """Size of the tProc program memory."""
+    waveform_memory: Dict[int, int] = field(default_factory=dict)
+    """Samples of envelope memory used, for each generator."""
+    waveform_limits: Dict[int, int] = field(default_factory=dict)
+    """Envelope memory available, for each generator."""
+    readout_triggers: Dict[int, int] = field(default_factory=dict)
+    """Number of acquisitions per shot, for each ADC."""
+    readout_buffers: Dict[int, int] = field(default_factory=dict)
+    """Accumulated values streamed out of each ADC for the whole acquisition."""
+    decimated_buffers: Dict[int, int] = field(default_factory=dict)
+    """Decimated samples needed for each ADC, for raw acquisitions."""
+    decimated_limits: Dict[int, int] = field(default_factory=dict)
+    """Decimated buffer available, for each ADC."""
+    data_memory: int = 0
+    """Words of tProc data memory used by the values of point-list sweeps."""
+    dmem_size: int = 0
+    """Size of the tProc data memory."""
+
+    def check(self):
+        """Raise an error if the program does not fit in the board memories."""
+        if self.instructions > self.pmem_size:
+            raise MemoryError(
+                f"The tproc has a max memory size of {self.pmem_size}, "
+                f"but the program had {self.instructions} instructions"
+            )
+        for gen_ch, samples in self.waveform_memory.items():
+            maxlen = self.waveform_limits[gen_ch]
+            if samples > maxlen:
+                raise MemoryError(
+                    f"Generator {gen_ch}: buffer length must be {maxlen} samples "
+                    f"or less, but the program needs {samples} samples"
+                )
+        for adc_ch, samples in self.decimated_buffers.items():
+            maxlen = self.decimated_limits[adc_ch]
+            if samples > maxlen:
+                raise MemoryError(
+                    f"Readout {adc_ch}: decimated buffer has {maxlen} samples, "
+                    f"but the acquisition needs {samples} samples"
+                )
+        if self.data_memory > 0 and POINTS_ADDRESS + self.data_memory > self.dmem_size:
+            raise MemoryError(
+                f"The tproc has a data memory of {self.dmem_size} words, "
+                "not enough for the values of the point-list sweepers"
+            )
+
+    @property
+    def serialized(self) -> dict:
+        """Convert a ProgramEstimate object into a dictionary."""
+        return {
+            "instructions": self.instructions,
+            "pmem_size": self.pmem_size,
+            "waveform_memory": self.waveform_memory,
+            "waveform_limits": self.waveform_limits,
+            "readout_triggers": self.readout_triggers,
+            "readout_buffers": self.readout_buffers,
+            "decimated_buffers": self.decimated_buffers,
+            "decimated_limits": self.decimated_limits,
+            "data_memory": self.data_memory,
+            "dmem_size": self.dmem_size,
+        }
+
+
+@dataclass
+class TimelineEvent:
+    """Pulse or acquisition window in the timeline of a shot."""
+
+    start: float
+    """Start time, from the beginning of the shot (us)."""
+    duration: float
+    """Duration (us)."""
+    channel: str
+    """Channel used, in the form 'gen N' or 'adc N'."""
+    kind: str
+    """Can be 'drive', 'readout', 'flux', 'bias' or 'acquisition'."""
+    name: Optional[str] = None
+    """Name of the pulse, if any."""
+
+
+@dataclass
+class Timeline:
+    """Timeline of a single shot and estimation of the hardware runtime."""
+
+    events: List[TimelineEvent]
+    """Pulses and acquisitions of a single shot."""
+    shot_duration: float
+    """Time between the beginning of two consecutive shots (us)."""
+    initialization: float
+    """Time spent once per round, before the first shot (us)."""
+    relaxation_time: float
+    """Relaxation time at the end of each shot (us)."""
+    shots: int
+    """Shots in a round (repetitions times sweeper points)."""
+    rounds: int = 1
+    """Number of rounds (software averages)."""
+
+    @property
+    def sequence_duration(self) -> float:
+        """Time between the start of the first and the end of the last pulse (us)."""
+        events = [event for event in self.events if event.kind != "bias"]
+        if len(events) == 0:
+            return 0.0
+        start = min(event.start for event in events)
+        return max(event.start + event.duration for event in events) - start
+
+    @property
+    def overhead(self) -> float:
+        """Dead time added per shot by the generated code (us)."""
+        return self.shot_duration - self.sequence_duration - self.relaxation_time
+
+    @property
+    def eta(self) -> float:
+        """Estimated hardware time for the whole acquisition (s)."""
+        round_time = self.initialization + self.shot_duration * self.shots
+        return round_time * self.rounds * 1e-6
+
+    @property
+    def serialized(self) -> dict:
+        """Convert a Timeline object into a dictionary."""
+        return {
+            "events": [asdict(event) for event in self.events],
+            "shot_duration": self.shot_duration,
+            "sequence_duration": self.sequence_duration,
+            "overhead": self.overhead,
+            "eta": self.eta,
+        }
+
+
+def us2cycles(soccfg: Mapping, us: float, gen_ch=None, ro_ch=None) -> int:
+    """Convert a time in clock cycles, as `QickConfig.us2cycles` does."""
+    return converter(soccfg).us2cycles(us, gen_ch=gen_ch, ro_ch=ro_ch)
+
+
+def regwi_cost(value: int) -> int:
+    """Return the number of instructions used by `safe_regwi` to write value."""
+    if abs(value) < 2**30:
+        return 1
+    return 2 if value % 4 == 0 else 3
+
+
+def _is_mux_gen(soccfg: Mapping, gen_ch: int) -> bool:
+    return "n_tones" in soccfg["gens"][gen_ch]
+
+
+def _samples_per_clk(soccfg: Mapping, gen_ch: int) -> int:
+    return soccfg["gens"][gen_ch].get("samps_per_clk", 16)
+
+
+def registers_cost(soccfg: Mapping, pulse: Pulse) -> int:
+    """Return the number of instructions used by `add_pulse_to_register`."""
+    if _is_mux_gen(soccfg, pulse.dac):
+        return 2
+    conv = converter(soccfg)
+    cost = regwi_cost(conv.freq2reg(pulse.frequency, gen_ch=pulse.dac, ro_ch=pulse.adc))
+    cost += regwi_cost(conv.deg2reg(pulse.relative_phase, gen_ch=pulse.dac))
+    cost += 2  # gain and mode
+    if pulse.waveform_name is not None:
+        cost += 1  # waveform address
+    if pulse.style == "flat_top":
+        cost += 4  # ramp-down address, flat gain and two more modes
+    return cost
+
+
+def fire_cost(style: Optional[str]) -> int:
+    """Return the number of instructions used by `pulse` for a given style."""
+    segments = 3 if style == "flat_top" else 1
+    return 1 + segments
+
+
+def trigger_cost(soccfg: Mapping, adcs: Sequence[int]) -> int:
+    """Return the number of instructions used by `trigger`."""
+    ports = {soccfg["readouts"][adc]["trigger_port"] for adc in adcs}
+    return 3 * len(ports)
+
+
+def envelope_length(soccfg: Mapping, pulse: Pulse) -> int:
+    """Return the samples of the envelope registered for a drive or readout pulse."""
+    gen_ch = pulse.dac
+    soc_length = us2cycles(soccfg, pulse.duration, gen_ch=gen_ch)
+    samples_per_clk = _samples_per_clk(soccfg, gen_ch)
+    if isinstance(pulse, FlatTop):
+        return int(np.round(soc_length / 2)) * samples_per_clk
+    if isinstance(pulse, (Gaussian, Drag)):
+        return soc_length * samples_per_clk
+    if isinstance(pulse, Hann):
+        return soc_length
+    if isinstance(pulse, Arbitrary):
+        return len(pulse.i_values)
+    return 0
+
+
+def flux_envelope_length(soccfg: Mapping, pulse: Pulse) -> int:
+    """Return the samples of the envelope registered for a flux pulse."""
+    gen_ch = pulse.dac
+    samples_per_clk = _samples_per_clk(soccfg, gen_ch)
+    if isinstance(pulse, Arbitrary):
+        return len(pulse.i_values) + samples_per_clk
+    if isinstance(pulse, (Rectangular, FluxExponential)):
+        duration = us2cycles(soccfg, pulse.duration, gen_ch=gen_ch)
+        return (duration + 1) * samples_per_clk
+    return 0
+
+
+def pulse_cycles(soccfg: Mapping, pulse: Pulse) -> int:
+    """Return the duration of a drive or readout pulse in generator clock cycles."""
+    # the duration of FlatTop pulses includes their ramps
+    if pulse.style in ("const", "flat_top"):
+        return us2cycles(soccfg, pulse.duration, gen_ch=pulse.dac)
+    return envelope_length(soccfg, pulse) // _samples_per_clk(soccfg, pulse.dac)
+
+
+class _Walker(FluxLayoutMixin):
+    """Accumulate instructions and waveforms following the program structure.
+
+    The parts of the program in `FluxLayoutMixin` are shared, with the qick
+    assembly API replaced by methods counting the instructions and following
+    the timestamps.
+    """
+
+    def __init__(
+        self,
+        soccfg: Mapping,
+        qpcfg: Config,
+        sequence: List[Element],
+        qubits: List[Qubit],
+        sweepers: Sequence[Sweeper],
+        is_mux: bool,
+        interleaved: Sequence[List[Element]] = (),
+        held: Optional[Mapping[int, int]] = None,
+    ):
+        self.soccfg = soccfg
+        self.converter = converter(soccfg)
+        self.sequence = sequence
+        self.interleaved = interleaved
+        self.sequence_block = qpcfg.interleave_block
+        # readouts are grouped, and their durations checked, only if multiplexed
+        self.mux_groups = [
+            group
+            for part in (interleaved if len(interleaved) > 0 else [sequence])
+            for group in (group_mux_ro(part) if is_mux else [])
+        ]
+        self.qubits = qubits
+        self.sweepers = sweepers
+        self.is_mux = is_mux
+        self.instructions = 0
+        self.waveforms: Dict[int, int] = {}
+        self.registered_waveforms: Dict[int, List] = {}
+        self.waveform_lengths: Dict[Tuple[int, str], int] = {}
+        self.styles: Dict[int, Optional[str]] = {}
+        # cycles, kind and name of the pulse set on each channel
+        self.next_pulses: Dict[int, Tuple[int, str, Optional[str]]] = {}
+        self.flux_pulse: Optional[Pulse] = None
+        self.pulses_registered = False
+
+        # timing, in tProc clock cycles, following qick timestamps
+        self.f_time = soccfg["tprocs"][0]["f_time"]
+        self.time = 0.0
+        self.gen_ts: Dict[int, float] = {}
+        self.ro_ts: Dict[int, float] = {}
+        self.events: List[TimelineEvent] = []
+        self.shot_start = 0.0
+        self.shot_events = 0
+        self.ro_time_of_flight = qpcfg.ro_time_of_flight
+        self.resets = [qubit.reset for qubit in qubits if qubit.reset is not None]
+        relaxation_time = qpcfg.relaxation_time
+        if len(self.resets) > 0:
+            relaxation_time = max(reset.settle_time for reset in self.resets)
+        self.relax_delay = us2cycles(soccfg, relaxation_time)
+        self.persistent_bias = qpcfg.persistent_bias
+        self.held_before = dict(held) if held is not None else {}
+        self.held_after: Optional[Dict[int, int]] = None
+        self.sync_readouts = qpcfg.sync_readouts
+        # reference time of each element, relative to the end of the bias setting
+        self.references: List[float] = []
+        self.wait_initialize = us2cycles(soccfg, 2.0)
+
+        self.swept_delays: Dict[int, float] = {}
+        self.swept_biases: Set[Optional[int]] = set()
+        self.swept_durations: Dict[int, np.ndarray] = {}
+        self.swept_fluxes: Set[int] = set()
+        for sweeper in sweepers:
+            for i, (par, idx) in enumerate(zip(sweeper.parameters, sweeper.indexes)):
+                if par is Parameter.DURATION:
+                    gen_ch = sequence[idx].dac
+                    self.swept_durations[idx] = swept_cycles(
+                        us2cycles(soccfg, sweeper.starts[i], gen_ch=gen_ch),
+                        us2cycles(soccfg, sweeper.stops[i], gen_ch=gen_ch),
+                        sweeper.expts,
+                    )
+                elif par is Parameter.DELAY:
+                    if sweeper.values is not None:
+                        delays = sweeper.values[i]
+                    else:
+                        delays = np.linspace(
+                            sweeper.starts[i], sweeper.stops[i], sweeper.expts
+                        )
+                    self.swept_delays[idx] = float(np.mean(delays))
+                elif par is Parameter.BIAS:
+                    self.swept_biases.add(self.qubits[idx].dac)
+                elif par is Parameter.AMPLITUDE and sequence[idx].type == "flux":
+                    self.swept_fluxes.add(idx)
+
+    @property
+    def sequences(self) -> List[List[Element]]:
+        """Sequences executed by the program, selected in turn for every shot."""
+        return list(self.interleaved) if len(self.interleaved) > 0 else [self.sequence]
+
+    def regwi(self, *_args):
+        """Count a register write."""
+        self.instructions += 1
+
+    def mathi(self, *_args):
+        """Count an operation between registers."""
+        self.instructions += 1
+
+    def condj(self, *_args):
+        """Count a conditional jump."""
+        self.instructions += 1
+
+    def read(self, *_args):
+        """Count the read of an accumulated value."""
+        self.instructions += 1
+
+    def safe_regwi(self, _page: int, _reg: int, value: int):
+        """Count a register write of any value."""
+        self.instructions += regwi_cost(value)
+
+    def label(self, name: str):
+        """Labels are not instructions."""
+
+    def wait_all(self, _cycles: int = 0):
+        """Count a wait, that does not move the reference time."""
+        self.instructions += 1
+
+    def add_pulse(self, gen_ch: int, name: str, idata: np.ndarray, *_qdata):
+        """Load an envelope in the memory of a generator."""
+        self.add_waveform(gen_ch, len(idata))
+        self.waveform_lengths[(gen_ch, name)] = len(idata)
+
+    def set_pulse_registers(
+        self,
+        ch: int,
+        style: str,
+        freq: int,
+        phase: int,
+        waveform: Optional[str] = None,
+        length: Optional[int] = None,
+        **_kwargs,
+    ):
+        """Set the registers of a constant or arbitrary pulse, for flux channels.
+
+        The pulse is part of `self.flux_pulse` if set, of a bias otherwise.
+        """
+        self.instructions += regwi_cost(freq) + regwi_cost(phase) + 2
+        if waveform is not None:
+            self.instructions += 1  # waveform address
+            length = self.waveform_lengths[(ch, waveform)]
+            length //= _samples_per_clk(self.soccfg, ch)
+        assert length is not None
+        self.styles[ch] = style
+        if self.flux_pulse is None:
+            self.next_pulses[ch] = (length, "bias", None)
+        else:
+            self.next_pulses[ch] = (length, "flux", self.flux_pulse.name)
+
+    def pulse(self, ch: int):
+        """Fire the pulse whose registers were set on the channel."""
+        self.fire(ch, *self.next_pulses[ch])
+
+    def is_bias_swept(self, flux_ch: int) -> bool:
+        """Check if the bias of a flux channel is swept."""
+        return flux_ch in self.swept_biases
+
+    def set_swept_bias(self, _flux_ch: int, _mode: str):
+        """Count the gain set from the swept bias."""
+        self.instructions += 1
+
+    def add_waveform(self, gen_ch: int, samples: int):
+        """Add an envelope of a given number of samples to a generator."""
+        if samples > 0:
+            self.waveforms[gen_ch] = self.waveforms.get(gen_ch, 0) + samples
+
+    def add_pulse_to_register(self, pulse: Pulse):
+        """Mirror `BaseProgram.add_pulse_to_register`."""
+        name = pulse.waveform_name
+        registered = self.registered_waveforms.setdefault(pulse.dac, [])
+        if name is not None and name not in registered:
+            self.add_waveform(pulse.dac, envelope_length(self.soccfg, pulse))
+            registered.append(name)
+        self.instructions += registers_cost(self.soccfg, pulse)
+        self.styles[pulse.dac] = pulse.style
+        cycles = pulse_cycles(self.soccfg, pulse)
+        self.next_pulses[pulse.dac] = (cycles, pulse.type, pulse.name)
+
+    def fire(self, gen_ch: int, cycles: int, kind: str, name: Optional[str] = None):
+        """Fire the last pulse whose registers were set on the channel."""
+        self.instructions += fire_cost(self.styles[gen_ch])
+        start = self.gen_ts.get(gen_ch, 0)
+        length = cycles * self.f_time / self.soccfg["gens"][gen_ch]["f_fabric"]
+        self.gen_ts[gen_ch] = start + length
+        self.add_event(start, length, f"gen {gen_ch}", kind, name)
+
+    def trigger(self, adcs: List[int], lengths: List[float]):
+        """Trigger the acquisition windows of a list of ADCs."""
+        self.instructions += trigger_cost(self.soccfg, adcs)
+        start = self.ro_time_of_flight
+        for adc, duration in zip(adcs, lengths):
+            length = us2cycles(self.soccfg, duration, ro_ch=adc)
+            length *= self.f_time / self.soccfg["readouts"][adc]["f_output"]
+            self.ro_ts[adc] = start + length
+            self.add_event(start, length, f"adc {adc}", "acquisition")
+
+    def add_event(self, start, length, channel, kind, name=None):
+        """Record an event, with times relative to the current reference."""
+        self.events.append(
+            TimelineEvent(
+                start=(self.time + start) / self.f_time,
+                duration=length / self.f_time,
+                channel=channel,
+                kind=kind,
+                name=name,
+            )
+        )
+
+    def synci(self, cycles: float):
+        """Increment the reference time."""
+        self.instructions += 1
+        self.time += cycles
+
+    def sync_all(self, cycles: float = 0):
+        """Move the reference time at the end of all pulses and acquisitions."""
+        timestamps = list(self.gen_ts.values()) + list(self.ro_ts.values())
+        max_t = max(timestamps, default=0)
+        if max_t + cycles > 0:
+            self.synci(max_t + cycles)
+            self.gen_ts = {}
+            self.ro_ts = {}
+
+    def flux(self, pulse: Pulse, idx: int):
+        """Mirror `FluxProgram.execute_flux_pulse`."""
+        self.flux_pulse = pulse
+        try:
+            self.execute_flux_pulse(pulse, idx)
+        finally:
+            self.flux_pulse = None
+
+    def execute_flux_pulse(self, pulse: Pulse, idx: int):
+        """Fire a flux pulse, see `flux`."""
+        gen_ch = pulse.dac
+        samples_per_clk = _samples_per_clk(self.soccfg, gen_ch)
+        duration = us2cycles(self.soccfg, pulse.duration, gen_ch=gen_ch)
+        if idx in self.swept_fluxes or self.is_bias_swept(gen_ch):
+            # mirror `FluxProgram.execute_swept_flux_pulse`
+            sweetspot = self.flux_gain(gen_ch, self.find_qubit_sweetspot(pulse))
+            self.set_const_registers(gen_ch, 0, duration)
+            self.instructions += 1  # swept gain
+            self.pulse(ch=gen_ch)
+            self.set_bias_registers(gen_ch, sweetspot)
+            if self.is_bias_swept(gen_ch):
+                self.set_swept_bias(gen_ch, "sweetspot")
+            self.pulse(ch=gen_ch)
+            return
+        plateau = self.flux_plateau(pulse)
+        if plateau is not None:
+            self.execute_const_flux_pulse(pulse, plateau, samples_per_clk)
+            return
+
+        samples = flux_envelope_length(self.soccfg, pulse)
+        self.add_waveform(gen_ch, samples)
+        self.waveform_lengths[(gen_ch, pulse.name)] = samples
+        self.set_arb_registers(gen_ch, pulse.name)
+        self.pulse(ch=gen_ch)
+
+    def readout(self, elem: Element, muxed_executed: List[Element]):
+        """Mirror `BaseProgram.execute_readout_pulse`."""
+        if self.is_mux:
+            if elem in muxed_executed:
+                return
+            group = next(group for group in self.mux_groups if elem in group)
+            # first pulse of each generator, with the mask of its tones
+            pulses: Dict[int, Pulse] = {}
+            for ro in group:
+                if isinstance(ro, Pulse):
+                    pulses.setdefault(ro.dac, ro)
+            fired = [pulses[gen_ch] for gen_ch in sorted(pulses)]
+            for pulse in fired:
+                self.instructions += 2  # mask and length
+                self.styles[pulse.dac] = "const"
+            adcs = [ro.adc for ro in group]
+            lengths = [ro.duration for ro in group]
+            muxed_executed.extend(group)
+        else:
+            if not self.pulses_registered and isinstance(elem, Pulse):
+                self.add_pulse_to_register(elem)
+            adcs = [elem.adc]
+            lengths = [elem.duration]
+            fired = [elem] if isinstance(elem, Pulse) else []
+
+        self.trigger(adcs, lengths)
+        if isinstance(elem, Pulse):
+            for pulse in fired:
+                cycles = pulse_cycles(self.soccfg, pulse)
+                self.fire(pulse.dac, cycles, "readout", pulse.name)
+            if self.sync_readouts:
+                self.sync_all()
+
+    def body(self):
+        """Mirror `FluxProgram.body`, recording the start of the shot."""
+        self.shot_start = self.time
+        self.shot_events = len(self.events)
+        super().body()
+
+    def execute_sequence(self, sequence: List[Element], offset: int = 0):
+        """Mirror `FluxProgram.execute_sequence`."""
+        last_pulse_registered: Dict[int, Pulse] = {}
+        muxed_executed: List[Element] = []
+        muxed_references: List[float] = []
+
+        origin = self.time
+        for idx, elem in enumerate(sequence, start=offset):
+            if idx in self.swept_delays:
+                self.synci(self.swept_delays[idx] * self.f_time)
+            else:
+                delay_start = us2cycles(self.soccfg, elem.start_delay)
+                if delay_start != 0:
+                    self.synci(delay_start)
+            if elem in muxed_executed:
+                # fired with the first readout of its multiplexed group
+                self.references.append(muxed_references[muxed_executed.index(elem)])
+            else:
+                self.references.append(self.time - origin)
+
+            if elem.type == "readout":
+                self.readout(elem, muxed_executed)
+                added = len(muxed_executed) - len(muxed_references)
+                muxed_references.extend([self.references[-1]] * added)
+            elif elem.type == "drive":
+                assert isinstance(elem, Pulse)
+                if not self.pulses_registered and (
+                    elem.dac not in last_pulse_registered
+                    or elem != last_pulse_registered[elem.dac]
+                ):
+                    self.add_pulse_to_register(elem)
+                    last_pulse_registered[elem.dac] = elem
+                self.fire(elem.dac, pulse_cycles(self.soccfg, elem), "drive", elem.name)
+            elif elem.type == "flux":
+                assert isinstance(elem, Pulse)
+                self.flux(elem, idx)
+
+            if idx in self.swept_durations:
+                self.shift_duration(idx)
+
+    def execute_selected_sequence(self):
+        """Mirror `FluxProgram.execute_selected_sequence`.
+
+        The reference time after the branches is their average.
+        """
+        start, gen_ts, ro_ts = self.time, self.gen_ts, self.ro_ts
+        ends = []
+        offset = 0
+        for idx, sequence in enumerate(self.sequences):
+            self.time, self.gen_ts, self.ro_ts = start, dict(gen_ts), dict(ro_ts)
+            self.start_sequence_branch(idx)
+            self.execute_sequence(sequence, offset)
+            self.end_sequence_branch(idx)
+            ends.append(self.time)
+            offset += len(sequence)
+        self.time = float(np.mean(ends))
+        self.select_next_sequence()
+
+    def measure_resets(self):
+        """Mirror `FluxProgram.measure_resets`."""
+        for reset in self.resets:
+            readout = reset.readout
+            self.add_pulse_to_register(readout)
+            self.trigger([readout.adc], [readout.duration])
+            self.fire(readout.dac, pulse_cycles(self.soccfg, readout), "readout")
+
+    def shift_duration(self, idx: int):
+        """Delay the elements following a pulse by the mean change in duration.
+
+        The event of the pulse reports its mean duration.
+        """
+        pulse = self.sequence[idx]
+        assert isinstance(pulse, Pulse)
+        ratio = self.f_time / self.soccfg["gens"][pulse.dac]["f_fabric"]
+        lengths = self.swept_durations[idx]
+        shift = (np.mean(lengths) - pulse_cycles(self.soccfg, pulse)) * ratio
+        event = next(
+            event for event in reversed(self.events) if event.name == pulse.name
+        )
+        event.duration = float(np.mean(lengths)) * ratio / self.f_time
+        self.synci(float(shift))
+
+    def swept_registers(self, sweeper: Sweeper, idx: int) -> int:
+        """Return the number of registers swept for a parameter.
+
+        Durations sweep the length and the delay of the following elements,
+        and the waveform address for shaped pulses.
+        """
+        if sweeper.parameters[idx] is Parameter.DURATION:
+            pulse = self.sequence[sweeper.indexes[idx]]
+            return 2 if pulse.style in ("const", "flat_top") else 3
+        return 1
+
+    def sweep_reset_cost(self, sweeper: Sweeper, idx: int) -> int:
+        """Return the instructions needed to reset a swept register."""
+        if sweeper.values is not None:
+            return 2  # pointer reset and load
+        par = sweeper.parameters[idx]
+        start = sweeper.starts[idx]
+        if par is Parameter.FREQUENCY:
+            gen = self.soccfg["gens"][self.sequence[sweeper.indexes[idx]].dac]
+            return regwi_cost(int(np.round(start * 2 ** gen["b_dds"] / gen["f_dds"])))
+        if par is Parameter.RELATIVE_PHASE:
+            gen = self.soccfg["gens"][self.sequence[sweeper.indexes[idx]].dac]
+            return regwi_cost(int(np.round(start * 2 ** gen["b_phase"] / 360)))
+        return self.swept_registers(sweeper, idx)
+
+    def sweep_update_cost(self, sweeper: Sweeper, idx: int) -> int:
+        """Return the instructions needed to move a swept register to the next value."""
+        if sweeper.values is not None:
+            return 2  # pointer increment and load
+        return self.swept_registers(sweeper, idx)
+
+    def averager(self):
+        """Mirror `ExecutePulseSequence` and `AveragerProgram.make_program`."""
+        self.hold_bias()
+        self.sync_all(self.wait_initialize)
+        if len(self.sequences) > 1:
+            self.declare_sequence_registers()
+        self.body()
+        self.instructions += 6  # counters, loop and end
+
+    def nd_averager(self):
+        """Mirror `ExecuteSweeps` and `NDAveragerProgram.make_program`."""
+        self.pulses_registered = True
+        for pulse in (elem for elem in self.sequence if isinstance(elem, Pulse)):
+            if (self.is_mux and pulse.type != "drive") or pulse.type == "flux":
+                continue
+            self.add_pulse_to_register(pulse)
+        for idx, lengths in self.swept_durations.items():
+            pulse = self.sequence[idx]
+            if pulse.style == "arb":
+                # bank of envelopes padded to the longest one
+                samples = int(max(lengths)) * _samples_per_clk(self.soccfg, pulse.dac)
+                self.add_waveform(pulse.dac, len(lengths) * samples)
+        self.instructions += len(self.swept_biases)
+        self.hold_bias()
+        self.sync_all(self.wait_initialize)
+
+        self.instructions += 2  # total and repetitions counters
+        for sweeper in self.sweepers:
+            for idx in range(len(sweeper.parameters)):
+                self.instructions += self.sweep_reset_cost(sweeper, idx)
+            self.instructions += 1  # loop counter
+        self.body()
+        self.instructions += 2  # total counter update
+        for sweeper in self.sweepers:
+            for idx in range(len(sweeper.parameters)):
+                self.instructions += self.sweep_update_cost(sweeper, idx)
+            self.instructions += 1  # loop
+        self.instructions += 2  # repetitions loop and end
+
+
+def _walk(
+    soccfg: Mapping,
+    qpcfg: Config,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper],
+    is_mux: Optional[bool],
+    interleaved: Sequence[List[Element]] = (),
+    held: Optional[Mapping[int, int]] = None,
+) -> _Walker:
+    if is_mux is None:
+        is_mux = qibosoq_cfg.IS_MULTIPLEXED
+    walker = _Walker(
+        soccfg, qpcfg, sequence, qubits, sweepers, is_mux, interleaved, held
+    )
+    if len(sweepers) > 0:
+        walker.nd_averager()
+    else:
+        walker.averager()
+    return walker
+
+
+def estimate_program(
+    soccfg: Mapping,
+    qpcfg: Config,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper] = (),
+    raw: bool = False,
+    is_mux: Optional[bool] = None,
+    interleaved: Sequence[List[Element]] = (),
+    held: Optional[Mapping[int, int]] = None,
+) -> ProgramEstimate:
+    """Estimate the resources needed to execute a sequence, without compiling it.
+
+    Args:
+        soccfg: QickConfig (or QickSoc) of the board, or its dictionary form
+        qpcfg: configuration of the execution
+        sequence: elements to execute
+        qubits: qubits used in the sequence
+        sweepers: sweepers, if the program is an `ExecuteSweeps`
+        raw: if True, estimate a decimated acquisition
+        is_mux: if the readout is multiplexed (default from the configuration)
+        interleaved: sequences of an `ExecuteSequences`, whose concatenation
+            is `sequence`
+        held: gains held by the flux channels of the board before the
+            program (default none), as in `programs.flux.held_biases`
+    """
+    walker = _walk(soccfg, qpcfg, sequence, qubits, sweepers, is_mux, interleaved, held)
+    return _program_estimate(walker, qpcfg, raw)
+
+
+def _program_estimate(walker: _Walker, qpcfg: Config, raw: bool) -> ProgramEstimate:
+    soccfg = walker.soccfg
+    sequence = walker.sequence
+    sweepers = walker.sweepers
+    interleaved = walker.interleaved
+
+    waveform_limits = {
+        gen_ch: soccfg["gens"][gen_ch]["maxlen"] for gen_ch in walker.waveforms
+    }
+
+    points = int(np.prod([sweeper.expts for sweeper in sweepers]))
+    triggers: Dict[int, int] = {}
+    lengths: Dict[int, int] = {}
+    for readout in (elem for elem in sequence if elem.type == "readout"):
+        triggers[readout.adc] = triggers.get(readout.adc, 0) + 1
+        if readout.adc not in lengths:
+            lengths[readout.adc] = us2cycles(
+                soccfg, readout.duration, ro_ch=readout.adc
+            )
+
+    # every shot executes one of the interleaved sequences
+    parts = max(len(interleaved), 1)
+    triggers = {adc: count // parts for adc, count in triggers.items()}
+    for reset in walker.resets:
+        triggers[reset.readout.adc] = triggers.get(reset.readout.adc, 0) + 1
+    readout_buffers = {
+        adc: count * qpcfg.reps * parts * points for adc, count in triggers.items()
+    }
+    decimated_buffers: Dict[int, int] = {}
+    decimated_limits: Dict[int, int] = {}
+    if raw:
+        for adc, count in triggers.items():
+            decimated_buffers[adc] = lengths[adc] * count
+            decimated_limits[adc] = soccfg["readouts"][adc]["buf_maxlen"]
+
+    data_memory = sum(
+        sweeper.values.size for sweeper in sweepers if sweeper.values is not None
+    )
+
+    return ProgramEstimate(
+        instructions=walker.instructions,
+        pmem_size=soccfg["tprocs"][0]["pmem_size"],
+        waveform_memory=walker.waveforms,
+        waveform_limits=waveform_limits,
+        readout_triggers=triggers,
+        readout_buffers=readout_buffers,
+        decimated_buffers=decimated_buffers,
+        decimated_limits=decimated_limits,
+        data_memory=data_memory,
+        dmem_size=soccfg["tprocs"][0]["dmem_size"],
+    )
+
+
+def estimate_timeline(
+    soccfg: Mapping,
+    qpcfg: Config,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper] = (),
+    is_mux: Optional[bool] = None,
+    interleaved: Sequence[List[Element]] = (),
+    held: Optional[Mapping[int, int]] = None,
+) -> Timeline:
+    """Estimate the timeline of a shot and the hardware time of the acquisition.
+
+    The shot starts after the initialization (persistent biases and
+    `wait_initialize`), which is executed once per round.
+    Swept delays are replaced by their mean value over the sweep.
+    The events of interleaved sequences all start from the beginning of the
+    shot, whose duration is averaged over the sequences.
+
+    Args:
+        soccfg: QickConfig (or QickSoc) of the board, or its dictionary form
+        qpcfg: configuration of the execution
+        sequence: elements to execute
+        qubits: qubits used in the sequence
+        sweepers: sweepers, if the program is an `ExecuteSweeps`
+        is_mux: if the readout is multiplexed (default from the configuration)
+        interleaved: sequences of an `ExecuteSequences`, whose concatenation
+            is `sequence`
+        held: gains held by the flux channels of the board before the
+            program (default none), as in `programs.flux.held_biases`
+    """
+    walker = _walk(soccfg, qpcfg, sequence, qubits, sweepers, is_mux, interleaved, held)
+    return _timeline(walker, qpcfg)
+
+
+def _timeline(walker: _Walker, qpcfg: Config) -> Timeline:
+    f_time = walker.f_time
+    initialization = walker.shot_start / f_time
+    events = [
+        replace(event, start=event.start - initialization)
+        for event in walker.events[walker.shot_events :]
+    ]
+    points = int(np.prod([sweeper.expts for sweeper in walker.sweepers]))
+    return Timeline(
+        events=events,
+        shot_duration=walker.time / f_time - initialization,
+        initialization=initialization,
+        relaxation_time=walker.relax_delay / f_time,
+        shots=qpcfg.reps * max(len(walker.interleaved), 1) * points,
+        rounds=qpcfg.soft_avgs,
+    )
+
+
+def estimate_resources(
+    soccfg: Mapping,
+    qpcfg: Config,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper] = (),
+    raw: bool = False,
+    is_mux: Optional[bool] = None,
+    interleaved: Sequence[List[Element]] = (),
+    held: Optional[Mapping[int, int]] = None,
+) -> Tuple[ProgramEstimate, Timeline]:
+    """Estimate both the resources and the timeline of a program, following it once.
+
+    The arguments are the ones of :func:`estimate_program`.
+    """
+    walker = _walk(soccfg, qpcfg, sequence, qubits, sweepers, is_mux, interleaved, held)
+    return _program_estimate(walker, qpcfg, raw), _timeline(walker, qpcfg)
+
+
+def sequence_channels(sequence: Sequence[Element]) -> Set[str]:
+    """Return the generators and ADCs used by a sequence."""
+    channels = {f"gen {elem.dac}" for elem in sequence if isinstance(elem, Pulse)}
+    channels |= {f"adc {elem.adc}" for elem in sequence if elem.type == "readout"}
+    return channels
+
+
+def _delayed_by_readout(
+    sequence: Sequence[Element], is_mux: Optional[bool]
+) -> Optional[Pulse]:
+    """Return a pulse following a readout on a generator used before it, if any.
+
+    Without waiting for the readout, the pulse is fired at the end of the
+    previous one on its generator. The multiplexed readouts of a group are
+    fired together.
+    """
+    if is_mux is None:
+        is_mux = qibosoq_cfg.IS_MULTIPLEXED
+    groups = group_mux_ro(list(sequence)) if is_mux else []
+    fired: Set[int] = set()
+    readout: Optional[Element] = None
+    for elem in sequence:
+        grouped = any(elem in group and readout in group for group in groups)
+        if isinstance(elem, Pulse):
+            if readout is not None and not grouped and elem.dac in fired:
+                return elem
+            fired.add(elem.dac)
+        if elem.type == "readout":
+            readout = elem
+    return None
+
+
+def merge_sequences(
+    soccfg: Mapping,
+    qpcfg: Config,
+    sequences: Sequence[List[Element]],
+    qubits: List[Qubit],
+    is_mux: Optional[bool] = None,
+) -> Tuple[List[Element], List[int]]:
+    """Merge sequences on disjoint channels in a single sequence, executed in parallel.
+
+    Every element keeps the time it would have if its sequence were executed
+    alone, waiting for its readouts: the merged elements are sorted by time and
+    their start delays are the intervals between them. The merged sequence has
+    to be executed with `Config.sync_readouts` disabled, otherwise the readouts
+    of a sequence would wait for the pulses of the others.
+
+    Since the merged sequence does not wait for the readouts, the pulses that
+    follow a readout can not use a generator already used by their sequence,
+    that would fire them at the end of its previous pulse.
+
+    Args:
+        soccfg: QickConfig (or QickSoc) of the board, or its dictionary form
+        qpcfg: configuration of the execution
+        sequences: sequences to merge
+        qubits: qubits used in the sequences
+        is_mux: if the readout is multiplexed (default from the configuration)
+
+    Returns:
+        the merged sequence and, for each of its elements, the index of the
+        element in the concatenation of the sequences
+    """
+    used: Set[str] = set()
+    for sequence in sequences:
+        channels = sequence_channels(sequence)
+        if len(used & channels) > 0:
+            raise ValueError(
+                f"Merged sequences must use disjoint channels, {sorted(used & channels)} "
+                "are shared"
+            )
+        used |= channels
+
+        pulse = _delayed_by_readout(sequence, is_mux)
+        if pulse is not None:
+            raise ValueError(
+                f"Pulse {pulse.name} follows a readout on generator {pulse.dac}, "
+                "already used by its sequence, and can not be merged"
+            )
+
+    # the times of the sequences executed alone, waiting for their readouts
+    qpcfg = replace(qpcfg, sync_readouts=True)
+    f_time = soccfg["tprocs"][0]["f_time"]
+    timed: List[Tuple[int, int]] = []
+    offset = 0
+    for sequence in sequences:
+        walker = _walk(soccfg, qpcfg, sequence, qubits, (), is_mux)
+        references = np.round(walker.references).astype(int)
+        timed.extend(
+            (int(reference), offset + idx) for idx, reference in enumerate(references)
+        )
+        offset += len(sequence)
+
+    elements = [elem for sequence in sequences for elem in sequence]
+    merged = []
+    origins = []
+    time = 0
+    for reference, idx in sorted(timed):
+        merged.append(replace(elements[idx], start_delay=(reference - time) / f_time))
+        origins.append(idx)
+        time = reference
+    return merged, origins
@@ -0,0 +1,261 @@
+"""Commands executed on the board as jobs, one at a time, by a worker thread.
+
+Commands submitted as jobs return at once with the ID of the job, that
+clients use to poll its status, fetch its results (also more than once, e.g.
+after a dropped connection) and cancel it. The results of the jobs are kept
+for `configuration.JOB_RESULTS_TTL` seconds, and the oldest are evicted when
+they exceed `configuration.JOB_RESULTS_MEMORY` bytes.
+"""
+
+import logging
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Optional
+
+import qibosoq.configuration as cfg
+
+logger = logging.getLogger(cfg.MAIN_LOGGER_NAME)
+
+
+class JobStatus(str, Enum):
+    """States of a job."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED = (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+"""States of the jobs with results."""
+
+
+class JobCancelled(RuntimeError):
+    """Raised by the running jobs that have been cancelled."""
+
+
+@dataclass
+class Job:
+    """Command executed on the board."""
+
+    command: dict
+    """Command of the job, as received by the server."""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    """Unique identifier of the job."""
+    status: JobStatus = JobStatus.QUEUED
+    expected: Optional[float] = None
+    """Hardware time (seconds) expected, known once the job is running."""
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    keep: bool = True
+    """Whether the job is kept in the store, with its encoded results."""
+    results: Any = None
+    """Results, or error, of the job, encoded if kept."""
+    cancel_requested: threading.Event = field(default_factory=threading.Event)
+    future: Optional[Future] = None
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the job has been asked to stop."""
+        return self.cancel_requested.is_set()
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Time (seconds) expected before the end of the job, if known."""
+        if self.status in FINISHED:
+            return 0.0
+        if self.expected is None or self.started is None:
+            return None
+        return max(self.expected - (time.monotonic() - self.started), 0.0)
+
+    def check_cancelled(self):
+        """Raise if the job has been asked to stop."""
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.id} cancelled while running")
+
+
+class JobManager:
+    """Execute jobs on a single worker thread, keeping their results.
+
+    Args:
+        execute: function executing the command of a job on the board,
+            called on the worker thread
+        encode: function encoding the results, or errors, kept in the store
+        ttl: time (seconds) the results are kept after the end of a job
+        memory: maximum size (bytes) of the results kept
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[dict, Job], Any],
+        encode: Callable[[Any], bytes],
+        ttl: float = cfg.JOB_RESULTS_TTL,
+        memory: int = cfg.JOB_RESULTS_MEMORY,
+    ):
+        """Start the worker thread."""
+        self.execute = execute
+        self.encode = encode
+        self.ttl = ttl
+        self.memory = memory
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.current: Optional[Job] = None
+        """Job running on the board, if any."""
+        self.pending: "OrderedDict[str, Job]" = OrderedDict()
+        """Jobs waiting for or running on the board, also the not kept ones."""
+
+    def submit(self, command: dict, keep: bool = True) -> Job:
+        """Queue the command of a job, kept in the store if keep."""
+        job = Job(command, keep=keep)
+        with self.lock:
+            self.evict()
+            if keep:
+                self.jobs[job.id] = job
+            self.pending[job.id] = job
+            job.future = self.worker.submit(self._run, job)
+        return job
+
+    def run(self, command: dict):
+        """Execute a command as an anonymous job and return its results.
+
+        The errors are returned formatted, as the server sends them.
+        """
+        job = self.submit(command, keep=False)
+        assert job.future is not None
+        job.future.result()
+        return job.results
+
+    def _run(self, job: Job):
+        with self.lock:
+            if job.cancelled:
+                return
+            job.status, job.started = JobStatus.RUNNING, time.monotonic()
+            self.current = job
+        try:
+            results, status = self.execute(job.command, job), JobStatus.DONE
+        except JobCancelled:
+            results, status = traceback.format_exc(), JobStatus.CANCELLED
+        except Exception:  # pylint: disable=W0718
+            logger.exception("")
+            results, status = traceback.format_exc(), JobStatus.FAILED
+        if job.keep:
+            results = self.encode(results)
+        with self.lock:
+            job.results, job.status, job.finished = results, status, time.monotonic()
+            self.current = None
+            del self.pending[job.id]
+            self.evict()
+
+    def cancel_queued(self, job: Job):
+        """Cancel a job not running yet, that is then never executed.
+
+        To be called holding the lock.
+        """
+        job.cancel_requested.set()
+        job.status, job.finished = JobStatus.CANCELLED, time.monotonic()
+        message = f"Job {job.id} cancelled before running"
+        job.results = self.encode(message) if job.keep else message
+        del self.pending[job.id]
+
+    def evict(self):
+        """Drop the results expired or exceeding the memory, oldest first.
+
+        To be called holding the lock.
+        """
+        now = time.monotonic()
+        finished = [job for job in self.jobs.values() if job.status in FINISHED]
+        finished.sort(key=lambda job: job.finished)
+        used = sum(len(job.results) for job in finished)
+        for index, job in enumerate(finished):
+            expired = now - job.finished > self.ttl
+            # the latest results are kept, even if larger than the memory
+            excess = used > self.memory and index < len(finished) - 1
+            if not (expired or excess):
+                break
+            used -= len(job.results)
+            del self.jobs[job.id]
+
+    def get(self, job_id: str) -> Job:
+        """Return a job of the store."""
+        with self.lock:
+            self.evict()
+            try:
+                return self.jobs[job_id]
+            except KeyError:
+                raise ValueError(f"Unknown or expired job {job_id}") from None
+
+    def status(self, job_id: str) -> dict:
+        """Return the status of a job, its ETA and the jobs queued before it.
+
+        The jobs queued before it include the not kept ones.
+        """
+        job = self.get(job_id)
+        with self.lock:
+            queued = [
+                other
+                for other in self.pending.values()
+                if other.status is JobStatus.QUEUED
+            ]
+            ahead = queued.index(job) if job in queued else 0
+        return {
+            "job_id": job.id,
+            "status": job.status.value,
+            "eta": job.eta,
+            "ahead": ahead,
+        }
+
+    def fetch(self, job_id: str) -> bytes:
+        """Return the encoded results of a finished job."""
+        job = self.get(job_id)
+        if job.results is None:
+            raise RuntimeError(
+                f"Job {job_id} is {job.status.value}, results not available"
+            )
+        return job.results
+
+    def cancel(self, job_id: str) -> dict:
+        """Cancel a job.
+
+        Queued jobs are never executed, running ones stop at the next point
+        of their software sweepers, if any.
+        """
+        job = self.get(job_id)
+        with self.lock:
+            if job.status is JobStatus.QUEUED:
+                self.cancel_queued(job)
+            elif job.status not in FINISHED:
+                job.cancel_requested.set()
+        return self.status(job_id)
+
+    def summary(self) -> dict:
+        """Return the job running on the board, its ETA and the queued ones."""
+        with self.lock:
+            self.evict()
+            current = self.current
+            return {
+                "running": current.id if current is not None else None,
+                "eta": current.eta if current is not None else 0.0,
+                "queued": len(self.pending) - (current is not None),
+                "kept": len(self.jobs),
+                "memory": sum(
+                    len(job.results)
+                    for job in self.jobs.values()
+                    if job.status in FINISHED
+                ),
+            }
+
+    def shutdown(self):
+        """Cancel the queued jobs, also the not kept ones, and wait for the running one."""
+        with self.lock:
+            for job in list(self.pending.values()):
+                if job.status is JobStatus.QUEUED:
+                    self.cancel_queued(job)
+        self.worker.shutdown()
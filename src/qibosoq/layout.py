@@ -0,0 +1,340 @@
+"""Parts of the flux programs shared with the estimation of their resources.
+
+:class:`FluxLayoutMixin` fires the biases, the edges of the flux pulses, the
+branches of the active resets and the selection of interleaved sequences with
+the qick assembly API. :class:`qibosoq.programs.flux.FluxProgram` generates
+these instructions, while the estimator (see :mod:`qibosoq.estimator`) counts
+them and follows their timing, without qick.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from qibosoq.components.base import ActiveReset, Qubit
+from qibosoq.components.pulses import Element, Pulse, Rectangular
+
+MIN_CONST_LENGTH = 3
+"""Minimum length of a constant pulse (clock cycles).
+
+Also the length of the constant pulses fired by `FluxLayoutMixin.set_bias`.
+"""
+MAX_CONST_LENGTH = 2**16 - 1
+"""Maximum length of a constant pulse (clock cycles)."""
+FLUX_EDGE_LENGTH = MIN_CONST_LENGTH
+"""Length of the waveform ending rectangular flux pulses (clock cycles)."""
+RESET_LATENCY = 50
+"""Time waited for the accumulated values of the reset readouts (tProc clock cycles)."""
+SEQUENCE_REGISTERS = (10, 11, 12)
+"""Registers of page 0 with the selected sequence, the remaining shots of its
+block and a temporary value, for interleaved sequences."""
+RESET_REGISTERS = (8, 9)
+"""Registers of page 0 with the value read and the threshold, for active resets."""
+
+
+def is_const_length(length: int) -> bool:
+    """Check if a constant pulse of a given length (clock cycles) can be fired."""
+    return MIN_CONST_LENGTH <= length <= MAX_CONST_LENGTH
+
+
+class FluxLayoutMixin:
+    """Instructions of the flux programs that do not depend on qick.
+
+    The classes using it provide the qick assembly API (`regwi`, `pulse`,
+    `sync_all`...), the `soccfg` and `converter` of the board and the
+    settings of the program.
+    """
+
+    soccfg: Any
+    converter: Any
+    qubits: List[Qubit]
+    sequence: List[Element]
+    resets: List[ActiveReset]
+    relax_delay: int
+    persistent_bias: bool
+    held_before: Dict[int, int]
+    held_after: Optional[Dict[int, int]]
+    registered_waveforms: Dict[int, List]
+    sequence_block: int
+
+    # qick assembly API
+    regwi: Callable[..., Any]
+    mathi: Callable[..., Any]
+    condj: Callable[..., Any]
+    read: Callable[..., Any]
+    safe_regwi: Callable[..., Any]
+    label: Callable[..., Any]
+    add_pulse: Callable[..., Any]
+    set_pulse_registers: Callable[..., Any]
+    pulse: Callable[..., Any]
+    add_pulse_to_register: Callable[..., Any]
+    wait_all: Callable[..., Any]
+    sync_all: Callable[..., Any]
+
+    # parts that differ between the programs and the estimator
+    execute_sequence: Callable[..., Any]
+    execute_selected_sequence: Callable[..., Any]
+    is_bias_swept: Callable[[int], bool]
+    set_swept_bias: Callable[[int, str], Any]
+    measure_resets: Callable[[], Any]
+
+    @property
+    def sequences(self) -> List[List[Element]]:
+        """Sequences executed by the program, selected in turn for every shot."""
+        return [self.sequence]
+
+    @property
+    def biased_qubits(self) -> List[Qubit]:
+        """Qubits with a non-zero bias."""
+        return [
+            qubit
+            for qubit in self.qubits
+            if qubit.bias is not None and qubit.dac is not None and qubit.bias != 0
+        ]
+
+    def is_bias_persistent(self, qubit: Qubit) -> bool:
+        """Check if the bias of a qubit is held between shots.
+
+        Swept biases are always set in every shot.
+        """
+        assert qubit.dac is not None
+        return self.persistent_bias and not self.is_bias_swept(qubit.dac)
+
+    def flux_gain(self, flux_ch: int, value: float) -> int:
+        """Return the gain of a flux channel corresponding to a relative value."""
+        max_gain = int(self.soccfg["gens"][flux_ch]["maxv"])
+        return int(np.trunc(max_gain * value))
+
+    def bias_gain(self, qubit: Qubit) -> int:
+        """Return the gain corresponding to the bias of a qubit."""
+        assert qubit.dac is not None and qubit.bias is not None
+        return self.flux_gain(qubit.dac, qubit.bias)
+
+    def find_qubit_sweetspot(self, pulse: Pulse) -> float:
+        """Return bias of a qubit from flux pulse."""
+        for qubit in self.qubits:
+            if pulse.dac == qubit.dac:
+                return qubit.bias if qubit.bias else 0
+        return 0.0
+
+    def set_const_registers(self, flux_ch: int, gain: int, length: int):
+        """Register a constant level, that is then held by the channel."""
+        # a constant pulse with freq and phase 0 is a DC level
+        self.set_pulse_registers(
+            ch=flux_ch,
+            style="const",
+            stdysel="last",
+            freq=0,
+            phase=0,
+            gain=gain,
+            length=length,
+        )
+
+    def set_arb_registers(self, flux_ch: int, waveform: str):
+        """Register a flux waveform, whose last value is then held by the channel."""
+        self.set_pulse_registers(
+            ch=flux_ch,
+            waveform=waveform,
+            style="arb",
+            outsel="input",
+            stdysel="last",
+            freq=0,
+            phase=0,
+            gain=int(self.soccfg["gens"][flux_ch]["maxv"]),
+        )
+
+    def set_bias_registers(self, flux_ch: int, gain: int):
+        """Register a bias level, that is then held by the channel."""
+        self.set_const_registers(flux_ch, gain, MIN_CONST_LENGTH)
+
+    def set_bias(self, mode: str = "sweetspot"):
+        """Set qubits flux lines to a bias level.
+
+        Note that this fuction acts only on the qubits used in self.sequence.
+        With persistent biases, only the swept biases are set.
+        Args:
+            mode (str): can be 'sweetspot' or 'zero'
+        """
+        if mode not in ("sweetspot", "zero"):
+            raise NotImplementedError(f"Mode {mode} not supported")
+
+        qubits = [
+            qubit for qubit in self.biased_qubits if not self.is_bias_persistent(qubit)
+        ]
+        if self.persistent_bias and len(qubits) == 0:
+            return
+
+        for qubit in qubits:
+            flux_ch = qubit.dac
+            assert flux_ch is not None
+            gain = self.bias_gain(qubit) if mode == "sweetspot" else 0
+            self.set_bias_registers(flux_ch, gain)
+            if self.is_bias_swept(flux_ch):
+                self.set_swept_bias(flux_ch, mode)
+            self.pulse(ch=flux_ch)
+        self.sync_all(50)  # wait all pulses are fired + 50 clks
+
+    def hold_bias(self):
+        """Set the persistent biases, once per program.
+
+        The channels already holding the same bias after the previous program
+        are skipped, while the ones that are not needed anymore are set to zero.
+        """
+        held = {
+            qubit.dac: self.bias_gain(qubit)
+            for qubit in self.biased_qubits
+            if self.is_bias_persistent(qubit)
+        }
+        changes = {
+            ch: gain for ch, gain in held.items() if self.held_before.get(ch) != gain
+        }
+        changes.update({ch: 0 for ch in self.held_before if ch not in held})
+
+        for flux_ch, gain in changes.items():
+            assert flux_ch is not None
+            self.set_bias_registers(flux_ch, gain)
+            self.pulse(ch=flux_ch)
+        if len(changes) > 0:
+            self.sync_all(50)
+        self.held_after = held
+
+    def flux_plateau(self, pulse: Pulse) -> Optional[int]:
+        """Return the length of the constant part of a flux pulse, if it has one.
+
+        Rectangular pulses short enough are fired as a constant pulse followed
+        by an edge (see `execute_const_flux_pulse`).
+        """
+        duration = self.converter.us2cycles(pulse.duration, gen_ch=pulse.dac)
+        plateau = duration - FLUX_EDGE_LENGTH + 1
+        if isinstance(pulse, Rectangular) and is_const_length(plateau):
+            return plateau
+        return None
+
+    def execute_const_flux_pulse(
+        self, pulse: Pulse, plateau: int, samples_per_clk: int
+    ):
+        """Fire a rectangular flux pulse as a constant pulse followed by its edge.
+
+        The constant pulse does not use envelope memory.
+        """
+        gen_ch = pulse.dac
+        max_gain = int(self.soccfg["gens"][gen_ch]["maxv"])
+        sweetspot = self.flux_gain(gen_ch, self.find_qubit_sweetspot(pulse))
+        amp = self.flux_gain(gen_ch, pulse.amplitude) + sweetspot
+        if abs(amp) > max_gain:
+            raise ValueError("Flux pulse got amplitude > 1")
+        self.set_const_registers(gen_ch, amp, plateau)
+        self.pulse(ch=gen_ch)
+        self.execute_flux_edge(gen_ch, amp, sweetspot, samples_per_clk)
+
+    def execute_flux_edge(
+        self, gen_ch: int, amp: int, sweetspot: int, samples_per_clk: int
+    ):
+        """Fire the end of a rectangular flux pulse, that brings back to sweetspot.
+
+        The edge is the last part of the pulse, at amplitude `amp`, followed by
+        a clock cycle of sweetspot, that is then held by the channel.
+        The waveform is loaded only once per program for each pair of values.
+        """
+        name = f"flux_edge_{amp}_{sweetspot}_{gen_ch}"
+        registered = self.registered_waveforms.setdefault(gen_ch, [])
+        if name not in registered:
+            i_vals = np.append(
+                np.full((FLUX_EDGE_LENGTH - 1) * samples_per_clk, amp),
+                np.full(samples_per_clk, sweetspot),
+            )
+            self.add_pulse(gen_ch, name, i_vals, np.zeros(len(i_vals)))
+            registered.append(name)
+        self.set_arb_registers(gen_ch, name)
+        self.pulse(ch=gen_ch)
+
+    def body(self):
+        """Execute sequence of pulses.
+
+        For each pulses calls the add_pulse_to_register function (if not already registered)
+        before firing it. If the pulse is a readout, it does a measurement and does
+        not wait for the end of it. At the end of the sequence wait for meas and clock.
+        With multiple sequences, the one selected by the sequence register is executed.
+        """
+        self.set_bias("sweetspot")
+
+        if len(self.sequences) > 1:
+            self.execute_selected_sequence()
+        else:
+            self.execute_sequence(self.sequence)
+            self.wait_all()
+        if len(self.resets) > 0:
+            self.active_reset()
+        self.set_bias("zero")
+        self.sync_all(self.relax_delay)
+
+    def declare_sequence_registers(self):
+        """Declare the registers selecting the sequence executed in each shot.
+
+        The first sequence is executed for `self.sequence_block` shots, then
+        the second one and so on, cycling through all of them.
+        """
+        selected, count, _ = SEQUENCE_REGISTERS
+        self.regwi(0, selected, 0)
+        if self.sequence_block > 1:
+            self.regwi(0, count, self.sequence_block - 1)
+
+    def start_sequence_branch(self, idx: int):
+        """Start the branch of a sequence, skipped if it is not the selected one."""
+        selected, _, test = SEQUENCE_REGISTERS
+        if idx > 0:
+            self.label(f"SEQUENCE_{idx}")
+        if idx < len(self.sequences) - 1:
+            self.mathi(0, test, selected, "-", idx)
+            self.condj(0, test, "!=", 0, f"SEQUENCE_{idx + 1}")
+
+    def end_sequence_branch(self, idx: int):
+        """Wait for the end of a sequence and jump after the other branches."""
+        self.wait_all()
+        self.sync_all()
+        if idx < len(self.sequences) - 1:
+            # register 0 is always zero, the jump is unconditional
+            self.condj(0, 0, "==", 0, "SEQUENCE_END")
+
+    def select_next_sequence(self):
+        """Select the sequence of the next shot in the sequence register."""
+        selected, count, test = SEQUENCE_REGISTERS
+        page = 0
+        self.label("SEQUENCE_END")
+        if self.sequence_block > 1:
+            self.condj(page, count, "==", 0, "SEQUENCE_NEXT")
+            self.mathi(page, count, count, "-", 1)
+            self.condj(page, 0, "==", 0, "SEQUENCE_SELECTED")
+            self.label("SEQUENCE_NEXT")
+            self.regwi(page, count, self.sequence_block - 1)
+        self.mathi(page, selected, selected, "+", 1)
+        self.mathi(page, test, selected, "-", len(self.sequences))
+        self.condj(page, test, "!=", 0, "SEQUENCE_SELECTED")
+        self.regwi(page, selected, 0)
+        self.label("SEQUENCE_SELECTED")
+
+    def active_reset(self):
+        """Measure the qubits with an active reset and bring them to the ground state.
+
+        All the reset readouts are fired together, then the tProc waits for
+        their accumulated values and fires the pi pulse of each qubit found in
+        the excited state, comparing the I value with the threshold.
+        """
+        page = 0
+        value, threshold = RESET_REGISTERS
+        self.sync_all()
+        self.measure_resets()
+        self.wait_all(RESET_LATENCY)
+        self.sync_all(2 * RESET_LATENCY)
+
+        for idx, reset in enumerate(self.resets):
+            adc = reset.readout.adc
+            length = self.converter.us2cycles(reset.readout.duration, ro_ch=adc)
+            self.read(self.soccfg["readouts"][adc]["tproc_ch"], page, "lower", value)
+            # the threshold is compared with the I value accumulated over the window
+            self.safe_regwi(page, threshold, int(np.round(reset.threshold * length)))
+            skip = "<" if reset.excited_above else ">"
+            self.condj(page, value, skip, threshold, f"RESET_{idx}")
+            self.add_pulse_to_register(reset.pi_pulse)
+            self.pulse(ch=reset.pi_pulse.dac)
+            self.label(f"RESET_{idx}")
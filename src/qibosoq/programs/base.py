@@ -2,34 +2,53 @@
 
 import logging
 from abc import abstractmethod
-from dataclasses import asdict
-from typing import Dict, List, Tuple, Union
+from dataclasses import asdict, fields
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
 import numpy as np
-from qick import QickProgram, QickSoc
+from qick import QickProgram
 
 import qibosoq.configuration as qibosoq_cfg
 from qibosoq.components.base import Config, Qubit
 from qibosoq.components.pulses import (
     Arbitrary,
-    Drag,
     Element,
     FlatTop,
-    Gaussian,
-    Hann,
     Measurement,
     Pulse,
     Rectangular,
+    group_mux_ro,
 )
+from qibosoq.conversions import converter
+from qibosoq.programs.envelopes import pulse_envelope
+from qibosoq.validation import check_resets
+
+if TYPE_CHECKING:
+    # exported by qick only on the boards, programs can be built from a QickConfig
+    from qick import QickSoc
 
 logger = logging.getLogger(qibosoq_cfg.MAIN_LOGGER_NAME)
 
+ENVELOPE_FIELDS = {"rel_sigma", "beta", "i_values", "q_values"}
+"""Pulse parameters that only change the samples of the envelope."""
+MUX_READOUT_FIELDS = {"frequency", "amplitude"}
+"""Readout parameters set in the generator configuration, for multiplexed readouts."""
+
 
 class BaseProgram(QickProgram):
     """Abstract class for QickPrograms."""
 
+    COMPILED_KEYS: List[str] = []
+    """Attributes needed to acquire the results, dumped with a compiled program."""
+
     def __init__(
-        self, soc: QickSoc, qpcfg: Config, sequence: List[Element], qubits: List[Qubit]
+        self,
+        soc: "QickSoc",
+        qpcfg: Config,
+        sequence: List[Element],
+        qubits: List[Qubit],
+        compiled: Optional[dict] = None,
+        is_mux: Optional[bool] = None,
     ):
         """In this function we define the most important settings.
 
@@ -40,41 +59,148 @@ class BaseProgram(QickProgram):
             * syncdelay (for each measurement) is defined explicitly
             * wait_initialize is defined explicitly
             * super.__init__ (this will init AveragerProgram or RAveragerProgram)
+
+        If `compiled` is given (see `dump_compiled`), the program is loaded from
+        it instead of being generated again.
+        The readout is multiplexed if `is_mux`, by default as configured.
         """
         self.soc = soc
+        self.compiled = compiled
         self.soccfg = soc  # this is used by qick
+        self.converter = converter(soc)
 
         self.sequence = sequence
         self.pulse_sequence = [elem for elem in sequence if isinstance(elem, Pulse)]
         self.qubits = qubits
+        self.resets = [qubit.reset for qubit in qubits if qubit.reset is not None]
+
+        # sequence the program is built for, patched sequences are compared to it
+        self.template = list(sequence)
+        self.envelope_shapes: Dict[Tuple[int, str], List] = {}
 
         # general settings
         self.ro_time_of_flight = qpcfg.ro_time_of_flight
 
         # mux settings
-        self.is_mux = qibosoq_cfg.IS_MULTIPLEXED
+        self.is_mux = qibosoq_cfg.IS_MULTIPLEXED if is_mux is None else is_mux
         self.readouts_per_experiment = len(
-            [elem for elem in self.sequence if elem.type == "readout"]
+            [elem for elem in self.sequences[0] if elem.type == "readout"]
         )
 
+        # active resets replace the relaxation time with their settle time
+        self.reset_reads: Dict[int, int] = {}
+        relaxation_time = qpcfg.relaxation_time
+        if len(self.resets) > 0:
+            self.check_resets()
+            relaxation_time = max(reset.settle_time for reset in self.resets)
+            for reset in self.resets:
+                adc = reset.readout.adc
+                self.reset_reads[adc] = self.reset_reads.get(adc, 0) + 1
+
         # Convert delays into generic clock cycles
-        self.relax_delay = self.us2cycles(qpcfg.relaxation_time)
-        self.syncdelay = self.us2cycles(0)
+        self.relax_delay = self.us2cycles(relaxation_time)
+        self.syncdelay = self.us2cycles(0) if qpcfg.sync_readouts else None
         self.wait_initialize = self.us2cycles(2.0)
 
         self.pulses_registered = False
         self.registered_waveforms: Dict[int, List] = {}
-        for pulse in self.pulse_sequence:
+        reset_pulses = [
+            pulse for reset in self.resets for pulse in (reset.readout, reset.pi_pulse)
+        ]
+        for pulse in self.pulse_sequence + reset_pulses:
             if pulse.dac not in self.registered_waveforms:
                 self.registered_waveforms[pulse.dac] = []
 
+        # ADCs reading the tones of each multiplexed generator
+        self.mux_tones: Dict[int, List[int]] = {}
         if self.is_mux:
             self.multi_ro_pulses = self.group_mux_ro()
-            self.readouts_per_experiment = len(self.multi_ro_pulses)
+            self.readouts_per_experiment = len(self.multi_ro_pulses) // len(
+                self.sequences
+            )
+
+        self.convert_sequence()
 
         # pylint: disable-next=too-many-function-args
         super().__init__(soc, asdict(qpcfg))
 
+    def make_program(self):
+        """Generate the program, or load it if it was already compiled."""
+        self.dump_keys += self.COMPILED_KEYS
+        if self.compiled is None:
+            # implemented by the averager program of the concrete subclasses
+            # pylint: disable-next=no-member
+            super().make_program()
+            return
+        self.load_prog(self.compiled)
+        self.binprog = self.compiled["binprog"]
+
+    def dump_compiled(self) -> dict:
+        """Dump the program, in binary form, with what is needed to execute it.
+
+        The dictionary (encoded with `qick.helpers.NpEncoder`) can be loaded by a
+        program built with the same arguments, that skips the compilation.
+        """
+        self.compile()
+        return {**self.dump_prog(), "binprog": self.binprog}
+
+    @property
+    def sequences(self) -> List[List[Element]]:
+        """Sequences executed by the program, selected in turn for every shot.
+
+        They are the parts of `self.sequence`, that contains all their elements.
+        """
+        return [self.sequence]
+
+    def check_resets(self):
+        """Check that the active resets can be executed by the program.
+
+        See :func:`qibosoq.validation.check_resets`.
+        """
+        check_resets(self.sequence, self.resets, self.is_mux)
+
+    def acquired_buffer(self, idx: int) -> np.ndarray:
+        """Return the accumulated buffer of a readout, without the reset reads.
+
+        The readouts of the active resets are the last ones of every shot.
+        """
+        buffer = self.acc_buf[idx]
+        extra = self.reset_reads.get(list(self.ro_chs)[idx], 0)
+        return buffer[..., : buffer.shape[-2] - extra, :]
+
+    def convert_sequence(self):
+        """Convert durations, phases and frequencies of the whole sequence at once.
+
+        The values are converted with a single call per channel and memoized, so
+        that converting single pulses while building the program is a lookup.
+        """
+        for gen_ch in {pulse.dac for pulse in self.pulse_sequence}:
+            pulses = [pulse for pulse in self.pulse_sequence if pulse.dac == gen_ch]
+            self.converter.us2cycles(
+                [pulse.duration for pulse in pulses], gen_ch=gen_ch
+            )
+            # only drive and non multiplexed readout pulses have frequency and phase
+            pulses = [
+                pulse
+                for pulse in pulses
+                if pulse.type == "drive"
+                or (pulse.type == "readout" and not self.is_mux)
+            ]
+            if len(pulses) == 0 or "n_tones" in self.soccfg["gens"][gen_ch]:
+                continue
+            phases = [pulse.relative_phase for pulse in pulses]
+            self.converter.deg2reg(phases, gen_ch=gen_ch)
+            for adc in {pulse.adc for pulse in pulses}:
+                freqs = [pulse.frequency for pulse in pulses if pulse.adc == adc]
+                self.converter.freq2reg(freqs, gen_ch=gen_ch, ro_ch=adc)
+
+        readouts = [elem for elem in self.sequence if elem.type == "readout"]
+        for adc in {elem.adc for elem in readouts}:
+            durations = [elem.duration for elem in readouts if elem.adc == adc]
+            self.converter.us2cycles(durations, ro_ch=adc)
+        delays = [elem.start_delay for elem in self.sequence]
+        self.converter.us2cycles(delays)
+
     def declare_nqz_zones(self, pulse_sequence: List[Pulse]):
         """Declare nqz zone (1-2) for a given PulseSequence.
 
@@ -101,7 +227,7 @@ class BaseProgram(QickProgram):
             if adc_ch not in adc_ch_already_declared:
                 adc_ch_already_declared.append(adc_ch)
                 # Convert acquisition length into ADC clock cycles
-                length = self.soc.us2cycles(readout.duration, ro_ch=adc_ch)
+                length = self.converter.us2cycles(readout.duration, ro_ch=adc_ch)
 
                 freq = readout.frequency
 
@@ -119,49 +245,23 @@ class BaseProgram(QickProgram):
 
         # assign gain parameter
         gain = int(pulse.amplitude * max_gain)
-        phase = self.deg2reg(pulse.relative_phase, gen_ch=gen_ch)
+        phase = self.converter.deg2reg(pulse.relative_phase, gen_ch=gen_ch)
 
         # pulse freq converted with frequency matching
-        freq = self.soc.freq2reg(pulse.frequency, gen_ch=gen_ch, ro_ch=pulse.adc)
+        freq = self.converter.freq2reg(pulse.frequency, gen_ch=gen_ch, ro_ch=pulse.adc)
 
-        # pulse length converted with DAC CLK
-        us_length = pulse.duration
         # Convert pulse length into DAC clock cycles
-        soc_length = self.soc.us2cycles(us_length, gen_ch=gen_ch)
+        soc_length = self.converter.us2cycles(pulse.duration, gen_ch=gen_ch)
 
         name = pulse.waveform_name
 
         if name is not None and name not in self.registered_waveforms[gen_ch]:
-            if isinstance(pulse, Gaussian):
-                sigma = (soc_length / pulse.rel_sigma) * np.sqrt(2)
-                self.add_gauss(ch=gen_ch, name=name, sigma=sigma, length=soc_length)
-            elif isinstance(pulse, FlatTop):
-                soc_length /= 2  # required for unknown reasons
-                sigma = (soc_length / pulse.rel_sigma) * np.sqrt(2)
-                self.add_gauss(ch=gen_ch, name=name, sigma=sigma, length=soc_length)
-            elif isinstance(pulse, Drag):
-                try:
-                    # For the standard distributed QICK firmware the parameter is in cfg
-                    samps_per_clk = self.soccfg["gens"][gen_ch]["samps_per_clk"]
-                except:
-                    # Otherwise consider full speed DAC, therefore 16 samples
-                    samps_per_clk = 16
-                delta = -samps_per_clk * self.soccfg["gens"][gen_ch]["f_fabric"] / 2
-                sigma = (soc_length / pulse.rel_sigma) * np.sqrt(2)
-                self.add_DRAG(
-                    ch=gen_ch,
-                    name=name,
-                    sigma=sigma,
-                    delta=delta,
-                    alpha=pulse.beta,
-                    length=soc_length,
-                )
-
-            elif isinstance(pulse, Hann):
-                self.add_pulse(gen_ch, name, pulse.i_values(soc_length, max_gain))
-            elif isinstance(pulse, Arbitrary):
-                self.add_pulse(gen_ch, name, pulse.i_values, pulse.q_values)
+            self.add_pulse(gen_ch, name, *self.envelope(pulse))
             self.registered_waveforms[gen_ch].append(name)
+        if isinstance(pulse, FlatTop):
+            # the duration includes the ramps, as for swept durations
+            assert name is not None
+            soc_length -= self.flat_top_ramps(gen_ch, name)
 
         args = {"waveform": name} if name is not None else {}
         if isinstance(pulse, (Rectangular, FlatTop)):
@@ -176,6 +276,103 @@ class BaseProgram(QickProgram):
             **args,
         )
 
+    def flat_top_ramps(self, gen_ch: int, name: str) -> int:
+        """Return the clock cycles of the ramps of a registered flat top pulse.
+
+        The ramps are the two halves of its envelope, without the middle
+        sample of odd envelopes, that qick skips.
+        """
+        envelope = self.envelopes[gen_ch]["envs"][name]["data"]
+        samples_per_clk = self.soccfg["gens"][gen_ch]["samps_per_clk"]
+        return (len(envelope) // samples_per_clk // 2) * 2
+
+    def envelope(self, pulse: Pulse) -> Tuple:
+        """Return the I and Q samples of the envelope of a shaped pulse."""
+        if isinstance(pulse, Arbitrary):
+            return pulse.i_values, pulse.q_values
+        length = self.converter.us2cycles(pulse.duration, gen_ch=pulse.dac)
+        if isinstance(pulse, FlatTop):
+            length /= 2  # required for unknown reasons
+        return pulse_envelope(pulse, length, self.soccfg["gens"][pulse.dac])
+
+    def patch(
+        self, sequence: List[Element], qubits: List[Qubit], soc: "QickSoc"
+    ) -> bool:
+        """Update the compiled program to execute a slightly different sequence.
+
+        Multiplexed readout frequencies and amplitudes are part of the generator
+        and readout configurations, and the envelope parameters (e.g. `rel_sigma`)
+        only change the waveform memory, so they can be updated without building
+        the program again. The patched envelopes are loaded in the board.
+
+        Returns:
+            (bool): False if anything else changed, leaving the program untouched
+        """
+        if qubits != self.qubits or len(sequence) != len(self.template):
+            return False
+
+        envelopes: Dict[Tuple[int, str], Pulse] = {}
+        shapes: Dict[Tuple[int, str], List] = {}
+        for old, new in zip(self.template, sequence):
+            if type(old) is not type(new):
+                return False
+            # swept delays are replaced by registers when the program is built
+            if np.isscalar(old.start_delay) and old.start_delay != new.start_delay:
+                return False
+            changed = {
+                field.name
+                for field in fields(old)
+                if field.compare
+                and getattr(old, field.name) != getattr(new, field.name)
+            }
+            if self.is_mux and new.type == "readout" and changed <= MUX_READOUT_FIELDS:
+                continue
+            if not isinstance(new, Pulse) or old.waveform_name is None:
+                if len(changed) > 0:
+                    return False
+                continue
+            if not changed <= ENVELOPE_FIELDS:
+                return False
+            # the same envelope may be shared by different pulses
+            key = (old.dac, old.waveform_name)
+            shape = [getattr(new, name, None) for name in sorted(ENVELOPE_FIELDS)]
+            if key in shapes and shapes[key] != shape:
+                return False
+            shapes[key] = shape
+            envelopes[key] = new
+            self.envelope_shapes.setdefault(
+                key, [getattr(old, name, None) for name in sorted(ENVELOPE_FIELDS)]
+            )
+
+        samples = {}
+        for key, shape in shapes.items():
+            if shape == self.envelope_shapes[key]:
+                continue
+            gen_ch, name = key
+            i_vals, q_vals = self.envelope(envelopes[key])
+            if len(i_vals) != len(self.envelopes[gen_ch]["envs"][name]["data"]):
+                return False
+            samples[key] = (i_vals, q_vals)
+
+        for (gen_ch, name), (i_vals, q_vals) in samples.items():
+            # replace the envelope in place, at the same address
+            addr = self.envelopes[gen_ch]["envs"][name]["addr"]
+            next_addr = self.envelopes[gen_ch]["next_addr"]
+            self.add_pulse(gen_ch, name, i_vals, q_vals)
+            self.envelopes[gen_ch]["envs"][name]["addr"] = addr
+            self.envelopes[gen_ch]["next_addr"] = next_addr
+            data = self.envelopes[gen_ch]["envs"][name]["data"]
+            soc.load_envelope(gen_ch, data=data.tolist(), addr=addr)
+            self.envelope_shapes[(gen_ch, name)] = shapes[(gen_ch, name)]
+
+        self.sequence = sequence
+        self.pulse_sequence = [elem for elem in sequence if isinstance(elem, Pulse)]
+        if self.is_mux:
+            self.multi_ro_pulses = self.group_mux_ro()
+            self.declare_gen_mux_ro()
+            self.declare_readout_freq()
+        return True
+
     def execute_drive_pulse(self, pulse: Pulse, last_pulse_registered: Dict):
         """Register a drive pulse if needed, then trigger the respective DAC.
 
@@ -210,7 +407,7 @@ class BaseProgram(QickProgram):
                 for idx, mux_time in enumerate(self.multi_ro_pulses)
                 if elem in mux_time
             )
-            self.add_muxed_readout_to_register(self.multi_ro_pulses[idx_mux])
+            gen_chs = self.add_muxed_readout_to_register(self.multi_ro_pulses[idx_mux])
             muxed_ro_executed_indexes.append(idx_mux)
             for ro_pulse in self.multi_ro_pulses[idx_mux]:
                 adcs.append(ro_pulse.adc)
@@ -219,10 +416,11 @@ class BaseProgram(QickProgram):
             if not self.pulses_registered and isinstance(elem, Pulse):
                 self.add_pulse_to_register(elem)
             adcs = [elem.adc]
+            gen_chs = [elem.dac]
 
         if isinstance(elem, Pulse):  #
             self.measure(
-                pulse_ch=elem.dac,
+                pulse_ch=gen_chs,
                 adcs=adcs,
                 adc_trig_offset=self.ro_time_of_flight,
                 wait=False,
@@ -237,8 +435,9 @@ class BaseProgram(QickProgram):
 
     def perform_experiment(
         self,
-        soc: QickSoc,
+        soc: "QickSoc",
         average: bool = False,
+        load_pulses: bool = True,
     ) -> List[List]:
         """Call the acquire function, executing the experiment.
 
@@ -246,6 +445,7 @@ class BaseProgram(QickProgram):
 
         Args:
             average (bool): if true return averaged res, otherwise single shots
+            load_pulses (bool): if false, the envelopes already loaded are reused
         """
         if self.readouts_per_experiment == 0:
             raise RuntimeError("At least an acquisition is required.")
@@ -256,15 +456,28 @@ class BaseProgram(QickProgram):
             soc,
             progress=False,
             readouts_per_experiment=reads,
+            load_pulses=load_pulses,
         )
         if average:
             rounds_buf = self.rounds_buf
             avg = [
-                np.moveaxis(
-                    np.mean([round_d[i] for round_d in rounds_buf], axis=0), -1, 0
-                ).tolist()
+                np.mean([round_d[i] for round_d in rounds_buf], axis=0)
                 for i in range(len(self.ro_chs))
             ]
+            # drop the reads of the active resets, at the end of every shot
+            extras = [self.reset_reads.get(ch, 0) for ch in self.ro_chs]
+            avg = [res[: len(res) - extra] for res, extra in zip(avg, extras)]
+            if len(self.sequences) > 1:
+                # (readouts, sequences, shots of a block, 2) -> (sequences, 2, readouts)
+                avg = [np.transpose(np.mean(res, axis=2), (1, 2, 0)) for res in avg]
+                return [
+                    [
+                        [res[seq][iq].tolist() for res in avg]
+                        for seq in range(len(avg[0]))
+                    ]
+                    for iq in range(2)
+                ]
+            avg = [np.moveaxis(res, -1, 0).tolist() for res in avg]
             return [list(x) for x in zip(*avg)]
 
         # super().acquire function fill buffers used in collect_shots
@@ -279,14 +492,18 @@ class BaseProgram(QickProgram):
             ro_ch = elem.dac
             if adc_ch not in adcs:
                 # Convert acquisition length into ADC clock cycles
-                lengths.append(self.soc.us2cycles(elem.duration, ro_ch=adc_ch))
+                lengths.append(self.converter.us2cycles(elem.duration, ro_ch=adc_ch))
             adcs.append(adc_ch)
 
-        _, adc_count = np.unique(adcs, return_counts=True)
+        # adcs are in the order of their declaration
+        adc_count = [adcs.count(adc) for adc in dict.fromkeys(adcs)]
         tot = []
 
-        for idx, count in enumerate(adc_count.astype(int)):
-            stacked = np.swapaxes(self.acc_buf[idx], 0, 2) / lengths[idx]
+        if len(self.sequences) > 1:
+            return self.collect_interleaved_shots(adc_count, lengths)
+
+        for idx, count in enumerate(adc_count):
+            stacked = np.swapaxes(self.acquired_buffer(idx), 0, 2) / lengths[idx]
             if hasattr(self, "sweep_axes"):
                 stacked = np.moveaxis(stacked, -1, 0)
                 # (adc_channels, number_of_readouts, number_of_points, number_of_shots)
@@ -304,54 +521,94 @@ class BaseProgram(QickProgram):
 
         return tuple(list(x) for x in zip(*tot))  # type: ignore
 
-    def declare_gen_mux_ro(self):
-        """Declare nqz zone for multiplexed readout."""
-        adc_ch_added = []
+    def collect_interleaved_shots(
+        self, adc_count: List[int], lengths: List[int]
+    ) -> Tuple[List, List]:
+        """Return the single shots (i,q) of each interleaved sequence.
 
-        mux_freqs = []
-        mux_gains = []
+        The buffers of interleaved sequences have shape
+        (blocks, sequences, shots of a block, readouts, 2), and `adc_count`
+        counts the readouts of all the sequences.
+        """
+        tot = []
+        for idx, count in enumerate(adc_count):
+            stacked = np.moveaxis(self.acquired_buffer(idx), (1, 4, 3), (0, 1, 2))
+            # (sequences, 2, number_of_readouts, number_of_shots)
+            readouts = count // len(self.sequences)
+            shape = (len(self.sequences), 2, readouts, self.reps)
+            tot.append(stacked.reshape(shape) / lengths[idx])
+
+        return tuple(  # type: ignore
+            [
+                [res[seq][iq].tolist() for res in tot]
+                for seq in range(len(self.sequences))
+            ]
+            for iq in range(2)
+        )
+
+    def declare_gen_mux_ro(self):
+        """Declare the tones and nqz zones of the multiplexed readout generators.
 
-        ro_ch = None
-        zone = 1
+        Every ADC reads a tone of a generator, in the order of the first pulse
+        acquired by the ADC, and a generator can play up to `n_tones` tones.
+        """
+        tones: Dict[int, List[Pulse]] = {}
         for pulse in (pulse for pulse in self.sequence if pulse.type == "readout"):
             if not isinstance(pulse, Pulse):
                 continue
-            adc_ch = pulse.adc
-            ro_ch = pulse.dac
-
-            if adc_ch not in adc_ch_added:
-                adc_ch_added.append(adc_ch)
-                freq = pulse.frequency
-                zone = 1 if freq < self.soccfg["gens"][ro_ch]["fs"] / 2 else 2
-                mux_freqs.append(freq)
-                mux_gains.append(pulse.amplitude)
-
-        if ro_ch is None:
-            return
-
-        self.declare_gen(
-            ch=ro_ch,
-            nqz=zone,
-            mixer_freq=0,
-            mux_freqs=mux_freqs,
-            mux_gains=mux_gains,
-            ro_ch=adc_ch_added[0],
-        )
+            gen_tones = tones.setdefault(pulse.dac, [])
+            if pulse.adc not in (tone.adc for tone in gen_tones):
+                gen_tones.append(pulse)
+
+        self.mux_tones = {
+            ro_ch: [pulse.adc for pulse in gen_tones]
+            for ro_ch, gen_tones in tones.items()
+        }
+        for ro_ch, gen_tones in tones.items():
+            n_tones = self.soccfg["gens"][ro_ch]["n_tones"]
+            if len(gen_tones) > n_tones:
+                raise ValueError(
+                    f"Generator {ro_ch} supports {n_tones} multiplexed tones, "
+                    f"but {len(gen_tones)} were requested"
+                )
+            freq = gen_tones[-1].frequency
+            zone = 1 if freq < self.soccfg["gens"][ro_ch]["fs"] / 2 else 2
+            self.declare_gen(
+                ch=ro_ch,
+                nqz=zone,
+                mixer_freq=0,
+                mux_freqs=[pulse.frequency for pulse in gen_tones],
+                mux_gains=[pulse.amplitude for pulse in gen_tones],
+                ro_ch=gen_tones[0].adc,
+            )
 
-    def add_muxed_readout_to_register(self, ro_pulses: List[Rectangular]):
-        """Register multiplexed pulse before firing it."""
-        # readout amplitude gets divided by len(mask), we are here fixing the values
-        mask = [0, 1, 2]
+    def add_muxed_readout_to_register(self, ro_pulses: List[Element]) -> List[int]:
+        """Register multiplexed pulses before firing them.
 
-        pulse = ro_pulses[0]
-        gen_ch = pulse.dac
-        # Convert pulse length into DAC clock cycles
-        length = self.soc.us2cycles(pulse.duration, gen_ch=gen_ch)
+        Every group enables the same tones of a generator, all the declared
+        ones (at least the first three, as long as the generator has them),
+        so that the amplitude of each tone does not depend on the group.
 
-        if pulse.shape != "rectangular":
-            raise TypeError("Only rectangular pulses can be multiplexed")
+        Returns:
+            (list): the generators to fire
+        """
+        gen_chs = sorted({pulse.dac for pulse in ro_pulses if isinstance(pulse, Pulse)})
+        for gen_ch in gen_chs:
+            pulses = [
+                pulse
+                for pulse in ro_pulses
+                if isinstance(pulse, Pulse) and pulse.dac == gen_ch
+            ]
+            if any(not isinstance(pulse, Rectangular) for pulse in pulses):
+                raise TypeError("Only rectangular pulses can be multiplexed")
 
-        self.set_pulse_registers(ch=gen_ch, style="const", length=length, mask=mask)
+            # readout amplitude gets divided by len(mask), we are here fixing the values
+            n_tones = self.soccfg["gens"][gen_ch]["n_tones"]
+            mask = list(range(min(max(len(self.mux_tones[gen_ch]), 3), n_tones)))
+            # Convert pulse length into DAC clock cycles
+            length = self.converter.us2cycles(pulses[0].duration, gen_ch=gen_ch)
+            self.set_pulse_registers(ch=gen_ch, style="const", length=length, mask=mask)
+        return gen_chs
 
     def group_mux_ro(self) -> list:
         """Create a list containing readout pulses grouped by start time.
@@ -360,31 +617,11 @@ class BaseProgram(QickProgram):
         [[pulse1, pulse2], [pulse3]]
 
         Readout pulses are considered to be correctly organized.
+        The groups of different sequences are never merged.
         """
-        mux_list: List[List[Element]] = []
-        group: List[Element] = []
-
-        for pulse in self.sequence:
-            readout = pulse.type == "readout"
-            if (not readout) or pulse.start_delay != 0:
-                if len(group) > 0:
-                    mux_list.append(group)
-                    group = []
-
-            if readout:
-                group.append(pulse)
-
-        if len(group) > 0:
-            mux_list.append(group)
-
-        # check that all the readout pulses share the same duration
-        for group in mux_list:
-            durations = {pulse.duration for pulse in group}
-            if len(durations) > 1:
-                raise RuntimeError(
-                    f"Muxed readout pulses must share same duration.: {mux_list}"
-                )
-        return mux_list
+        return [
+            group for sequence in self.sequences for group in group_mux_ro(sequence)
+        ]
 
     @abstractmethod
     def initialize(self):
@@ -0,0 +1,155 @@
+"""Process-wide library of the envelopes loaded in the generators.
+
+Envelopes are computed once for each set of parameters (shape, length,
+sample rate and amplitude scale) and then shared by all the programs.
+The cache is bounded in the total number of samples and the least recently
+used envelopes are evicted first. It can be used by more threads at once.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Mapping, Optional, Tuple
+
+import numpy as np
+from qick.helpers import DRAG, gauss
+
+from qibosoq.components.pulses import (
+    Drag,
+    FlatTop,
+    FluxExponential,
+    Gaussian,
+    Hann,
+    Pulse,
+)
+
+Envelope = Tuple[np.ndarray, Optional[np.ndarray]]
+"""I and Q samples of an envelope (Q is None for real envelopes)."""
+
+MAX_SAMPLES = 2**22
+"""Maximum number of samples kept in the library (about 64 MB)."""
+
+
+class EnvelopeLibrary:
+    """Least recently used cache of envelopes, bounded in the number of samples."""
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        """Create an empty library."""
+        self.max_samples = max_samples
+        self.envelopes: "OrderedDict[Hashable, Envelope]" = OrderedDict()
+        self.samples = 0
+        self.hits = 0
+        self.misses = 0
+        # programs are also compiled concurrently, by the threads of the server
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, compute: Callable[[], Envelope]) -> Envelope:
+        """Return the envelope stored with key, computing it if missing.
+
+        The returned arrays are read-only, since they are shared between programs.
+        """
+        with self.lock:
+            if key in self.envelopes:
+                self.hits += 1
+                self.envelopes.move_to_end(key)
+                return self.envelopes[key]
+            self.misses += 1
+
+        envelope = compute()
+        for data in envelope:
+            if data is not None:
+                data.setflags(write=False)
+        length = len(envelope[0])
+        if length > self.max_samples:
+            return envelope
+
+        with self.lock:
+            if key not in self.envelopes:
+                self.envelopes[key] = envelope
+                self.samples += length
+            while self.samples > self.max_samples:
+                _, (evicted, _) = self.envelopes.popitem(last=False)
+                self.samples -= len(evicted)
+        return envelope
+
+    def clear(self):
+        """Remove all the stored envelopes."""
+        with self.lock:
+            self.envelopes.clear()
+            self.samples = 0
+
+
+library = EnvelopeLibrary()
+
+
+def pulse_envelope(pulse: Pulse, length: float, gen: Mapping) -> Envelope:
+    """Return the envelope of a drive or readout pulse.
+
+    Args:
+        pulse: pulse to register, of shape Gaussian, FlatTop, Drag or Hann
+        length: duration of the envelope in generator clock cycles
+        gen: configuration of the generator (from `soccfg["gens"]`)
+    """
+    samples_per_clk = gen.get("samps_per_clk", 16)
+    maxv = int(np.floor(gen["maxv"] * gen["maxv_scale"]))
+    max_gain = int(gen["maxv"])
+
+    def sigma(rel_sigma: float) -> float:
+        # the standard deviation of the samples, in the units of `qick.helpers`
+        return length / rel_sigma * samples_per_clk
+
+    if isinstance(pulse, (Gaussian, FlatTop)):
+        key: Hashable = ("gaussian", length, pulse.rel_sigma, samples_per_clk, maxv)
+
+        def compute() -> Envelope:
+            samples = np.round(length) * samples_per_clk
+            return (
+                gauss(
+                    mu=samples / 2 - 0.5,
+                    si=sigma(pulse.rel_sigma),
+                    length=samples,
+                    maxv=maxv,
+                ),
+                None,
+            )
+
+    elif isinstance(pulse, Drag):
+        key = ("drag", length, pulse.rel_sigma, pulse.beta, samples_per_clk, maxv)
+
+        def compute() -> Envelope:
+            samples = np.round(length) * samples_per_clk
+            return DRAG(
+                mu=samples / 2 - 0.5,
+                si=sigma(pulse.rel_sigma),
+                length=samples,
+                maxv=maxv,
+                delta=-0.5,
+                alpha=pulse.beta,
+                det=0,
+            )
+
+    elif isinstance(pulse, Hann):
+        key = ("hann", length, pulse.amplitude, max_gain)
+
+        def compute() -> Envelope:
+            return pulse.i_values(int(length), max_gain), None
+
+    else:
+        raise NotImplementedError(f"Envelope of {type(pulse).__name__} not supported")
+
+    return library.get(key, compute)
+
+
+def flux_exponential_envelope(
+    pulse: FluxExponential, samples: int, max_gain: int
+) -> np.ndarray:
+    """Return the I samples of an exponential flux pulse."""
+    key = (
+        "fluxexponential",
+        samples,
+        pulse.amplitude,
+        pulse.tau,
+        pulse.upsilon,
+        pulse.weight,
+        max_gain,
+    )
+    return library.get(key, lambda: (pulse.i_values(samples, max_gain), None))[0]
@@ -1,10 +1,9 @@
 """Flux program used by qibosoq to execute sequences and sweeps."""
 
 import logging
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Tuple
 
 import numpy as np
-from qick import QickSoc
 from qick.asm_v1 import QickRegister
 
 import qibosoq.configuration as qibosoq_cfg
@@ -16,97 +15,127 @@ from qibosoq.components.pulses import (
     Pulse,
     Rectangular,
 )
+from qibosoq.layout import (
+    MAX_CONST_LENGTH,
+    MIN_CONST_LENGTH,
+    FluxLayoutMixin,
+    is_const_length,
+)
 from qibosoq.programs.base import BaseProgram
+from qibosoq.programs.envelopes import flux_exponential_envelope
 
-logger = logging.getLogger(qibosoq_cfg.MAIN_LOGGER_NAME)
+if TYPE_CHECKING:
+    from qick import QickSoc
 
+logger = logging.getLogger(qibosoq_cfg.MAIN_LOGGER_NAME)
 
-class FluxProgram(BaseProgram):
-    """Abstract class for flux-tunable qubits programs."""
+held_biases: Dict[int, int] = {}
+"""Gain held by the flux channels of the board, after programs with persistent biases."""
 
-    def __init__(
-        self, soc: QickSoc, qpcfg: Config, sequence: List[Element], qubits: List[Qubit]
-    ):
-        """Define an empty dictionary for bias sweepers and call super().__init__."""
-        self.bias_sweep_registers: Dict[int, Tuple[QickRegister, QickRegister]] = {}
-        super().__init__(soc, qpcfg, sequence, qubits)
 
-    def set_bias(self, mode: str = "sweetspot"):
-        """Set qubits flux lines to a bias level.
+def reset_held_biases():
+    """Forget the biases held by the board, e.g. after resetting the generators."""
+    held_biases.clear()
 
-        Note that this fuction acts only on the qubits used in self.sequence.
-        Args:
-            mode (str): can be 'sweetspot' or 'zero'
-        """
-        duration = 48  # minimum len
 
-        for qubit in self.qubits:
-            # if bias is zero, just skip the qubit
-            if qubit.bias is None or qubit.dac is None or qubit.bias == 0:
-                continue
-
-            flux_ch = qubit.dac
-            max_gain = int(self.soccfg["gens"][flux_ch]["maxv"])
-
-            if mode == "sweetspot":
-                value = max_gain
-            elif mode == "zero":
-                value = 0
-            else:
-                raise NotImplementedError(f"Mode {mode} not supported")
-
-            i_wf = np.full(duration, value)
-            q_wf = np.zeros(len(i_wf))
-            self.add_pulse(flux_ch, f"const_{value}_{flux_ch}", i_wf, q_wf)
-            self.set_pulse_registers(
-                ch=flux_ch,
-                waveform=f"const_{value}_{flux_ch}",
-                style="arb",
-                outsel="input",
-                stdysel="last",
-                freq=0,
-                phase=0,
-                gain=np.trunc(max_gain * qubit.bias).astype(int),
-            )
+class FluxProgram(FluxLayoutMixin, BaseProgram):
+    """Abstract class for flux-tunable qubits programs.
 
-            if flux_ch in self.bias_sweep_registers:
-                swept_reg, non_swept_reg = self.bias_sweep_registers[flux_ch]
-                if mode == "sweetspot":
-                    non_swept_reg.set_to(swept_reg)
-                elif mode == "zero":
-                    non_swept_reg.set_to(0)
+    The instructions shared with the estimator are in `FluxLayoutMixin`.
+    """
 
-            self.pulse(ch=flux_ch)
-        self.sync_all(50)  # wait all pulses are fired + 50 clks
+    def __init__(
+        self,
+        soc: "QickSoc",
+        qpcfg: Config,
+        sequence: List[Element],
+        qubits: List[Qubit],
+        compiled: Optional[dict] = None,
+        held: Optional[Mapping[int, int]] = None,
+        is_mux: Optional[bool] = None,
+    ):
+        """Define empty dictionaries for the registers of sweepers and call super().__init__.
 
-    def find_qubit_sweetspot(self, pulse: Pulse) -> float:
-        """Return bias of a qubit from flux pulse."""
-        for qubit in self.qubits:
-            if pulse.dac == qubit.dac:
-                return qubit.bias if qubit.bias else 0
-        return 0.0
+        The gains held by the flux channels before the program are `held`,
+        by default the ones tracked for the board in `held_biases`.
+        """
+        self.bias_sweep_registers: Dict[int, Tuple[QickRegister, QickRegister]] = {}
+        self.duration_shift_registers: Dict[int, QickRegister] = {}
+        self.flux_sweep_registers: Dict[int, QickRegister] = {}
+        self.persistent_bias = qpcfg.persistent_bias
+        self.held_before = dict(held_biases if held is None else held)
+        self.held_after: Optional[Dict[int, int]] = None
+        """Gains held after the program, None if it does not set them."""
+        self.sequence_block = qpcfg.interleave_block
+        """Consecutive shots of each sequence, if more are interleaved."""
+        super().__init__(soc, qpcfg, sequence, qubits, compiled, is_mux)
+
+    def is_bias_swept(self, flux_ch: int) -> bool:
+        """Check if the bias of a flux channel is swept."""
+        return flux_ch in self.bias_sweep_registers
+
+    def set_swept_bias(self, flux_ch: int, mode: str):
+        """Set the gain registered for a bias from its swept register, or to zero."""
+        swept_reg, non_swept_reg = self.bias_sweep_registers[flux_ch]
+        if mode == "sweetspot":
+            non_swept_reg.set_to(swept_reg)
+        elif mode == "zero":
+            non_swept_reg.set_to(0)
+
+    def update_held_biases(self):
+        """Record the biases held by the board, after the program is executed.
+
+        Programs loaded already compiled do not set the biases, and leave the
+        record untouched.
+        """
+        if self.held_after is None:
+            return
+        reset_held_biases()
+        held_biases.update(self.held_after)
+
+    def execute_flux_pulse(self, pulse: Pulse, index: Optional[int] = None):
+        """Fire a fast flux pulse the starts and ends in sweetspot.
+
+        Rectangular pulses are fired as a constant pulse, that does not use
+        envelope memory, followed by a short edge waveform that ends with a
+        clock cycle of sweetspot.
+        Other shapes (and rectangular pulses too long for a single constant
+        pulse) are loaded as arbitrary waveforms.
+        Pulses with a swept amplitude or bias are fired with
+        `execute_swept_flux_pulse`.
 
-    def execute_flux_pulse(self, pulse: Pulse):
-        """Fire a fast flux pulse the starts and ends in sweetspot."""
+        Args:
+            pulse: flux pulse to fire
+            index: index of the pulse in the sequence
+        """
         gen_ch = pulse.dac
+        swept_amp = None if index is None else self.flux_sweep_registers.get(index)
+        if swept_amp is not None or gen_ch in self.bias_sweep_registers:
+            self.execute_swept_flux_pulse(pulse, swept_amp)
+            return
+
         max_gain = int(self.soccfg["gens"][gen_ch]["maxv"])
-        bias = self.find_qubit_sweetspot(pulse)
-        sweetspot = np.trunc(bias * max_gain).astype(int)
+        sweetspot = self.flux_gain(gen_ch, self.find_qubit_sweetspot(pulse))
 
-        duration = self.soc.us2cycles(pulse.duration, gen_ch=gen_ch)
+        duration = self.converter.us2cycles(pulse.duration, gen_ch=gen_ch)
         try:
             # For the standard distributed QICK firmware the parameter is in cfg
             samples_per_clk = self._gen_mgrs[gen_ch].samps_per_clk
         except:
             # Otherwise consider full speed DAC, therefore 16 samples
             samples_per_clk = 16
+
+        plateau = self.flux_plateau(pulse)
+        if plateau is not None:
+            self.execute_const_flux_pulse(pulse, plateau, samples_per_clk)
+            return
+
         duration *= samples_per_clk  # the duration here is expressed in samples
 
         if isinstance(pulse, Rectangular):
-            amp = np.trunc(pulse.amplitude * max_gain).astype(int)
-            i_vals = np.full(duration, amp)
+            i_vals = np.full(duration, self.flux_gain(gen_ch, pulse.amplitude))
         elif isinstance(pulse, FluxExponential):
-            i_vals = pulse.i_values(duration, max_gain)
+            i_vals = flux_exponential_envelope(pulse, duration, max_gain)
         elif isinstance(pulse, Arbitrary):
             i_vals = np.array(pulse.i_values)
             logger.info("Arbitrary shaped flux pulse. q_vals will be ignored.")
@@ -123,17 +152,44 @@ class FluxProgram(BaseProgram):
             raise ValueError("Flux pulse got amplitude > 1")
 
         self.add_pulse(gen_ch, pulse.name, i_vals, q_vals)
-        self.set_pulse_registers(
-            ch=gen_ch,
-            waveform=pulse.name,
-            style="arb",
-            outsel="input",
-            stdysel="last",
-            freq=0,
-            phase=0,
-            gain=max_gain,
-        )
+        self.set_arb_registers(gen_ch, pulse.name)
+        self.pulse(ch=gen_ch)
+
+    def execute_swept_flux_pulse(
+        self, pulse: Pulse, swept_amp: Optional[QickRegister] = None
+    ):
+        """Fire a rectangular flux pulse whose amplitude or bias is swept.
+
+        The gain is computed in the tProc from the swept registers, adding
+        the amplitude to the sweetspot (swept or not), then the pulse is
+        followed by a constant pulse at sweetspot, that is held by the channel.
 
+        Args:
+            pulse: flux pulse to fire
+            swept_amp: register with the swept amplitude, if any
+        """
+        gen_ch = pulse.dac
+        duration = self.converter.us2cycles(pulse.duration, gen_ch=gen_ch)
+        if not isinstance(pulse, Rectangular) or not is_const_length(duration):
+            raise NotImplementedError(
+                "Only rectangular flux pulses between "
+                f"{MIN_CONST_LENGTH} and {MAX_CONST_LENGTH} clock cycles can be swept."
+            )
+        sweetspot = self.flux_gain(gen_ch, self.find_qubit_sweetspot(pulse))
+        amp = self.flux_gain(gen_ch, pulse.amplitude)
+        gain = self.get_gen_reg(gen_ch, "gain")
+        swept_bias = self.bias_sweep_registers.get(gen_ch, (None, None))[0]
+
+        self.set_const_registers(gen_ch, amp + sweetspot, duration)
+        if swept_amp is not None:
+            gain.set_to(swept_amp, "+", sweetspot if swept_bias is None else swept_bias)
+        else:
+            gain.set_to(swept_bias, "+", amp)
+        self.pulse(ch=gen_ch)
+
+        self.set_bias_registers(gen_ch, sweetspot)
+        if swept_bias is not None:
+            gain.set_to(swept_bias)
         self.pulse(ch=gen_ch)
 
     def declare_nqz_flux(self):
@@ -145,26 +201,24 @@ class FluxProgram(BaseProgram):
                 if not is_ch_mux:
                     self.declare_gen(flux_ch, nqz=1)
 
-    def body(self):
-        """Execute sequence of pulses.
+    def execute_sequence(self, sequence: List[Element], offset: int = 0):
+        """Fire the elements of a sequence, timed by their start delays.
 
-        For each pulses calls the add_pulse_to_register function (if not already registered)
-        before firing it. If the pulse is a readout, it does a measurement and does
-        not wait for the end of it. At the end of the sequence wait for meas and clock.
+        Args:
+            sequence: elements to execute
+            offset: index of the first element in `self.sequence`
         """
         # in the form of {dac_number_0: last_pulse_of_dac_0, ...}
-        last_pulse_registered = {}
-        muxed_pulses_executed = []
-        muxed_ro_executed_indexes = []
-
-        self.set_bias("sweetspot")
+        last_pulse_registered: Dict[int, Pulse] = {}
+        muxed_pulses_executed: List[Element] = []
+        muxed_ro_executed_indexes: List[int] = []
 
-        for elem in self.sequence:
+        for idx, elem in enumerate(sequence, start=offset):
             # wait the needed wait time so that the start is timed correctly
             if isinstance(elem.start_delay, QickRegister):
                 self.sync(elem.start_delay.page, elem.start_delay.addr)
             else:  # assume is number
-                delay_start = self.soc.us2cycles(elem.start_delay)
+                delay_start = self.converter.us2cycles(elem.start_delay)
                 if delay_start != 0:
                     self.synci(delay_start)
 
@@ -177,18 +231,59 @@ class FluxProgram(BaseProgram):
                 self.execute_drive_pulse(elem, last_pulse_registered)
             elif elem.type == "flux":
                 assert isinstance(elem, Pulse)
-                self.execute_flux_pulse(elem)
+                self.execute_flux_pulse(elem, idx)
 
-        self.wait_all()
-        self.set_bias("zero")
-        self.sync_all(self.relax_delay)
+            if idx in self.duration_shift_registers:
+                # the duration of the element is swept
+                shift = self.duration_shift_registers[idx]
+                self.sync(shift.page, shift.addr)
+
+    def execute_selected_sequence(self):
+        """Execute the sequence selected by the sequence register.
+
+        Every sequence is a branch of the program, that starts from the same
+        timestamps and ends at the end of its pulses, so that the following
+        instructions are timed in the same way after any of them.
+        The register then selects the sequence of the next shot.
+        """
+        gen_ts = [
+            self.get_timestamp(gen_ch=ch) for ch in range(len(self.soccfg["gens"]))
+        ]
+        ro_ts = [
+            self.get_timestamp(ro_ch=ch) for ch in range(len(self.soccfg["readouts"]))
+        ]
+
+        offset = 0
+        for idx, sequence in enumerate(self.sequences):
+            for ch, timestamp in enumerate(gen_ts):
+                self.set_timestamp(timestamp, gen_ch=ch)
+            for ch, timestamp in enumerate(ro_ts):
+                self.set_timestamp(timestamp, ro_ch=ch)
+            self.start_sequence_branch(idx)
+            self.execute_sequence(sequence, offset)
+            self.end_sequence_branch(idx)
+            offset += len(sequence)
+        self.select_next_sequence()
+
+    def measure_resets(self):
+        """Fire the readouts of the active resets together, without waiting for them."""
+        for reset in self.resets:
+            self.add_pulse_to_register(reset.readout)
+            self.measure(
+                pulse_ch=[reset.readout.dac],
+                adcs=[reset.readout.adc],
+                adc_trig_offset=self.ro_time_of_flight,
+                wait=False,
+                syncdelay=None,
+            )
 
     def declare_zones_and_ro(self, sequence: List[Pulse]):
         """Declare all nqz zones and readout frequencies.
 
         Declares drives, fluxes and readout (mux or not) and readout freq.
         """
-        self.declare_nqz_zones([pulse for pulse in sequence if pulse.type == "drive"])
+        drives = [pulse for pulse in sequence if pulse.type == "drive"]
+        self.declare_nqz_zones(drives + [reset.pi_pulse for reset in self.resets])
         self.declare_nqz_flux()
         if self.is_mux:
             self.declare_gen_mux_ro()
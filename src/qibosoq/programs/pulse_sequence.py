@@ -1,15 +1,19 @@
 """Program used by qibosoq to execute sequences."""
 
 import logging
-from typing import List
+from dataclasses import replace
+from typing import TYPE_CHECKING, List, Mapping, Optional
 
-from qick import AveragerProgram, QickSoc
+from qick import AveragerProgram
 
 import qibosoq.configuration as qibosoq_cfg
 from qibosoq.components.base import Config, Qubit
-from qibosoq.components.pulses import Element
+from qibosoq.components.pulses import Element, group_mux_ro
 from qibosoq.programs.flux import FluxProgram
 
+if TYPE_CHECKING:
+    from qick import QickSoc
+
 logger = logging.getLogger(qibosoq_cfg.MAIN_LOGGER_NAME)
 
 
@@ -18,13 +22,16 @@ class ExecutePulseSequence(FluxProgram, AveragerProgram):
 
     def __init__(
         self,
-        soc: QickSoc,
+        soc: "QickSoc",
         qpcfg: Config,
         sequence: List[Element],
         qubits: List[Qubit],
+        compiled: Optional[dict] = None,
+        held: Optional[Mapping[int, int]] = None,
+        is_mux: Optional[bool] = None,
     ):
         """Init function, call super.__init__."""
-        super().__init__(soc, qpcfg, sequence, qubits)
+        super().__init__(soc, qpcfg, sequence, qubits, compiled, held, is_mux)
 
         self.reps = qpcfg.reps  # must be done after AveragerProgram init
         self.soft_avgs = qpcfg.soft_avgs
@@ -35,4 +42,85 @@ class ExecutePulseSequence(FluxProgram, AveragerProgram):
         Function called by AveragerProgram.__init__.
         """
         self.declare_zones_and_ro(self.pulse_sequence)
+        self.hold_bias()
         self.sync_all(self.wait_initialize)
+
+
+class ExecuteSequences(ExecutePulseSequence):
+    """Class to execute multiple PulseSequences in a single program.
+
+    The sequences are interleaved: every shot executes one of them, selected by
+    a tProc register, cycling through all the sequences every
+    `Config.interleave_block` shots. Each sequence is executed `Config.reps`
+    times and the results are returned for each sequence.
+    """
+
+    def __init__(
+        self,
+        soc: "QickSoc",
+        qpcfg: Config,
+        sequences: List[List[Element]],
+        qubits: List[Qubit],
+        compiled: Optional[dict] = None,
+        held: Optional[Mapping[int, int]] = None,
+        is_mux: Optional[bool] = None,
+    ):
+        """Check that the sequences can be interleaved and build the program."""
+        if is_mux is None:
+            is_mux = qibosoq_cfg.IS_MULTIPLEXED
+        block = qpcfg.interleave_block
+        if block < 1 or qpcfg.reps % block != 0:
+            raise ValueError(
+                f"The number of shots ({qpcfg.reps}) must be a multiple "
+                f"of the interleaved block ({block})"
+            )
+        acquisitions = [self.acquisitions(sequence, is_mux) for sequence in sequences]
+        if any(acq != acquisitions[0] for acq in acquisitions):
+            raise ValueError(
+                "Interleaved sequences must acquire the same number of times "
+                "with each ADC"
+            )
+
+        self.interleaved = sequences
+        sequence = [elem for sequence in sequences for elem in sequence]
+        total = replace(qpcfg, reps=qpcfg.reps * len(sequences))
+        super().__init__(soc, total, sequence, qubits, compiled, held, is_mux)
+
+        self.reps = qpcfg.reps
+        # shots are acquired in blocks of consecutive shots of each sequence
+        self.setup_acquire(
+            counter_addr=self.COUNTER_ADDR,
+            loop_dims=[qpcfg.reps // block, len(sequences), block],
+            avg_level=0,
+        )
+        adcs = [elem.adc for elem in sequences[0] if elem.type == "readout"]
+        self.set_reads_per_shot(
+            [adcs.count(adc) + self.reset_reads.get(adc, 0) for adc in self.ro_chs]
+        )
+
+    @property
+    def sequences(self) -> List[List[Element]]:
+        """Interleaved sequences."""
+        return self.interleaved
+
+    @staticmethod
+    def acquisitions(sequence: List[Element], is_mux: bool) -> List[int]:
+        """Return the ADCs acquiring in a sequence, once per acquisition.
+
+        Multiplexed readouts acquire with all the ADCs in every group of
+        simultaneous readouts, so only the number of groups is returned.
+        """
+        if is_mux:
+            return [len(group_mux_ro(sequence))]
+        return sorted(elem.adc for elem in sequence if elem.type == "readout")
+
+    def initialize(self):
+        """Declare the channels and the registers selecting the sequences."""
+        super().initialize()
+        self.declare_sequence_registers()
+
+    def patch(
+        self, sequence: List[Element], qubits: List[Qubit], soc: "QickSoc"
+    ) -> bool:
+        """Interleaved programs are always built again."""
+        return False
@@ -1,15 +1,30 @@
 """Program used by qibosoq to execute sweeps."""
 
 import logging
-from typing import Iterable, List, Union
+from typing import TYPE_CHECKING, Iterable, List, Mapping, Optional, Union
 
-from qick import NDAveragerProgram, QickSoc
-from qick.averager_program import QickSweep, merge_sweeps
+import numpy as np
+from qick import NDAveragerProgram
+from qick.asm_v1 import InterpolatedGenManager, QickRegister
+from qick.averager_program import AbsQickSweep, QickSweep, merge_sweeps
 
 import qibosoq.configuration as qibosoq_cfg
 from qibosoq.components.base import Config, Parameter, Qubit, Sweeper
-from qibosoq.components.pulses import Element
+from qibosoq.components.pulses import (
+    Element,
+    FlatTop,
+    Pulse,
+    Rectangular,
+)
+from qibosoq.conversions import swept_cycles
+from qibosoq.estimator import POINTS_ADDRESS
+from qibosoq.layout import is_const_length
+from qibosoq.programs.envelopes import pulse_envelope
 from qibosoq.programs.flux import FluxProgram
+from qibosoq.validation import validate_sweeper
+
+if TYPE_CHECKING:
+    from qick import QickSoc
 
 logger = logging.getLogger(qibosoq_cfg.MAIN_LOGGER_NAME)
 
@@ -24,54 +39,129 @@ def reversed_sweepers(sweepers: Union[Sweeper, Iterable[Sweeper]]) -> List[Sweep
     return list(reversed(sweepers))  # type: ignore
 
 
+class PointSweep(AbsQickSweep):
+    """Sweep of a register over a list of values, stored in the tProc data memory.
+
+    A pointer register goes through the addresses of the values, which are
+    loaded in the swept register at the beginning of every point.
+    """
+
+    def __init__(
+        self,
+        prog: "ExecuteSweeps",
+        reg: QickRegister,
+        pointer: QickRegister,
+        address: int,
+        values: np.ndarray,
+    ):
+        """Define the sweep of `reg` over the values stored from `address`."""
+        super().__init__(prog, label=reg.name)
+        self.reg = reg
+        self.pointer = pointer
+        self.address = address
+        self.values = values
+        self.expts = len(values)
+
+    def get_sweep_pts(self) -> np.ndarray:
+        """Return the swept values."""
+        return self.values
+
+    def load(self):
+        """Load the value pointed by the pointer register in the swept register."""
+        self.prog.memr(self.reg.page, self.reg.addr, self.pointer.addr)
+
+    def update(self):
+        """Move to the next value."""
+        self.pointer.set_to(self.pointer, "+", 1, physical_unit=False)
+        self.load()
+
+    def reset(self):
+        """Move to the first value."""
+        self.pointer.set_to(self.address, physical_unit=False)
+        self.load()
+
+
 class ExecuteSweeps(FluxProgram, NDAveragerProgram):
     """Class to execute arbitrary PulseSequences with a single sweep."""
 
+    COMPILED_KEYS = ["point_table", "sweep_axes"]
+
     def __init__(
         self,
-        soc: QickSoc,
+        soc: "QickSoc",
         qpcfg: Config,
         sequence: List[Element],
         qubits: List[Qubit],
         *sweepers: Sweeper,
+        compiled: Optional[dict] = None,
+        held: Optional[Mapping[int, int]] = None,
+        is_mux: Optional[bool] = None,
     ):
         """Init function, sets sweepers parameters before calling super.__init__."""
+        if any(qubit.reset is not None for qubit in qubits):
+            raise NotImplementedError("Active reset is not supported with sweepers.")
         self.sweepers = reversed_sweepers(sweepers)
-        super().__init__(soc, qpcfg, sequence, qubits)
+        self.point_table: List[int] = []
+        super().__init__(soc, qpcfg, sequence, qubits, compiled, held, is_mux)
 
         self.reps = qpcfg.reps  # must be done after NDAveragerProgram init
         self.soft_avgs = qpcfg.soft_avgs
 
     def validate(self, sweeper: Sweeper):
-        """Check if a sweeper is valid.
-
-        In particular, it raises an error if:
-            - sweeper is on bias, but not enough information has been given with the qubit
-            - sweeper is on bias wih flux pulses in the sequence
-            - sweeper is on flux pulses
-            - sweeper is on duration
-            - sweeper has pulse paramaters and bias
+        """Check if a sweeper is valid, see :func:`qibosoq.validation.validate_sweeper`."""
+        validate_sweeper(
+            sweeper, self.sequence, self.qubits, self.sweepers, self.is_mux
+        )
+
+    def new_sweep(
+        self,
+        gen_ch: int,
+        register: QickRegister,
+        sweeper: Sweeper,
+        idx: int,
+        scale: Optional[int] = None,
+    ) -> AbsQickSweep:
+        """Generate the sweep of a register for a parameter of a sweeper.
+
+        Linear sweeps increment the register, while the values of point-list
+        sweeps are stored in the tProc data memory and loaded from there.
+
+        Args:
+            gen_ch: generator on whose register page the sweep is done
+            register: register to sweep
+            sweeper: single qibolab sweeper object to register
+            idx: index of the parameter in the sweeper
+            scale: if given, values are multiplied by scale and truncated
+                (e.g. amplitudes to gains)
         """
-        for idx, par in enumerate(sweeper.parameters):
-            if par is Parameter.BIAS:
-                if any(pulse.type == "flux" for pulse in self.sequence):
-                    raise NotImplementedError(
-                        "Sweepers on bias are not compatible with flux pulses."
-                    )
-                if any(par is not Parameter.BIAS for par in sweeper.parameters):
-                    raise NotImplementedError(
-                        "Sweepers on bias cannot be swept at the same time with other sweepers."
-                    )
-                qubit = self.qubits[sweeper.indexes[idx]]
-                if qubit.dac is None or qubit.bias is None:
-                    raise ValueError(f"Bias swept qubit had incomplete values: {qubit}")
-            elif par is Parameter.DURATION:
-                raise NotImplementedError("Sweepers on duration are not implemented.")
-            else:
-                if self.sequence[sweeper.indexes[idx]].type == "flux":
-                    raise NotImplementedError(
-                        "Sweepers on flux pulses are not implemented."
-                    )
+
+        def scaled(values):
+            return values if scale is None else (values * scale).astype(int)
+
+        if sweeper.values is None:
+            return QickSweep(
+                self,
+                register,  # sweeper_register
+                scaled(sweeper.starts)[idx],  # start
+                scaled(sweeper.stops)[idx],  # stop
+                sweeper.expts,  # number of points
+            )
+
+        values = scaled(sweeper.values[idx])
+        address = POINTS_ADDRESS + len(self.point_table)
+        dmem_size = self.soccfg["tprocs"][0]["dmem_size"]
+        if address + len(values) > dmem_size:
+            raise MemoryError(
+                f"The tproc has a data memory of {dmem_size} words, "
+                "not enough for the values of the point-list sweepers"
+            )
+        # register values are stored as 32-bit signed words
+        words = [
+            int(np.int32(np.uint32(register.val2reg(val) % 2**32))) for val in values
+        ]
+        self.point_table.extend(words)
+        pointer = self.new_gen_reg(gen_ch, name=f"{register.name}_pointer")
+        return PointSweep(self, register, pointer, address, values)
 
     def add_sweep_info_bias(self, sweeper: Sweeper) -> List[Sweeper]:
         """Generate RfsocSweep objects for biases.
@@ -90,19 +180,128 @@ class ExecuteSweeps(FluxProgram, NDAveragerProgram):
             self.bias_sweep_registers[gen_ch] = (swept_register, std_register)
 
             max_gain = int(self.soccfg["gens"][gen_ch]["maxv"])
-            starts = (sweeper.starts * max_gain).astype(int)
-            stops = (sweeper.stops * max_gain).astype(int)
-
-            new_sweep = QickSweep(
-                self,
-                swept_register,  # sweeper_register
-                starts[idx],  # start
-                stops[idx],  # stop
-                sweeper.expts,  # number of points
+            new_sweep = self.new_sweep(
+                gen_ch, swept_register, sweeper, idx, scale=max_gain
             )
             sweep_list.append(new_sweep)
         return sweep_list
 
+    def add_sweep_info_duration(
+        self, index: int, start: float, stop: float, expts: int
+    ) -> List[QickSweep]:
+        """Generate RfsocSweep objects for the duration of a pulse.
+
+        The duration is swept with a step of an integer number of clock cycles.
+        Rectangular and FlatTop pulses sweep the length of the constant
+        (flat) segment, the duration of FlatTop pulses including their ramps
+        as for the static ones, while for the other shapes a bank of envelopes, one for
+        each duration, is loaded and the waveform address is swept as well.
+        The elements following the pulse are delayed by the change in duration.
+
+        Args:
+            index: index of the swept pulse in the sequence
+            start: first duration (us)
+            stop: last duration (us)
+            expts: number of points
+        """
+        pulse = self.sequence[index]
+        assert isinstance(pulse, Pulse)
+        gen_ch = pulse.dac
+        manager = self._gen_mgrs[gen_ch]
+        lengths = swept_cycles(
+            self.converter.us2cycles(start, gen_ch=gen_ch),
+            self.converter.us2cycles(stop, gen_ch=gen_ch),
+            expts,
+        )
+        step = int(lengths[-1] - lengths[0]) // max(expts - 1, 1)
+
+        def linear_sweep(register: QickRegister, first: int, step: int) -> QickSweep:
+            return QickSweep(self, register, first, first + step * (expts - 1), expts)
+
+        if isinstance(pulse, Rectangular):
+            segments = lengths
+            mode = {"outsel": "dds"}
+        elif isinstance(pulse, FlatTop):
+            if isinstance(manager, InterpolatedGenManager):
+                raise NotImplementedError(
+                    "Sweepers on the duration of FlatTop pulses are not implemented "
+                    "for interpolated generators."
+                )
+            assert pulse.waveform_name is not None
+            segments = lengths - self.flat_top_ramps(gen_ch, pulse.waveform_name)
+            mode = {"mode": "oneshot", "outsel": "dds"}
+        else:
+            segments = lengths
+            mode = {}
+        if not (is_const_length(segments[0]) and is_const_length(segments[-1])):
+            raise ValueError(
+                f"Swept durations of pulse {pulse.name} are out of range "
+                f"({lengths[0]} to {lengths[-1]} clock cycles)."
+            )
+
+        code = manager.get_mode_code(length=int(segments[0]), **mode)
+        sweeps = [linear_sweep(self.get_gen_reg(gen_ch, "mode"), code, step)]
+        if not isinstance(pulse, (Rectangular, FlatTop)):
+            addresses = self.add_envelope_bank(index, lengths)
+            sweeps.append(
+                linear_sweep(
+                    self.get_gen_reg(gen_ch, "addr"),
+                    addresses[0],
+                    addresses[1] - addresses[0] if expts > 1 else 0,
+                )
+            )
+
+        # delay the following elements by the change in duration (rounded up)
+        ratio = (
+            self.soccfg["tprocs"][0]["f_time"] / self.soccfg["gens"][gen_ch]["f_fabric"]
+        )
+        registered = manager.next_pulse["length"]
+        shift = self.new_gen_reg(gen_ch, name=f"shift_{index}", tproc_reg=True)
+        self.duration_shift_registers[index] = shift
+        sweeps.append(
+            linear_sweep(
+                shift,
+                int(np.ceil((lengths[0] - registered) * ratio)),
+                int(np.ceil(step * ratio)),
+            )
+        )
+        return sweeps
+
+    def add_envelope_bank(self, index: int, lengths: np.ndarray) -> List[int]:
+        """Load the envelopes of a shaped pulse for each swept length.
+
+        The envelopes are padded to the longest one, so that they are stored
+        at equally spaced addresses, which are returned (in clock cycles).
+        """
+        pulse = self.sequence[index]
+        assert isinstance(pulse, Pulse)
+        gen_ch = pulse.dac
+        gencfg = self.soccfg["gens"][gen_ch]
+        samples_per_clk = gencfg["samps_per_clk"]
+        samples = int(max(lengths)) * samples_per_clk
+        gain = int(pulse.amplitude * int(gencfg["maxv"]))
+        offset = (
+            gain << 16
+            if isinstance(self._gen_mgrs[gen_ch], InterpolatedGenManager)
+            else 0
+        )
+
+        addresses = []
+        for point, length in enumerate(lengths):
+            i_vals, q_vals = pulse_envelope(pulse, length, gencfg)
+            padding = (0, samples - len(i_vals))
+            name = f"duration_sweep_{index}_{point}"
+            self.add_pulse(
+                gen_ch,
+                name,
+                np.pad(i_vals, padding),
+                None if q_vals is None else np.pad(q_vals, padding),
+            )
+            self.registered_waveforms[gen_ch].append(name)
+            address = self.envelopes[gen_ch]["envs"][name]["addr"] // samples_per_clk
+            addresses.append(offset + address)
+        return addresses
+
     def add_sweep_info(self, sweeper: Sweeper):
         """Register RfsocSweep objects.
 
@@ -119,36 +318,60 @@ class ExecuteSweeps(FluxProgram, NDAveragerProgram):
 
         sweep_list = []
         for idx, jdx in enumerate(sweeper.indexes):
+            if sweeper.parameters[idx] is Parameter.DURATION:
+                sweep_list.extend(
+                    self.add_sweep_info_duration(
+                        jdx, sweeper.starts[idx], sweeper.stops[idx], sweeper.expts
+                    )
+                )
+                continue
+
             pulse = self.sequence[jdx]
             gen_ch = pulse.dac
 
             sweep_type = sweeper.parameters[idx].value
             register = self.get_gen_reg(gen_ch, sweep_type)
 
+            scale = None
             if sweeper.parameters[idx] is Parameter.AMPLITUDE:
-                max_gain = int(self.soccfg["gens"][gen_ch]["maxv"])
-                starts = (sweeper.starts * max_gain).astype(int)
-                stops = (sweeper.stops * max_gain).astype(int)
-            else:
-                starts = sweeper.starts
-                stops = sweeper.stops
-                if sweeper.parameters[idx] is Parameter.DELAY:
-                    # define a new register for the delay
-                    register = self.new_gen_reg(gen_ch, reg_type="time", tproc_reg=True)
-                    pulse.start_delay = register
-
-            new_sweep = QickSweep(
-                self,
-                register,  # sweeper_register
-                starts[idx],  # start
-                stops[idx],  # stop
-                sweeper.expts,  # number of points
+                scale = int(self.soccfg["gens"][gen_ch]["maxv"])
+                if pulse.type == "flux":
+                    # the sweetspot is added when the pulse is fired
+                    register = self.new_gen_reg(gen_ch, name=f"sweep_flux_{jdx}")
+                    self.flux_sweep_registers[jdx] = register
+            elif sweeper.parameters[idx] is Parameter.DELAY:
+                # define a new register for the delay
+                register = self.new_gen_reg(gen_ch, reg_type="time", tproc_reg=True)
+                pulse.start_delay = register
+
+            sweep_list.append(
+                self.new_sweep(gen_ch, register, sweeper, idx, scale=scale)
             )
-            sweep_list.append(new_sweep)
 
         merged = merge_sweeps(sweep_list)
         self.add_sweep(merged)
 
+    def config_all(self, soc: "QickSoc", *args, **kwargs):
+        """Load the program, and the values of point-list sweeps in the data memory."""
+        super().config_all(soc, *args, **kwargs)
+        if len(self.point_table) > 0:
+            soc.load_mem(self.point_table, mem_sel="dmem", addr=POINTS_ADDRESS)
+
+    def patch(
+        self, sequence: List[Element], qubits: List[Qubit], soc: "QickSoc"
+    ) -> bool:
+        """Update the compiled program, unless pulses with swept durations changed.
+
+        The envelopes of those pulses are loaded in banks when the program is built.
+        """
+        if len(sequence) != len(self.template):
+            return False
+        for sweeper in self.sweepers:
+            for par, idx in zip(sweeper.parameters, sweeper.indexes):
+                if par is Parameter.DURATION and sequence[idx] != self.template[idx]:
+                    return False
+        return super().patch(sequence, qubits, soc)
+
     def initialize(self):
         """Declre nyquist zones for all the DACs and all the readout frequencies.
 
@@ -161,6 +384,9 @@ class ExecuteSweeps(FluxProgram, NDAveragerProgram):
             if self.is_mux:
                 if pulse.type != "drive":
                     continue
+            if pulse.type == "flux":
+                # flux pulses are set when they are fired
+                continue
             self.add_pulse_to_register(pulse)
 
         for sweeper in self.sweepers:
@@ -170,4 +396,5 @@ class ExecuteSweeps(FluxProgram, NDAveragerProgram):
             swept_reg, non_swept_reg = registers
             non_swept_reg.set_to(swept_reg)
 
+        self.hold_bias()
         self.sync_all(self.wait_initialize)
@@ -1,64 +1,171 @@
 """Qibosoq server for qibolab-qick integration."""
 
+import asyncio
 import json
 import logging
 import os
-import socket
+import time
 import traceback
-from socketserver import BaseRequestHandler, TCPServer
-from typing import Dict, List
+from collections import Counter
+from functools import partial
+from typing import List, Optional, Set, Tuple, Union
 
 import numpy as np
-from qick import QickSoc
+from qick import QickConfig, QickSoc
+from qick.helpers import NpEncoder
 
 import qibosoq.configuration as cfg
-from qibosoq.components.base import Config, OperationCode, Parameter, Qubit, Sweeper
-from qibosoq.components.pulses import Element, Measurement, Shape
-from qibosoq.programs.pulse_sequence import ExecutePulseSequence
+from qibosoq.components.base import Config, OperationCode, Qubit, Sweeper
+from qibosoq.components.pulses import Element
+from qibosoq.compression import (
+    OPTIONS_SIZE,
+    compress,
+    decode_length,
+    decompress,
+    encode_reply,
+)
+from qibosoq.compiler import (
+    board_config,
+    build_program,
+    compile_command,
+    config_fingerprint,
+    estimate,
+    load_elements,
+    load_interleaved,
+    load_qubits,
+    load_sweeps,
+    log_asm,
+    merge_commands,
+    validate,
+)
+from qibosoq.jobs import Job, JobManager
+from qibosoq.programs.flux import held_biases, reset_held_biases
+from qibosoq.programs.pulse_sequence import ExecutePulseSequence, ExecuteSequences
 from qibosoq.programs.sweepers import ExecuteSweeps
+from qibosoq.shared import (
+    existing_segments,
+    segment_names,
+    share_results,
+    unlink_segments,
+)
+from qibosoq.transport import LENGTH_SIZE, configure_socket
+from qibosoq.validation import sweep_point
 
 logger = logging.getLogger(cfg.MAIN_LOGGER_NAME)
-qick_logger = logging.getLogger(cfg.PROGRAM_LOGGER_NAME)
-
-
-def load_elements(list_sequence: List[Dict]) -> List[Element]:
-    """Convert a list of elements in dict form to a list of Pulse objects."""
-    obj_sequence = []
-    for element in list_sequence:
-        if "amplitude" in element:  # if element is a pulse
-            cls = Shape[element["shape"].upper()].value
-            converted_pulse = cls(**element)
-            obj_sequence.append(converted_pulse)
-        else:  # if element is a measurement
-            obj_sequence.append(Measurement(**element))
-    return obj_sequence
-
-
-def load_sweeps(list_sweepers: List[Dict]) -> List[Sweeper]:
-    """Convert a list of sweepers (in dict form) to a list of Sweeper objects."""
-    sweepers = []
-    for sweep in list_sweepers:
-        converted_sweep = Sweeper(
-            expts=sweep["expts"],
-            parameters=[Parameter(par) for par in sweep["parameters"]],
-            starts=np.array(sweep["starts"]),
-            stops=np.array(sweep["stops"]),
-            indexes=sweep["indexes"],
+
+COMPILE_OPERATIONS = (
+    OperationCode.VALIDATE,
+    OperationCode.COMPILE,
+    OperationCode.GET_CONFIG,
+)
+"""Operations served also without a board, from its QickConfig."""
+
+JOB_OPERATIONS = (
+    OperationCode.SUBMIT_JOB,
+    OperationCode.JOB_STATUS,
+    OperationCode.FETCH_RESULTS,
+    OperationCode.CANCEL_JOB,
+)
+"""Operations on the jobs of the server."""
+
+CONTROL_OPERATIONS = (
+    OperationCode.PING,
+    OperationCode.STATUS,
+    OperationCode.STATS,
+    OperationCode.GET_CONFIG,
+)
+"""Operations answered at once, also while the board is acquiring."""
+
+
+def software_sweep_point(
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: List[Sweeper],
+    point: Tuple[int, ...],
+) -> Tuple[List[Element], List[Qubit]]:
+    """Return copies of sequence and qubits, updated to a point of software sweepers."""
+    values = [sweeper.points[:, jdx] for sweeper, jdx in zip(sweepers, point)]
+    return sweep_point(sequence, qubits, sweepers, values)
+
+
+def stack_software_points(results: List[list], sweepers: List[Sweeper]) -> List[list]:
+    """Stack the results of all the points of software sweepers.
+
+    The software sweepers axes are added after the readouts axis of each ADC.
+    """
+    shape = tuple(sweeper.expts for sweeper in sweepers)
+    stacked = []
+    for adc in range(len(results[0])):
+        points = np.array([result[adc] for result in results])
+        points = np.moveaxis(points, 0, 1)
+        stacked.append(
+            points.reshape(points.shape[:1] + shape + points.shape[2:]).tolist()
+        )
+    return stacked
+
+
+def load_compiled(data: dict, qick_soc: QickSoc) -> dict:
+    """Check that a compiled program can be executed by the board and return it.
+
+    The program must be compiled for the same firmware and, since the
+    biases held by the board change between programs, without persistent biases.
+    Compiled programs do not release the biases held by the board either, so
+    they are rejected while the board holds some.
+    """
+    compiled = data["compiled"]
+    if compiled["fingerprint"] != config_fingerprint(qick_soc):
+        raise RuntimeError(
+            "The program was compiled for a different firmware or readout mode."
+        )
+    if "software_sweepers" in data or data["cfg"].get("persistent_bias", False):
+        raise NotImplementedError(
+            "Programs with software sweepers or persistent biases cannot be "
+            "executed precompiled."
+        )
+    if len(held_biases) > 0:
+        raise RuntimeError(
+            "The board holds persistent biases, that precompiled programs do not "
+            "release: execute a program without persistent biases first."
         )
-        sweepers.append(converted_sweep)
-    return sweepers
+    return compiled["program"]
 
 
-def execute_program(data: dict, qick_soc: QickSoc) -> dict:
+def execute_program(data: dict, qick_soc: QickSoc, job: Optional[Job] = None) -> dict:
     """Create and execute qick programs.
 
+    Software sweepers, if any, are executed in an outer loop: the program is
+    built once and patched between the points, when possible. The command is
+    validated once, before building any program (see `compiler.validate`).
+    Multiple sequences on disjoint channels are merged in a single program,
+    while interleaved sequences are selected in turn by the program.
+    Programs already compiled (`EXECUTE_COMPILED`) are only loaded, the
+    command also contains the keys of the compiled one.
+    If the command is executed by a job, the job is updated with the expected
+    hardware time, and stops between the software sweeper points if cancelled.
+
     Returns:
-        (dict): dictionary with two keys (i, q) to lists of values
+        (dict): dictionary with two keys (i, q) to lists of values and the
+        expected hardware time in "metadata"; for merged and interleaved
+        sequences, i and q contain the results of each sequence
     """
     opcode = OperationCode(data["operation_code"])
+    if opcode is OperationCode.COMPILE:
+        return compile_command(data, qick_soc)
+    if opcode is OperationCode.GET_CONFIG:
+        return board_config(qick_soc)
+    compiled = None
+    if opcode is OperationCode.EXECUTE_COMPILED:
+        compiled = load_compiled(data, qick_soc)
+        opcode = OperationCode(data["compiled"]["operation_code"])
     args = []
+    merged_adcs = merge_commands(data, qick_soc)
+    if opcode is OperationCode.VALIDATE:
+        resources, shot = estimate(data, qick_soc, raw=data.get("raw", False))
+        return {**resources.serialized, "timeline": shot.serialized}
+    interleaved = load_interleaved(data)
+    programcls: type
     if opcode is OperationCode.EXECUTE_PULSE_SEQUENCE:
-        programcls = ExecutePulseSequence
+        programcls = ExecuteSequences if interleaved else ExecutePulseSequence
     elif opcode is OperationCode.EXECUTE_PULSE_SEQUENCE_RAW:
         programcls = ExecutePulseSequence
         data["cfg"]["soft_avgs"] = data["cfg"]["reps"]
@@ -71,96 +178,382 @@ def execute_program(data: dict, qick_soc: QickSoc) -> dict:
             f"Operation code {data['operation_code']} not supported"
         )
 
-    program = programcls(
-        qick_soc,
-        Config(**data["cfg"]),
-        load_elements(data["sequence"]),
-        [Qubit(**qubit) for qubit in data["qubits"]],
-        *args,
+    raw = opcode is OperationCode.EXECUTE_PULSE_SEQUENCE_RAW
+    if compiled is None:
+        # once for all the points of the software sweepers
+        expected = validate(data, qick_soc, raw, held_biases).serialized
+    else:
+        # validated and assembled when compiling
+        expected = data["compiled"]["timeline"]
+        log_asm(data["compiled"]["asm"])
+    logger.info(
+        "Expected hardware time: %.3f s (%.3f us per shot)",
+        expected["eta"],
+        expected["shot_duration"],
     )
+    if job is not None:
+        job.expected = expected["eta"]
 
-    asm_prog = program.asm()
-    qick_logger.handlers[0].doRollover()  # type: ignore
-    qick_logger.info(asm_prog)
+    qpcfg = Config(**data["cfg"])
+    sequence = load_elements(data["sequence"])
+    qubits = load_qubits(data["qubits"])
+    software = load_sweeps(data.get("software_sweepers", []))
 
-    num_instructions = len(program.prog_list)
-    max_mem = qick_soc["tprocs"][0]["pmem_size"]
-    if num_instructions > max_mem:
-        raise MemoryError(
-            f"The tproc has a max memory size of {max_mem}, "
-            f"but the program had {num_instructions} instructions"
+    program = None
+    results_i, results_q = [], []
+    for point in np.ndindex(*(sweeper.expts for sweeper in software)):
+        if job is not None:
+            job.check_cancelled()
+        point_sequence, point_qubits = software_sweep_point(
+            sequence, qubits, software, point
         )
-
-    if opcode is OperationCode.EXECUTE_PULSE_SEQUENCE_RAW:
-        results = program.acquire_decimated(  # pylint: disable=E1120
-            qick_soc,
-            load_pulses=True,
-            progress=False,
+        patched = program is not None and program.patch(
+            point_sequence, point_qubits, qick_soc
         )
-        toti = [[results[0][0].tolist()]]
-        totq = [[results[0][1].tolist()]]
+        if not patched:
+            program = build_program(
+                programcls,
+                qick_soc,
+                qpcfg,
+                point_sequence,
+                point_qubits,
+                args,
+                interleaved,
+                compiled,
+                held_biases,
+            )
+        assert program is not None
+
+        if raw:
+            results = program.acquire_decimated(  # pylint: disable=E1120
+                qick_soc,
+                load_pulses=not patched,
+                progress=False,
+            )
+            toti = [[results[0][0].tolist()]]
+            totq = [[results[0][1].tolist()]]
+        else:
+            toti, totq = program.perform_experiment(
+                qick_soc,
+                average=qpcfg.average,
+                load_pulses=not patched,
+            )
+        program.update_held_biases()
+        results_i.append(toti)
+        results_q.append(totq)
+
+    if len(software) > 0:
+        toti = stack_software_points(results_i, software)
+        totq = stack_software_points(results_q, software)
     else:
-        toti, totq = program.perform_experiment(
-            qick_soc,
-            average=data["cfg"]["average"],
+        toti, totq = results_i[0], results_q[0]
+
+    if merged_adcs is not None:
+        # results are in the order of the first acquisition of each ADC
+        order = list(
+            dict.fromkeys(elem.adc for elem in sequence if elem.type == "readout")
+        )
+        toti = [[toti[order.index(adc)] for adc in adcs] for adcs in merged_adcs]
+        totq = [[totq[order.index(adc)] for adc in adcs] for adcs in merged_adcs]
+
+    metadata = {"eta": expected["eta"], "shot_duration": expected["shot_duration"]}
+    return {"i": toti, "q": totq, "metadata": metadata}
+
+
+def run_job(qick_soc: QickSoc, data: dict, job: Job) -> dict:
+    """Execute the command of a job, resetting the board if it fails."""
+    try:
+        return execute_program(data, qick_soc, job)
+    except Exception:
+        logger.error("Failing command: %s", data)
+        qick_soc.reset_gens()
+        reset_held_biases()
+        raise
+
+
+def job_manager(qick_soc: QickSoc) -> JobManager:
+    """Create the manager of the jobs executed on the board."""
+    return JobManager(partial(run_job, qick_soc), encode_results)
+
+
+def job_command(data: dict, jobs: JobManager) -> Union[dict, bytes]:
+    """Execute an operation on the jobs of the server.
+
+    Submitted commands, in ``"command"``, are queued and the status of their
+    job is returned at once. The other operations refer to ``"job_id"``.
+    """
+    opcode = OperationCode(data["operation_code"])
+    if opcode is OperationCode.SUBMIT_JOB:
+        command = data["command"]
+        if OperationCode(command["operation_code"]) in JOB_OPERATIONS:
+            raise ValueError("Job operations cannot be submitted as jobs.")
+        return jobs.status(jobs.submit(command).id)
+    if opcode is OperationCode.JOB_STATUS:
+        return jobs.status(data["job_id"])
+    if opcode is OperationCode.FETCH_RESULTS:
+        return jobs.fetch(data["job_id"])
+    return jobs.cancel(data["job_id"])
+
+
+def decode_command(codec: int, received: bytes) -> dict:
+    """Decode a command received, compressed with codec."""
+    return json.loads(str(decompress(codec, received), "utf-8"))
+
+
+def encode_results(results) -> bytes:
+    """Encode the results of a command in JSON, unless already encoded."""
+    if isinstance(results, bytes):
+        return results
+    # envelopes of compiled programs are numpy arrays
+    return bytes(json.dumps(results, cls=NpEncoder), "utf-8")
+
+
+class QibosoqServer:
+    """Server handling the connections on an asyncio event loop.
+
+    Control operations, and the ones on the jobs, are answered on the loop
+    also while the board is acquiring. Compilations and the encoding of the
+    replies run on a thread pool, while the commands acquiring are executed
+    one at a time by the worker of the jobs, the only one driving the board.
+    """
+
+    def __init__(
+        self,
+        qick_soc: QickSoc,
+        compile_only: bool = False,
+        jobs: Optional[JobManager] = None,
+    ):
+        """Create the server, not listening yet."""
+        self.qick_soc = qick_soc
+        self.compile_only = compile_only
+        self.jobs = jobs
+        self.started = time.monotonic()
+        self.listeners: List[asyncio.Server] = []
+        self.unix_socket: Optional[str] = None
+        self.commands: Counter = Counter()
+        """Number of commands served, by operation."""
+        self.errors = 0
+        self.received = 0
+        """Bytes of the commands received."""
+        self.sent = 0
+        """Bytes of the replies sent."""
+        self.segments: Set[str] = set()
+        """Shared memory segments delivered, unlinked at close if not attached."""
+
+    async def start(self, host: str, port: int, unix_socket: Optional[str] = None):
+        """Listen on host and port, and also on the Unix socket, if given.
+
+        The results of the commands received on the Unix socket are shared
+        in memory (see :mod:`qibosoq.shared`).
+        """
+        self.listeners.append(
+            await asyncio.start_server(
+                partial(self.handle, shared_memory=False), host, port
+            )
         )
+        if unix_socket is not None:
+            self.listeners.append(
+                await asyncio.start_unix_server(
+                    partial(self.handle, shared_memory=True), unix_socket
+                )
+            )
+            self.unix_socket = unix_socket
 
-    return {"i": toti, "q": totq}
+    @property
+    def addresses(self) -> list:
+        """Addresses of the sockets the server is listening on."""
+        return [
+            sock.getsockname()
+            for listener in self.listeners
+            for sock in listener.sockets or []
+        ]
 
+    async def close(self):
+        """Stop listening, and remove the Unix socket."""
+        for listener in self.listeners:
+            listener.close()
+            await listener.wait_closed()
+        self.listeners = []
+        unlink_segments(self.segments)
+        self.segments.clear()
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
 
-class ConnectionHandler(BaseRequestHandler):
-    """Handle requests to the server."""
+    async def serve_forever(
+        self, host: str, port: int, unix_socket: Optional[str] = None
+    ):
+        """Listen and serve the connections until cancelled."""
+        await self.start(host, port, unix_socket)
+        log_initial_info()
+        try:
+            await asyncio.gather(
+                *(listener.serve_forever() for listener in self.listeners)
+            )
+        finally:
+            await self.close()
 
-    def receive_command(self) -> dict:
-        """Receive commands from qibolab client.
+    async def receive_command(
+        self, reader: asyncio.StreamReader
+    ) -> Tuple[dict, Optional[int]]:
+        """Receive a command from a client.
 
         The communication protocol is:
         * first the server receives  a 4 bytes integer with the length
         of the message to actually receive
-        * waits for the message and decode it
-        * returns the unpcikled dictionary
+        * if the length negotiates the compression, the codec of the message
+        and the compression level of the reply follow
+        * waits for the message and decode it, on the thread pool
+
+        Messages longer than `configuration.MAX_MESSAGE_SIZE` are rejected
+        before being received.
+
+        Returns:
+            the command and the compression level negotiated, if any
         """
-        count = int.from_bytes(self.request.recv(4), "big")
-        received = self.request.recv(count, socket.MSG_WAITALL)
-        data = json.loads(received)
-        return data
+        count, negotiated = decode_length(await reader.readexactly(LENGTH_SIZE))
+        if count > cfg.MAX_MESSAGE_SIZE:
+            raise ValueError(
+                f"Message of {count} bytes larger than {cfg.MAX_MESSAGE_SIZE} bytes"
+            )
+        codec, compression = 0, None
+        if negotiated:
+            codec, compression = await reader.readexactly(OPTIONS_SIZE)
+        received = await reader.readexactly(count)
+        self.received += count
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, decode_command, codec, received)
+        return data, compression
 
-    def handle(self):
+    def control(self, opcode: OperationCode) -> dict:
+        """Answer a control operation."""
+        uptime = time.monotonic() - self.started
+        if opcode is OperationCode.PING:
+            return {"uptime": uptime}
+        if opcode is OperationCode.STATUS:
+            jobs = self.jobs.summary() if self.jobs is not None else {}
+            return {"uptime": uptime, "compile_only": self.compile_only, **jobs}
+        if opcode is OperationCode.STATS:
+            return {
+                "uptime": uptime,
+                "commands": dict(self.commands),
+                "errors": self.errors,
+                "received": self.received,
+                "sent": self.sent,
+            }
+        return board_config(self.qick_soc)
+
+    async def execute(self, data: dict):
+        """Execute a command, without blocking the loop."""
+        opcode = OperationCode(data["operation_code"])
+        self.commands[opcode.name] += 1
+        if self.compile_only and opcode not in COMPILE_OPERATIONS + CONTROL_OPERATIONS:
+            raise RuntimeError(
+                f"The server has no board and cannot execute {opcode.name}"
+            )
+        if opcode in CONTROL_OPERATIONS:
+            return self.control(opcode)
+        if self.jobs is not None and opcode in JOB_OPERATIONS:
+            return job_command(data, self.jobs)
+        loop = asyncio.get_running_loop()
+        if opcode in COMPILE_OPERATIONS or self.jobs is None:
+            return await loop.run_in_executor(
+                None, execute_program, data, self.qick_soc
+            )
+        # the board is only driven by the worker of the jobs
+        job = self.jobs.submit(data, keep=False)
+        assert job.future is not None
+        await asyncio.wrap_future(job.future)
+        return job.results
+
+    async def handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        shared_memory: bool,
+    ):
         """Handle a connection to the server.
 
         * Receives command from client
-        * Executes qick program
-        * Return results
+        * Executes it (see :meth:`execute`)
+        * Return results, preceded by their length and compressed if the
+        command negotiated it, and then closes the connection
         """
-        # set the server in non-blocking mode
-        self.server.socket.setblocking(False)
-
+        configure_socket(writer.get_extra_info("socket"))
+        data, compression = None, None
         try:
-            data = self.receive_command()
-            results = execute_program(data, self.server.qick_soc)
-        except Exception:  # pylint: disable=W0612,W0718
+            data, compression = await self.receive_command(reader)
+            results = await self.execute(data)
+        except Exception:  # pylint: disable=W0718
             logger.exception("")
             logger.error("Faling command: %s", data)
             results = traceback.format_exc()
-            self.server.qick_soc.reset_gens()
+        if isinstance(results, str):
+            self.errors += 1
 
-        self.request.sendall(bytes(json.dumps(results), "utf-8"))
+        segments: List[str] = []
+
+        def reply() -> bytes:
+            if compression is None:
+                return encode_results(results)
+            shared = results
+            if shared_memory:
+                shared = share_results(results, cfg.SHARED_MEMORY_THRESHOLD)
+                segments.extend(segment_names(shared))
+            return encode_reply(*compress(encode_results(shared), compression))
+
+        try:
+            message = await asyncio.get_running_loop().run_in_executor(None, reply)
+            writer.write(message)
+            await writer.drain()
+            self.sent += len(message)
+            if len(segments) > 0:
+                # the client unlinks the segments, the ones it never attached
+                # are unlinked when the server closes
+                self.segments = set(existing_segments(self.segments))
+                self.segments.update(segments)
+        except Exception:  # pylint: disable=W0718
+            logger.exception("")
+            unlink_segments(segments)
+        finally:
+            writer.close()
 
 
 def log_initial_info():
     """Log info regarding the loaded configuration."""
     logger.info("Server listening, PID %d", os.getpid())
     mux_str = "Multiplexed" if cfg.IS_MULTIPLEXED else "Not multiplexed"
-    logger.info("%s firmware loaded from %s", mux_str, cfg.QICKSOC_LOCATION)
+    if cfg.SOCCFG_LOCATION is not None:
+        logger.info(
+            "%s configuration loaded from %s, compile-only mode",
+            mux_str,
+            cfg.SOCCFG_LOCATION,
+        )
+    else:
+        logger.info("%s firmware loaded from %s", mux_str, cfg.QICKSOC_LOCATION)
 
 
-def serve(host, port):
-    """Open the TCPServer and wait forever for connections."""
+def load_soc() -> QickSoc:
+    """Load the board, or only its configuration in compile-only mode."""
+    if cfg.SOCCFG_LOCATION is not None:
+        return QickConfig(cfg.SOCCFG_LOCATION)
     # initialize QickSoc object (firmware and clocks)
-    TCPServer.allow_reuse_address = True
-    with TCPServer((host, port), ConnectionHandler) as server:
-        server.qick_soc = QickSoc(
-            bitfile=cfg.QICKSOC_LOCATION, external_clk=cfg.EXT_CLK
-        )
-        log_initial_info()
-        server.serve_forever()
+    return QickSoc(bitfile=cfg.QICKSOC_LOCATION, external_clk=cfg.EXT_CLK)
+
+
+def serve(host, port):
+    """Open the server and wait forever for connections.
+
+    With `configuration.SOCCFG_LOCATION` set, no board is used and only
+    the operations in `COMPILE_OPERATIONS` and `CONTROL_OPERATIONS` are
+    served. With `configuration.UNIX_SOCKET` set, the server also listens
+    on that Unix domain socket.
+    """
+    qick_soc = load_soc()
+    compile_only = cfg.SOCCFG_LOCATION is not None
+    jobs = None if compile_only else job_manager(qick_soc)
+    server = QibosoqServer(qick_soc, compile_only, jobs)
+    try:
+        asyncio.run(server.serve_forever(host, port, cfg.UNIX_SOCKET))
+    finally:
+        if jobs is not None:
+            jobs.shutdown()
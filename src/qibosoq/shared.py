@@ -0,0 +1,135 @@
+"""Hand over of large results through shared memory, to co-located clients.
+
+The results of the commands received on the Unix domain socket of the server
+(see `configuration.UNIX_SOCKET`) are copied in `multiprocessing.shared_memory`
+segments, when larger than `configuration.SHARED_MEMORY_THRESHOLD` bytes, and
+only their descriptors are sent. The client maps and unlinks the segments, so
+that the arrays are released when garbage collected. The server unlinks the
+segments of the replies it could not deliver, and the ones never attached
+when it closes.
+"""
+
+import mmap
+import pathlib
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterable, List, Union
+
+import numpy as np
+
+SHARED_KEY = "__shm__"
+"""Key of the name of the segment of a shared array."""
+SHARED_DTYPE = "<f8"
+"""Type of the values of shared arrays."""
+SHM_DIRECTORY = pathlib.Path("/dev/shm")
+"""Directory of the shared memory segments, where available (Linux)."""
+RESULTS_KEYS = ("i", "q")
+"""Keys of the results that can be shared."""
+
+
+def share_array(array: np.ndarray) -> dict:
+    """Copy an array in a new shared memory segment and return its descriptor."""
+    segment = SharedMemory(create=True, size=array.nbytes)
+    # the client unlinks the segment, not the tracker of the server at exit
+    # (which registers the POSIX name, with the leading slash)
+    resource_tracker.unregister(f"/{segment.name}", "shared_memory")
+    np.ndarray(array.shape, SHARED_DTYPE, buffer=segment.buf)[...] = array
+    segment.close()
+    return {SHARED_KEY: segment.name, "shape": list(array.shape)}
+
+
+def share_values(values: list, threshold: int) -> Union[list, dict]:
+    """Share the arrays of values larger than threshold bytes.
+
+    Ragged values (e.g. a different number of readouts for each ADC) are
+    shared by parts.
+    """
+    try:
+        array = np.asarray(values, dtype=SHARED_DTYPE)
+    except ValueError:
+        return [share_values(value, threshold) for value in values]
+    if array.nbytes < max(threshold, 1):
+        return values
+    return share_array(array)
+
+
+def share_results(results, threshold: int):
+    """Share the large arrays of i and q values of the results."""
+    if not isinstance(results, dict):  # errors are sent as they are
+        return results
+    shared = {
+        key: share_values(results[key], threshold)
+        for key in RESULTS_KEYS
+        if key in results
+    }
+    return {**results, **shared}
+
+
+def segment_names(results) -> List[str]:
+    """Return the names of the segments of the shared results."""
+    if isinstance(results, dict) and SHARED_KEY in results:
+        return [results[SHARED_KEY]]
+    if isinstance(results, dict):
+        results = [results[key] for key in RESULTS_KEYS if key in results]
+    if isinstance(results, list):
+        return [name for value in results for name in segment_names(value)]
+    return []
+
+
+def existing_segments(names: Iterable[str]) -> List[str]:
+    """Return the segments not unlinked yet, all if they cannot be listed."""
+    if not SHM_DIRECTORY.exists():
+        return list(names)
+    return [name for name in names if (SHM_DIRECTORY / name).exists()]
+
+
+def unlink_segments(names: Iterable[str]):
+    """Unlink segments, skipping the ones already unlinked."""
+    for name in names:
+        try:
+            segment = SharedMemory(name)
+        except FileNotFoundError:
+            continue
+        segment.unlink()
+        segment.close()
+
+
+def attach_array(descriptor: dict) -> np.ndarray:
+    """Map the array of a shared segment, and unlink the segment.
+
+    Where the segments are files of `SHM_DIRECTORY` the array is mapped
+    without copies, otherwise the values are copied out of the segment.
+    """
+    name, shape = descriptor[SHARED_KEY], descriptor["shape"]
+    path = SHM_DIRECTORY / name
+    if path.exists():
+        with open(path, "r+b") as file:
+            buffer = mmap.mmap(file.fileno(), 0)
+        path.unlink()
+        count = int(np.prod(shape))
+        return np.frombuffer(buffer, SHARED_DTYPE, count=count).reshape(shape)
+    segment = SharedMemory(name)
+    try:
+        return np.ndarray(shape, SHARED_DTYPE, buffer=segment.buf).copy()
+    finally:
+        segment.unlink()
+        segment.close()
+
+
+def attach_values(values: Union[list, dict]):
+    """Replace the descriptors of shared arrays with the arrays."""
+    if isinstance(values, dict) and SHARED_KEY in values:
+        return attach_array(values)
+    if isinstance(values, list) and values and isinstance(values[0], (list, dict)):
+        return [attach_values(value) for value in values]
+    return values
+
+
+def attach_results(results):
+    """Map the shared arrays of i and q values of the results."""
+    if not isinstance(results, dict):
+        return results
+    attached = {
+        key: attach_values(results[key]) for key in RESULTS_KEYS if key in results
+    }
+    return {**results, **attached}
@@ -0,0 +1,53 @@
+"""Reception of the messages exchanged by clients and server on sockets.
+
+Messages are received with `recv_into` in buffers allocated once with their
+final size, so that large payloads are not copied while they arrive.
+"""
+
+import socket
+from typing import Optional
+
+import qibosoq.configuration as cfg
+
+LENGTH_SIZE = 4
+"""Bytes of the big-endian length preceding the messages."""
+
+
+def configure_socket(sock: socket.socket):
+    """Disable Nagle's algorithm and enlarge the buffers of a socket."""
+    if sock.family != getattr(socket, "AF_UNIX", None):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, cfg.SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, cfg.SOCKET_BUFFER_SIZE)
+
+
+def open_socket(host: str, port: Optional[int]) -> socket.socket:
+    """Connect to a server, on the Unix domain socket at host if port is None."""
+    family = socket.AF_INET if port is not None else socket.AF_UNIX
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        configure_socket(sock)
+        sock.connect(host if port is None else (host, port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytearray:
+    """Receive exactly size bytes, raising if the connection closes before."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError(f"Connection closed after {received} of {size} bytes")
+        received += count
+    return buffer
+
+
+def recv_frame(sock: socket.socket) -> bytearray:
+    """Receive a message preceded by its length."""
+    length = int.from_bytes(recv_exactly(sock, LENGTH_SIZE), "big")
+    return recv_exactly(sock, length)
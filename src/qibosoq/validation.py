@@ -0,0 +1,389 @@
+"""Validation of the programs, shared by the server and the clients.
+
+The checks only need the QickConfig of the board in its dictionary form, so
+clients can run the same rules of the server before sending any command, and
+reject invalid experiments without touching the board.
+"""
+
+from dataclasses import replace
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+import qibosoq.configuration as qibosoq_cfg
+from qibosoq.components.base import ActiveReset, Config, Parameter, Qubit, Sweeper
+from qibosoq.components.pulses import (
+    Drag,
+    Element,
+    FlatTop,
+    Gaussian,
+    Pulse,
+    Rectangular,
+)
+from qibosoq.conversions import converter
+from qibosoq.estimator import (
+    ProgramEstimate,
+    Timeline,
+    estimate_program,
+    estimate_resources,
+)
+
+SOFTWARE_ATTRIBUTES = {
+    Parameter.FREQUENCY: "frequency",
+    Parameter.AMPLITUDE: "amplitude",
+    Parameter.RELATIVE_PHASE: "relative_phase",
+    Parameter.DELAY: "start_delay",
+    Parameter.DURATION: "duration",
+    Parameter.REL_SIGMA: "rel_sigma",
+    Parameter.BETA: "beta",
+}
+"""Attributes of the elements updated by software sweepers."""
+
+
+def swept_values(
+    sweepers: Sequence[Sweeper], parameter: Parameter, index: int
+) -> List[float]:
+    """Return the extreme values of all the sweeps of a parameter."""
+    values = []
+    for sweeper in sweepers:
+        for idx, jdx in enumerate(sweeper.indexes):
+            if sweeper.parameters[idx] is parameter and jdx == index:
+                if sweeper.values is not None:
+                    values += [min(sweeper.values[idx]), max(sweeper.values[idx])]
+                else:
+                    values += [sweeper.starts[idx], sweeper.stops[idx]]
+    return values
+
+
+def check_flux_gains(
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper],
+    flux_ch: int,
+):
+    """Check that flux pulses plus sweetspot stay within the maximum gain.
+
+    All the combinations of the extremes of the swept amplitudes and
+    biases are considered.
+    """
+    biases = [0.0]
+    for jdx, qubit in enumerate(qubits):
+        if qubit.dac == flux_ch:
+            biases = swept_values(sweepers, Parameter.BIAS, jdx) or [qubit.bias or 0.0]
+            break
+    for jdx, elem in enumerate(sequence):
+        if elem.type != "flux" or elem.dac != flux_ch:
+            continue
+        assert isinstance(elem, Pulse)
+        amplitudes = swept_values(sweepers, Parameter.AMPLITUDE, jdx) or [
+            elem.amplitude
+        ]
+        if any(abs(amp + bias) > 1 for amp in amplitudes for bias in biases):
+            raise ValueError(f"Flux pulse {elem.name} got amplitude > 1")
+
+
+def validate_sweeper(
+    sweeper: Sweeper,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper],
+    is_mux: bool,
+):
+    """Check if a sweeper is valid.
+
+    In particular, it raises an error if:
+        - sweeper is on bias, but not enough information has been given with the qubit
+        - sweeper is on bias wih non rectangular flux pulses on the same channel
+        - sweeper is on flux pulses, but not on the amplitude of rectangular ones
+        - swept flux pulses or biases exceed the maximum gain
+        - sweeper is on the duration of multiplexed readouts or of pulses
+          that are not Rectangular, FlatTop, Gaussian or Drag
+        - sweeper has pulse paramaters and bias
+        - sweeper is on envelope parameters, that can be swept only in software
+    """
+    for idx, par in enumerate(sweeper.parameters):
+        if par in (Parameter.REL_SIGMA, Parameter.BETA):
+            raise NotImplementedError(
+                f"Sweepers on {par.value} can only be executed in software."
+            )
+        if par is Parameter.BIAS:
+            if any(par is not Parameter.BIAS for par in sweeper.parameters):
+                raise NotImplementedError(
+                    "Sweepers on bias cannot be swept at the same time with other sweepers."
+                )
+            qubit = qubits[sweeper.indexes[idx]]
+            if qubit.dac is None or qubit.bias is None:
+                raise ValueError(f"Bias swept qubit had incomplete values: {qubit}")
+            if any(
+                pulse.type == "flux"
+                and pulse.dac == qubit.dac
+                and not isinstance(pulse, Rectangular)
+                for pulse in sequence
+            ):
+                raise NotImplementedError(
+                    "Sweepers on bias are compatible only with rectangular flux pulses."
+                )
+            check_flux_gains(sequence, qubits, sweepers, qubit.dac)
+        else:
+            elem = sequence[sweeper.indexes[idx]]
+            if elem.type == "flux":
+                if par is not Parameter.AMPLITUDE or not isinstance(elem, Rectangular):
+                    raise NotImplementedError(
+                        "Only the amplitude of rectangular flux pulses can be swept."
+                    )
+                check_flux_gains(sequence, qubits, sweepers, elem.dac)
+            if par is Parameter.DURATION:
+                if sweeper.values is not None:
+                    raise NotImplementedError(
+                        "Sweepers on duration over a list of values are not implemented."
+                    )
+                if elem.type == "readout" and is_mux:
+                    raise NotImplementedError(
+                        "Sweepers on the duration of multiplexed readouts are not implemented."
+                    )
+                if not isinstance(elem, (Rectangular, FlatTop, Gaussian, Drag)):
+                    raise NotImplementedError(
+                        f"Sweepers on {type(elem).__name__} durations are not implemented."
+                    )
+
+
+def check_resets(sequence: List[Element], resets: List[ActiveReset], is_mux: bool):
+    """Check that the active resets can be executed by the program.
+
+    The readouts of the resets are acquired by ADCs already declared for the
+    sequence, whose frequency is the one of the sequence readouts.
+    """
+    if is_mux:
+        raise NotImplementedError(
+            "Active reset is not supported with multiplexed readout."
+        )
+    adcs = {elem.adc for elem in sequence if elem.type == "readout"}
+    for reset in resets:
+        if reset.readout.adc not in adcs:
+            raise ValueError(
+                f"The active reset reads ADC {reset.readout.adc}, "
+                "which is not acquired by the sequence"
+            )
+
+
+def check_readouts(soccfg: Mapping, sequence: List[Element], is_mux: bool):
+    """Check that the readouts of a sequence can be acquired by the board.
+
+    Multiplexed readout pulses have to be rectangular, and every generator
+    can play up to `n_tones` tones.
+    """
+    readouts = [elem for elem in sequence if elem.type == "readout"]
+    if len(readouts) == 0:
+        raise RuntimeError("At least an acquisition is required.")
+    if not is_mux:
+        return
+    tones: Dict[int, Set[int]] = {}
+    for pulse in readouts:
+        if not isinstance(pulse, Pulse):
+            continue
+        if not isinstance(pulse, Rectangular):
+            raise TypeError("Only rectangular pulses can be multiplexed")
+        tones.setdefault(pulse.dac, set()).add(pulse.adc)
+    for gen_ch, adcs in tones.items():
+        n_tones = soccfg["gens"][gen_ch]["n_tones"]
+        if len(adcs) > n_tones:
+            raise ValueError(
+                f"Generator {gen_ch} supports {n_tones} multiplexed tones, "
+                f"but {len(adcs)} were requested"
+            )
+
+
+def merged_indexes(
+    parameters: Sequence[Parameter], indexes: Sequence[int], origins: List[int]
+) -> List[int]:
+    """Move the indexes of a sweeper on the elements of merged sequences.
+
+    Args:
+        parameters: swept parameters
+        indexes: indexes in the concatenation of the sequences
+        origins: for each merged element, its index in the concatenation,
+            as returned by :func:`qibosoq.estimator.merge_sequences`
+    """
+    if any(par in (Parameter.DELAY, Parameter.DURATION) for par in parameters):
+        raise NotImplementedError(
+            "Delays and durations of merged sequences cannot be swept."
+        )
+    positions = {origin: pos for pos, origin in enumerate(origins)}
+    return [
+        idx if par is Parameter.BIAS else positions[idx]
+        for par, idx in zip(parameters, indexes)
+    ]
+
+
+def merged_sweepers(sweepers: Sequence[Sweeper], origins: List[int]) -> List[Sweeper]:
+    """Return copies of sweepers moved on the elements of merged sequences.
+
+    See :func:`merged_indexes`.
+    """
+    return [
+        replace(
+            sweeper,
+            indexes=merged_indexes(sweeper.parameters, sweeper.indexes, origins),
+        )
+        for sweeper in sweepers
+    ]
+
+
+def check_program(
+    soccfg: Mapping,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper] = (),
+    raw: bool = False,
+    is_mux: bool = False,
+    interleaved: Sequence[List[Element]] = (),
+):
+    """Check the rules of the server for a program, but not its resources."""
+    if len(interleaved) > 0 and (raw or len(sweepers) > 0):
+        raise NotImplementedError(
+            "Interleaved sequences can only be executed as integrated "
+            "acquisitions, without sweepers."
+        )
+    resets = [qubit.reset for qubit in qubits if qubit.reset is not None]
+    if len(resets) > 0:
+        if len(sweepers) > 0:
+            raise NotImplementedError("Active reset is not supported with sweepers.")
+        if raw:
+            raise NotImplementedError(
+                "Active reset is not supported in raw acquisitions."
+            )
+        check_resets(sequence, resets, is_mux)
+    check_readouts(soccfg, sequence, is_mux)
+    for sweeper in sweepers:
+        validate_sweeper(sweeper, sequence, qubits, sweepers, is_mux)
+
+
+def validate_program(
+    soccfg: Mapping,
+    qpcfg: Config,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper] = (),
+    raw: bool = False,
+    is_mux: Optional[bool] = None,
+    interleaved: Sequence[List[Element]] = (),
+    held: Optional[Mapping[int, int]] = None,
+) -> ProgramEstimate:
+    """Check that a program can be built and fits in the board, without building it.
+
+    The arguments are the ones of :func:`qibosoq.estimator.estimate_program`,
+    the errors are the ones raised by the server building the program.
+
+    Returns:
+        (ProgramEstimate): the resources that the program needs
+    """
+    if is_mux is None:
+        is_mux = qibosoq_cfg.IS_MULTIPLEXED
+    check_program(soccfg, sequence, qubits, sweepers, raw, is_mux, interleaved)
+    estimate = estimate_program(
+        soccfg, qpcfg, sequence, qubits, sweepers, raw, is_mux, interleaved, held
+    )
+    estimate.check()
+    return estimate
+
+
+def sweep_point(
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper],
+    values: Sequence[np.ndarray],
+) -> Tuple[List[Element], List[Qubit]]:
+    """Return copies of sequence and qubits, with the values of software sweepers.
+
+    Args:
+        values: for each sweeper, the values of its parameters
+    """
+    sequence = [replace(elem) for elem in sequence]
+    qubits = [replace(qubit) for qubit in qubits]
+    for sweeper, point in zip(sweepers, values):
+        for par, idx, value in zip(sweeper.parameters, sweeper.indexes, point):
+            if par is Parameter.BIAS:
+                qubits[idx].bias = value
+            else:
+                setattr(sequence[idx], SOFTWARE_ATTRIBUTES[par], value)
+    return sequence, qubits
+
+
+def validate_command(
+    soccfg: Mapping,
+    qpcfg: Config,
+    sequence: List[Element],
+    qubits: List[Qubit],
+    sweepers: Sequence[Sweeper] = (),
+    raw: bool = False,
+    is_mux: Optional[bool] = None,
+    interleaved: Sequence[List[Element]] = (),
+    held: Optional[Mapping[int, int]] = None,
+    software: Sequence[Sweeper] = (),
+) -> Timeline:
+    """Validate the programs of a command once, before building any of them.
+
+    The template program is validated and estimated following it once. With
+    software sweepers, the programs with the lowest and the highest value of
+    every swept parameter are validated too, instead of the one of each point.
+    The other arguments are the ones of :func:`validate_program`.
+
+    Returns:
+        (Timeline): the expected timeline of the template program, repeated
+        for all the points of the software sweepers
+    """
+    if is_mux is None:
+        is_mux = qibosoq_cfg.IS_MULTIPLEXED
+    check_program(soccfg, sequence, qubits, sweepers, raw, is_mux, interleaved)
+    estimate, expected = estimate_resources(
+        soccfg, qpcfg, sequence, qubits, sweepers, raw, is_mux, interleaved, held
+    )
+    estimate.check()
+
+    if len(software) == 0:
+        return expected
+    for extreme in (np.min, np.max):
+        values = [extreme(sweeper.points, axis=1) for sweeper in software]
+        point_sequence, point_qubits = sweep_point(sequence, qubits, software, values)
+        validate_program(
+            soccfg,
+            qpcfg,
+            point_sequence,
+            point_qubits,
+            sweepers,
+            raw,
+            is_mux,
+            interleaved,
+            held,
+        )
+    # every point of the software sweepers is a whole acquisition
+    for sweeper in software:
+        expected.rounds *= sweeper.expts
+    return expected
+
+
+def convert_batch(soccfg: Mapping, sequences: Sequence[List[Element]]):
+    """Convert the durations, frequencies and phases of many sequences at once.
+
+    The values are converted with a single call per channel and memoized by
+    the converter of the board, so validating each sequence is then a lookup.
+    """
+    conv = converter(soccfg)
+    pulses = [elem for seq in sequences for elem in seq if isinstance(elem, Pulse)]
+    for gen_ch in {pulse.dac for pulse in pulses}:
+        gen_pulses = [pulse for pulse in pulses if pulse.dac == gen_ch]
+        conv.us2cycles([pulse.duration for pulse in gen_pulses], gen_ch=gen_ch)
+        if "n_tones" in soccfg["gens"][gen_ch]:
+            continue
+        conv.deg2reg([pulse.relative_phase for pulse in gen_pulses], gen_ch=gen_ch)
+        for adc in {pulse.adc for pulse in gen_pulses}:
+            freqs = [pulse.frequency for pulse in gen_pulses if pulse.adc == adc]
+            conv.freq2reg(freqs, gen_ch=gen_ch, ro_ch=adc)
+
+    readouts = [elem for seq in sequences for elem in seq if elem.type == "readout"]
+    for adc in {elem.adc for elem in readouts}:
+        durations = [elem.duration for elem in readouts if elem.adc == adc]
+        conv.us2cycles(durations, ro_ch=adc)
+    conv.us2cycles(
+        np.array([elem.start_delay for seq in sequences for elem in seq], dtype=float)
+    )
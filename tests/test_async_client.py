@@ -0,0 +1,114 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from qibosoq.async_client import execute, execute_boards, execute_many
+from qibosoq.client import QibosoqError
+from qibosoq.components.base import Config, OperationCode, Qubit
+from qibosoq.components.pulses import Rectangular
+from qibosoq.compression import (
+    OPTIONS_SIZE,
+    Codec,
+    decode_length,
+    decompress,
+    encode_reply,
+)
+
+DELAY = 0.2
+
+
+@pytest.fixture
+def server_commands():
+    readout = Rectangular(
+        frequency=6400,
+        amplitude=0.05,
+        relative_phase=0,
+        start_delay=0,
+        duration=2,
+        name="readout_pulse",
+        type="readout",
+        dac=1,
+        adc=0,
+    )
+    return {
+        "operation_code": OperationCode.EXECUTE_PULSE_SEQUENCE,
+        "cfg": Config(),
+        "sequence": [readout],
+        "qubits": [Qubit()],
+    }
+
+
+async def start_board(reply, delay: float = DELAY):
+    """Start a fake server replying after a delay, return it with its port."""
+
+    async def handle(reader, writer):
+        length, negotiated = decode_length(await reader.readexactly(4))
+        assert negotiated
+        codec, _ = await reader.readexactly(OPTIONS_SIZE)
+        data = json.loads(decompress(codec, await reader.readexactly(length)))
+        assert data["operation_code"] == OperationCode.EXECUTE_PULSE_SEQUENCE
+        await asyncio.sleep(delay)
+        writer.write(encode_reply(Codec.NONE, json.dumps(reply).encode("utf-8")))
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_execute(server_commands):
+    async def run():
+        server, port = await start_board({"i": [[1]], "q": [[2]]}, delay=0)
+        async with server:
+            results = await execute(server_commands, "127.0.0.1", port)
+        assert results == ([[1]], [[2]])
+
+    asyncio.run(run())
+
+
+def test_execute_many(server_commands):
+    async def run():
+        boards = [await start_board({"i": [[idx]], "q": [[idx]]}) for idx in range(3)]
+        slow, slow_port = await start_board({"i": [], "q": []}, delay=10 * DELAY)
+        failing, failing_port = await start_board("error on the board")
+        targets = {("127.0.0.1", port): server_commands for _, port in boards}
+        targets[("127.0.0.1", slow_port)] = server_commands
+        targets[("127.0.0.1", failing_port)] = server_commands
+
+        start = time.perf_counter()
+        results = await execute_many(targets, timeout=3 * DELAY)
+        elapsed = time.perf_counter() - start
+
+        for server, _ in boards + [(slow, 0), (failing, 0)]:
+            server.close()
+        return results, elapsed, [port for _, port in boards], slow_port, failing_port
+
+    results, elapsed, ports, slow_port, failing_port = asyncio.run(run())
+    # boards are executed concurrently, the slow one is interrupted
+    assert elapsed < 4 * DELAY
+    for idx, port in enumerate(ports):
+        assert results[("127.0.0.1", port)] == ([[idx]], [[idx]])
+    assert isinstance(results[("127.0.0.1", slow_port)], asyncio.TimeoutError)
+    assert isinstance(results[("127.0.0.1", failing_port)], QibosoqError)
+
+
+def test_execute_boards(server_commands):
+    async def start():
+        return await start_board({"i": [[1]], "q": [[2]]}, delay=0)
+
+    loop = asyncio.new_event_loop()
+    server, port = loop.run_until_complete(start())
+    # serve in a thread, while execute_boards runs its own event loop
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        results = execute_boards({("127.0.0.1", port): server_commands})
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        loop.close()
+    assert results == {("127.0.0.1", port): ([[1]], [[2]])}
@@ -1,44 +1,60 @@
 import json
+import pathlib
+from dataclasses import asdict
 
 import numpy as np
 import pytest
 
+import qibosoq.configuration
 from qibosoq.client import (
     BufferLengthError,
     QibosoqError,
     RuntimeLoopError,
+    board_configs,
+    cancel_job,
+    compile_locally,
+    compile_program,
     connect,
     convert_commands,
+    decode_results,
     execute,
+    execute_compiled,
+    fetch_results,
+    get_stats,
+    get_status,
+    job_status,
+    ping,
+    preflight,
+    submit_job,
+    validate,
 )
+from qibosoq.codec import decode_sequence
 from qibosoq.components.base import Config, OperationCode, Parameter, Qubit, Sweeper
-from qibosoq.components.pulses import Rectangular
+from qibosoq.components.pulses import Gaussian, Rectangular
+from qibosoq.compression import Codec, encode_reply
+from qibosoq.shared import share_array
 
-return_active = True
 recv_result = None
+pending = bytearray()
 
 
-def mock_recv(obj, par):
-    global return_active
-    if return_active:
-        res = {"i": [[[1, 2, 3]]], "q": [[[1, 2, 3]]]}
-        res = json.dumps(res).encode("utf-8")
+def serve_reply(view, nbytes, reply):
+    """Serve the framed reply a few bytes at a time, as a socket can do."""
+    if not pending:
+        pending.extend(encode_reply(Codec.NONE, json.dumps(reply).encode("utf-8")))
+    count = min(nbytes, 7, len(pending))
+    view[:count] = pending[:count]
+    del pending[:count]
+    return count
 
-        return_active = False
-        return res
-    return_active = True
-    return False
 
+def mock_recv_into(obj, view, nbytes):
+    return serve_reply(view, nbytes, {"i": [[[1, 2, 3]]], "q": [[[1, 2, 3]]]})
 
-def mock_recv_with_result(obj, par):
-    """Mock recv by providing a return string."""
-    global return_active
-    global recv_result
-    if return_active:
-        return_active = False
-        return json.dumps(recv_result).encode("utf-8")
-    return_active = True
-    return False
+
+def mock_recv_into_with_result(obj, view, nbytes):
+    """Mock recv_into by providing a return string."""
+    return serve_reply(view, nbytes, recv_result)
 
 
 def mock_connect(obj, pars):
@@ -48,7 +64,7 @@ def mock_connect(obj, pars):
         raise ValueError("Port type is not int.")
 
 
-def mock_send(obj, pars):
+def mock_sendall(obj, pars):
     if not isinstance(pars, bytes):
         raise ValueError("Sent message is not in bytes.")
 
@@ -100,6 +116,9 @@ def targ_server_commands():
             "reps": 1000,
             "soft_avgs": 1,
             "average": True,
+            "persistent_bias": False,
+            "sync_readouts": True,
+            "interleave_block": 1,
         },
         "sequence": [
             {
@@ -128,7 +147,7 @@ def targ_server_commands():
             },
         ],
         "qubits": [
-            {"bias": None, "dac": None},
+            {"bias": None, "dac": None, "reset": None},
         ],
     }
     return targ
@@ -138,6 +157,9 @@ def test_convert_commands(server_commands, targ_server_commands):
     converted = convert_commands(server_commands)
     assert targ_server_commands == converted
 
+    columnar = convert_commands(server_commands, columnar=True)
+    assert decode_sequence(columnar["sequence"]) == server_commands["sequence"]
+
     server_commands["sweepers"] = [
         Sweeper(
             expts=10,
@@ -159,6 +181,11 @@ def test_convert_commands(server_commands, targ_server_commands):
     converted = convert_commands(server_commands)
     assert targ_server_commands == converted
 
+    server_commands["software_sweepers"] = server_commands["sweepers"]
+    targ_server_commands["software_sweepers"] = targ_server_commands["sweepers"]
+    converted = convert_commands(server_commands)
+    assert targ_server_commands == converted
+
     pulse_1 = Rectangular(
         frequency=5400,  # MHz
         amplitude=0.05,
@@ -196,11 +223,22 @@ def test_convert_commands(server_commands, targ_server_commands):
     with pytest.raises(RuntimeError):
         converted = convert_commands(server_commands)
 
+    del server_commands["sequence"]
+    server_commands["sequences"] = [[pulse_1], [pulse_3]]
+    converted = convert_commands(server_commands)
+    assert converted["sequences"] == [[asdict(pulse_1)], [asdict(pulse_3)]]
+    assert converted["sequence"] == [asdict(pulse_1), asdict(pulse_3)]
+
+    server_commands["interleaved"] = server_commands.pop("sequences")
+    converted = convert_commands(server_commands)
+    assert converted["interleaved"] == [[asdict(pulse_1)], [asdict(pulse_3)]]
+    assert "sequences" not in converted
+
 
 def test_execute(mocker, server_commands):
     mocker.patch("socket.socket.connect", new_callable=lambda: mock_connect)
-    mocker.patch("socket.socket.send", new_callable=lambda: mock_send)
-    mocker.patch("socket.socket.recv", new_callable=lambda: mock_recv)
+    mocker.patch("socket.socket.sendall", new_callable=lambda: mock_sendall)
+    mocker.patch("socket.socket.recv_into", new_callable=lambda: mock_recv_into)
 
     results = execute(server_commands, "0.0.0.0", 1000)
 
@@ -210,8 +248,8 @@ def test_execute(mocker, server_commands):
 
 def test_connect(mocker, server_commands):
     mocker.patch("socket.socket.connect", new_callable=lambda: mock_connect)
-    mocker.patch("socket.socket.send", new_callable=lambda: mock_send)
-    mocker.patch("socket.socket.recv", new_callable=lambda: mock_recv)
+    mocker.patch("socket.socket.sendall", new_callable=lambda: mock_sendall)
+    mocker.patch("socket.socket.recv_into", new_callable=lambda: mock_recv_into)
 
     converted = convert_commands(server_commands)
     results = connect(converted, "0.0.0.0", 1000)
@@ -220,12 +258,32 @@ def test_connect(mocker, server_commands):
     assert results == targ
 
 
+def test_validate(mocker, server_commands):
+    global recv_result
+
+    mocker.patch("socket.socket.connect", new_callable=lambda: mock_connect)
+    mocker.patch("socket.socket.sendall", new_callable=lambda: mock_sendall)
+    mocker.patch(
+        "socket.socket.recv_into", new_callable=lambda: mock_recv_into_with_result
+    )
+
+    recv_result = {"instructions": 30, "pmem_size": 8192}
+    results = validate(server_commands, "0.0.0.0", 1000)
+    assert results == recv_result
+    assert server_commands["operation_code"] is OperationCode.EXECUTE_PULSE_SEQUENCE
+
+    recv_result = {"asm": "end ;"}
+    assert compile_program(server_commands, "0.0.0.0", 1000) == recv_result
+
+
 def test_exceptions(mocker, server_commands):
     global recv_result
 
     mocker.patch("socket.socket.connect", new_callable=lambda: mock_connect)
-    mocker.patch("socket.socket.send", new_callable=lambda: mock_send)
-    mocker.patch("socket.socket.recv", new_callable=lambda: mock_recv_with_result)
+    mocker.patch("socket.socket.sendall", new_callable=lambda: mock_sendall)
+    mocker.patch(
+        "socket.socket.recv_into", new_callable=lambda: mock_recv_into_with_result
+    )
 
     converted = convert_commands(server_commands)
 
@@ -240,3 +298,157 @@ def test_exceptions(mocker, server_commands):
     recv_result = "This is an example error"
     with pytest.raises(QibosoqError):
         _ = connect(converted, "0.0.0.0", 1000)
+
+
+def test_decode_results(mocker):
+    attach = mocker.spy(qibosoq.client, "attach_results")
+    results = {"i": [[[0.0, 1.0]]], "q": [[[1.0, 0.0]]], "metadata": {}}
+    # replies received over TCP never contain shared arrays
+    assert decode_results(json.dumps(results).encode()) == results
+    attach.assert_not_called()
+
+    reply = {**results, "i": [[share_array(np.arange(4.0))]]}
+    decoded = decode_results(json.dumps(reply).encode(), shared=True)
+    assert isinstance(decoded["i"][0][0], np.ndarray)
+    np.testing.assert_array_equal(decoded["i"][0][0], np.arange(4.0))
+    assert decoded["q"] == results["q"]
+
+
+def test_jobs(mocker, server_commands):
+    send = mocker.patch("qibosoq.client.send_commands", return_value={"job_id": "1"})
+    assert submit_job(server_commands, "0.0.0.0", 1000) == "1"
+    sent = send.call_args[0][0]
+    assert sent["operation_code"] is OperationCode.SUBMIT_JOB
+    assert sent["command"] == convert_commands(server_commands)
+
+    job_status("1", "0.0.0.0", 1000)
+    assert send.call_args[0][0]["operation_code"] is OperationCode.JOB_STATUS
+    cancel_job("1", "0.0.0.0", 1000)
+    assert send.call_args[0][0] == {
+        "operation_code": OperationCode.CANCEL_JOB,
+        "job_id": "1",
+    }
+
+    send.return_value = {"i": [[1]], "q": [[2]]}
+    assert fetch_results("1", "0.0.0.0", 1000) == ([[1]], [[2]])
+
+
+def test_control(mocker):
+    send = mocker.patch("qibosoq.client.send_commands", return_value={"uptime": 1})
+    for function, opcode in [
+        (ping, OperationCode.PING),
+        (get_status, OperationCode.STATUS),
+        (get_stats, OperationCode.STATS),
+    ]:
+        assert function("0.0.0.0", 1000) == {"uptime": 1}
+        assert send.call_args[0][0] == {"operation_code": opcode}
+
+
+def test_compile_locally(mocker, monkeypatch, server_commands):
+    # programs are built for the readout mode of the board, not of the client
+    monkeypatch.setattr(qibosoq.configuration, "IS_MULTIPLEXED", True)
+    board_configs.clear()
+    file = pathlib.Path(__file__).parent / "qick_config_standard.json"
+    config = {
+        "soccfg": json.loads(file.read_text()),
+        "multiplexed": False,
+        "fingerprint": "firmware",
+    }
+    send = mocker.patch("qibosoq.client.send_commands", return_value=config)
+
+    compiled = compile_locally(server_commands, "0.0.0.0", 1000)
+    compile_locally(server_commands, "0.0.0.0", 1000)
+    # the configuration of the board is fetched only once
+    assert send.call_count == 1
+    assert compiled["fingerprint"] == "firmware"
+    assert compiled["operation_code"] == OperationCode.EXECUTE_PULSE_SEQUENCE
+    assert len(compiled["program"]["binprog"]) > 0
+    assert qibosoq.configuration.IS_MULTIPLEXED
+
+    send.return_value = {"i": [[1]], "q": [[2]]}
+    results = execute_compiled(server_commands, compiled, "0.0.0.0", 1000)
+    assert results == ([[1]], [[2]])
+    sent = send.call_args[0][0]
+    assert sent["operation_code"] is OperationCode.EXECUTE_COMPILED
+    assert sent["compiled"] is compiled
+
+
+def test_preflight(mocker, server_commands):
+    board_configs.clear()
+    file = pathlib.Path(__file__).parent / "qick_config_standard.json"
+    config = {
+        "soccfg": json.loads(file.read_text()),
+        "multiplexed": False,
+        "fingerprint": "firmware",
+    }
+    send = mocker.patch("qibosoq.client.send_commands", return_value=config)
+
+    drive, readout = server_commands["sequence"]
+    no_readout = {**server_commands, "sequence": [drive]}
+    long_pulse = Gaussian(**{**asdict(drive), "duration": 100, "rel_sigma": 5})
+    long_waveform = {**server_commands, "sequence": [long_pulse, readout]}
+    envelope_sweep = {
+        **server_commands,
+        "operation_code": OperationCode.EXECUTE_SWEEPS,
+        "sweepers": [
+            Sweeper(
+                expts=10,
+                parameters=[Parameter.REL_SIGMA],
+                indexes=[0],
+                starts=[1],
+                stops=[5],
+            )
+        ],
+    }
+    long_sequence = {**server_commands, "sequence": [drive] * 5000 + [readout]}
+    short_pulse = Gaussian(**{**asdict(drive), "rel_sigma": 5})
+    long_software_sweep = {
+        **server_commands,
+        "sequence": [short_pulse, readout],
+        "software_sweepers": [
+            Sweeper(
+                expts=10,
+                parameters=[Parameter.DURATION],
+                indexes=[0],
+                starts=[0.1],
+                stops=[100],
+            )
+        ],
+    }
+
+    errors = preflight(
+        [
+            server_commands,
+            no_readout,
+            long_waveform,
+            envelope_sweep,
+            long_sequence,
+            long_software_sweep,
+        ],
+        "0.0.0.0",
+        1000,
+    )
+    # only the configuration of the board is requested
+    assert send.call_count == 1
+    assert errors[0] is None
+    assert isinstance(errors[1], RuntimeError)
+    assert isinstance(errors[2], MemoryError)
+    assert isinstance(errors[3], NotImplementedError)
+    assert isinstance(errors[4], MemoryError)
+    # the longest point of the software sweeper does not fit
+    assert isinstance(errors[5], MemoryError)
+
+    board_configs.clear()
+    file = pathlib.Path(__file__).parent / "qick_config_multiplexed.json"
+    send.return_value = {**config, "soccfg": json.loads(file.read_text())}
+    readouts = [
+        Rectangular(**{**asdict(readout), "dac": 6, "adc": adc, "start_delay": 0})
+        for adc in range(2)
+    ]
+    readouts[1].duration = 1
+    mux_mismatch = {**server_commands, "sequence": [drive] + readouts}
+    assert preflight([mux_mismatch], "0.0.0.0", 1000) == [None]
+    send.return_value["multiplexed"] = True
+    board_configs.clear()
+    errors = preflight([mux_mismatch], "0.0.0.0", 1000)
+    assert "same duration" in str(errors[0])
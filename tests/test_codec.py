@@ -0,0 +1,236 @@
+import json
+import random
+import time
+from dataclasses import asdict
+
+import numpy as np
+import pytest
+
+from qibosoq.codec import (
+    ARRAY_KEY,
+    decode_array,
+    decode_qubit,
+    decode_sequence,
+    decode_sweeper,
+    encode_array,
+    encode_column,
+    encode_columns,
+    encode_config,
+    encode_qubit,
+    encode_sequence,
+    encode_sweeper,
+)
+from qibosoq.components.base import ActiveReset, Config, Parameter, Qubit, Sweeper
+from qibosoq.components.pulses import (
+    Arbitrary,
+    Drag,
+    FlatTop,
+    FluxExponential,
+    Gaussian,
+    Hann,
+    Measurement,
+    Rectangular,
+    Shape,
+)
+
+COMMON = dict(
+    frequency=5400,
+    amplitude=0.1,
+    relative_phase=10,
+    start_delay=0.1,
+    duration=0.04,
+    name="pulse",
+    type="drive",
+    dac=0,
+    adc=None,
+)
+
+
+@pytest.fixture
+def sequence():
+    return [
+        Rectangular(**COMMON),
+        Gaussian(**COMMON, rel_sigma=5),
+        Drag(**COMMON, rel_sigma=5, beta=0.1),
+        FlatTop(**COMMON, rel_sigma=5),
+        Hann(**COMMON),
+        FluxExponential(**COMMON, tau=1, upsilon=2, weight=0.5),
+        Arbitrary(**COMMON, i_values=[0.1, 0.2, 0.3], q_values=[0.3, 0.2, 0.1]),
+        Measurement(
+            type="readout", frequency=0, start_delay=0, duration=1, adc=0, dac=1
+        ),
+    ]
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_sequence(sequence, binary):
+    encoded = json.loads(json.dumps(encode_sequence(sequence, binary)))
+    if not binary:
+        # same form of `asdict`, expected by the server
+        assert encoded == [asdict(element) for element in sequence]
+    else:
+        assert ARRAY_KEY in encoded[6]["i_values"]
+    decoded = decode_sequence(encoded)
+    assert decoded == sequence
+    assert all(type(new) is type(old) for new, old in zip(decoded, sequence))
+    assert isinstance(decoded[6].i_values, list)
+
+
+def test_shape_case(sequence):
+    encoded = encode_sequence(sequence)
+    for element in encoded:
+        if "shape" in element:
+            element["shape"] = element["shape"].upper()
+    decoded = decode_sequence(encoded)
+    assert decoded == sequence
+    assert all(type(new) is type(old) for new, old in zip(decoded, sequence))
+
+    columns = encode_columns(sequence)
+    shapes = columns["columns"]["shape"]
+    shapes["categories"] = [
+        shape if shape is None else shape.title() for shape in shapes["categories"]
+    ]
+    assert decode_sequence(columns) == sequence
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_qubit(sequence, binary):
+    reset = ActiveReset(readout=sequence[0], pi_pulse=sequence[6], threshold=0.2)
+    for qubit in (Qubit(bias=0.1, dac=3), Qubit(reset=reset)):
+        encoded = json.loads(json.dumps(encode_qubit(qubit, binary)))
+        assert decode_qubit(encoded) == qubit
+        # the received commands are decoded more than once by the server
+        assert decode_qubit(encoded) == qubit
+    assert encode_qubit(Qubit(reset=reset)) == asdict(Qubit(reset=reset))
+
+
+def test_config():
+    config = Config(reps=10, interleave_block=2)
+    assert encode_config(config) == asdict(config)
+    assert Config(**encode_config(config)) == config
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_sweeper(binary):
+    sweepers = [
+        Sweeper(
+            expts=5,
+            parameters=[Parameter.FREQUENCY, Parameter.AMPLITUDE],
+            indexes=[0, 1],
+            starts=[10, 0.1],
+            stops=[20, 0.5],
+        ),
+        Sweeper.from_values([Parameter.DELAY], [0], [[0.1, 0.5, 0.2]]),
+    ]
+    for sweeper in sweepers:
+        encoded = encode_sweeper(sweeper, binary)
+        if not binary:
+            assert encoded == sweeper.serialized
+        decoded = decode_sweeper(json.loads(json.dumps(encoded)))
+        assert decoded.parameters == sweeper.parameters
+        assert decoded.indexes == sweeper.indexes
+        np.testing.assert_array_equal(decoded.points, sweeper.points)
+
+
+def test_array():
+    values = np.linspace(0, 1, 12).reshape(3, 4)
+    decoded = decode_array(json.loads(json.dumps(encode_array(values, binary=True))))
+    np.testing.assert_array_equal(decoded, values)
+    decoded += 1  # decoded buffers are writable
+    assert encode_array(values) == values.tolist()
+
+
+def test_benchmark():
+    """Encode and decode a sequence of 10k elements, compared with `asdict`."""
+    sequence = [
+        Gaussian(**{**COMMON, "name": f"pulse_{idx}"}, rel_sigma=5)
+        for idx in range(10000)
+    ]
+
+    def best(function, *args):
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            result = function(*args)
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    asdict_time, reference = best(lambda seq: [asdict(elem) for elem in seq], sequence)
+    encode_time, encoded = best(encode_sequence, sequence)
+    old_decode_time, _ = best(
+        lambda seq: [Shape[elem["shape"].upper()].value(**elem) for elem in seq],
+        reference,
+    )
+    decode_time, decoded = best(decode_sequence, encoded)
+    print(
+        f"\n10k elements: encode {encode_time * 1e3:.1f} ms "
+        f"(asdict {asdict_time * 1e3:.1f} ms), decode {decode_time * 1e3:.1f} ms "
+        f"(previous {old_decode_time * 1e3:.1f} ms)"
+    )
+    assert encoded == reference
+    assert decoded == sequence
+    assert encode_time < asdict_time
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_columns(sequence, binary):
+    encoded = json.loads(json.dumps(encode_columns(sequence, binary)))
+    assert encoded["length"] == len(sequence)
+    decoded = decode_sequence(encoded)
+    assert decoded == sequence
+    assert all(type(new) is type(old) for new, old in zip(decoded, sequence))
+    assert isinstance(decoded[-1].adc, int)
+    assert decode_sequence(encode_columns([], binary)) == []
+
+
+def test_column():
+    assert encode_column(["a", "b"]) == {"categories": ["a", "b"]}
+    assert encode_column([0.1, 0.2], binary=True)["values"][ARRAY_KEY]
+    runs = {"categories": [1, 2], "runs": [0, 4, 1, 1]}
+    assert encode_column([1, 1, 1, 1, 2]) == runs
+    assert encode_column([1, 2, 1]) == {"categories": [1, 2], "codes": [0, 1, 0]}
+    codes = encode_column([None, 1, None, 1], binary=True)["codes"]
+    assert codes["dtype"] == "|u1"
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_columns_benchmark(binary):
+    """Compare columns and rows for a randomized benchmarking sequence."""
+    rng = random.Random(0)
+    sequence = [
+        Drag(
+            **{
+                **COMMON,
+                "name": f"pulse_{idx}",
+                "amplitude": rng.choice([0.1, 0.05]),
+                "relative_phase": rng.choice([0, 90, 180, 270]),
+            },
+            rel_sigma=5,
+            beta=0.1,
+        )
+        for idx in range(10000)
+    ]
+    sequence.append(
+        Rectangular(**{**COMMON, "type": "readout", "name": "ro", "dac": 1, "adc": 0})
+    )
+
+    rows = json.dumps(encode_sequence(sequence, binary))
+    columns = json.dumps(encode_columns(sequence, binary))
+
+    def best(message):
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            decoded = decode_sequence(json.loads(message))
+            times.append(time.perf_counter() - start)
+        assert decoded == sequence
+        return min(times)
+
+    rows_time = best(rows)
+    columns_time = best(columns)
+    print(
+        f"\n10k elements: rows {len(rows)} bytes, decoded in {rows_time * 1e3:.1f} ms, "
+        f"columns {len(columns)} bytes, decoded in {columns_time * 1e3:.1f} ms"
+    )
+    assert len(columns) * 10 < len(rows)
+    assert columns_time < rows_time
@@ -1,6 +1,6 @@
 import pytest
 
-from qibosoq.components.base import Parameter
+from qibosoq.components.base import Parameter, Sweeper
 
 PARAMETERS = [
     (Parameter.FREQUENCY, "frequency"),
@@ -8,6 +8,8 @@ PARAMETERS = [
     (Parameter.RELATIVE_PHASE, "relative_phase"),
     (Parameter.DELAY, "delay"),
     (Parameter.BIAS, "bias"),
+    (Parameter.REL_SIGMA, "rel_sigma"),
+    (Parameter.BETA, "beta"),
 ]
 
 
@@ -36,3 +38,33 @@ def test_parameter_variants():
     assert converted_list == expected
     assert list(converted_tuple) == expected
     assert sorted(converted_set) == sorted(expected)
+
+
+def test_sweeper_values():
+    sweeper = Sweeper.from_values(
+        parameters=[Parameter.AMPLITUDE], indexes=[0], values=[[0.5, 0.1, 0.3]]
+    )
+    assert sweeper.expts == 3
+    assert sweeper.starts.tolist() == [0.5]
+    assert sweeper.stops.tolist() == [0.3]
+    assert sweeper.serialized["values"] == [[0.5, 0.1, 0.3]]
+    assert sweeper.points.tolist() == [[0.5, 0.1, 0.3]]
+
+    sweeper = Sweeper(
+        expts=3, parameters=[Parameter.REL_SIGMA], indexes=[0], starts=[1], stops=[5]
+    )
+    assert sweeper.points.tolist() == [[1, 3, 5]]
+
+    with pytest.raises(ValueError, match="shape"):
+        Sweeper(
+            expts=2,
+            parameters=[Parameter.AMPLITUDE],
+            indexes=[0],
+            starts=[0],
+            stops=[1],
+            values=[[0, 0.5, 1]],
+        )
+    with pytest.raises(ValueError):
+        Sweeper.from_values(
+            parameters=[Parameter.AMPLITUDE], indexes=[0], values=[[0.5, 1.5, 0.3]]
+        )
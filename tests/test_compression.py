@@ -0,0 +1,50 @@
+import zlib
+
+import pytest
+
+import qibosoq.configuration
+from qibosoq.compression import (
+    NEGOTIATE,
+    Codec,
+    compress,
+    decode_length,
+    decompress,
+    encode_header,
+)
+
+
+def test_header():
+    assert encode_header(10, Codec.NONE, None) == (10).to_bytes(4, "big")
+    assert decode_length(encode_header(10, Codec.NONE, None)) == (10, False)
+
+    header = encode_header(10, Codec.ZLIB, 6)
+    assert len(header) == 6
+    assert int.from_bytes(header[:4], "big") == NEGOTIATE | 10
+    assert decode_length(header[:4]) == (10, True)
+    assert list(header[4:]) == [Codec.ZLIB, 6]
+
+    with pytest.raises(ValueError):
+        encode_header(10, Codec.NONE, 10)
+
+
+def test_compress(monkeypatch):
+    monkeypatch.setattr(qibosoq.configuration, "COMPRESSION_THRESHOLD", 100)
+    message = b"0" * 1000
+    codec, compressed = compress(message, 6)
+    assert codec is Codec.ZLIB
+    assert compressed == zlib.compress(message, 6)
+    assert decompress(codec, compressed) == message
+
+    # small messages and level 0 are not compressed
+    assert compress(b"0" * 10, 6) == (Codec.NONE, b"0" * 10)
+    assert compress(message, 0) == (Codec.NONE, message)
+    assert decompress(Codec.NONE, message) == message
+
+
+def test_decompress_limit(monkeypatch):
+    monkeypatch.setattr(qibosoq.configuration, "MAX_MESSAGE_SIZE", 1000)
+    assert decompress(Codec.ZLIB, zlib.compress(b"0" * 1000)) == b"0" * 1000
+    with pytest.raises(ValueError, match="larger than 1000 bytes"):
+        decompress(Codec.ZLIB, zlib.compress(b"0" * 1001))
+    with pytest.raises(zlib.error):
+        decompress(Codec.ZLIB, zlib.compress(b"0" * 1000)[:-4])
@@ -0,0 +1,75 @@
+import pathlib
+
+import numpy as np
+import pytest
+import qick
+
+qick.QickSoc = None
+
+import qibosoq.conversions
+from qibosoq.conversions import Converter, converter
+
+
+@pytest.fixture
+def soc():
+    file = pathlib.Path(__file__).parent / "qick_config_standard.json"
+    return qick.QickConfig(str(file))
+
+
+def test_us2cycles(soc):
+    conv = Converter(soc)
+    durations = [0, 0.04, 0.1, 2.0, 100]
+    for us in durations:
+        assert conv.us2cycles(us) == soc.us2cycles(us)
+        assert conv.us2cycles(us, gen_ch=3) == soc.us2cycles(us, gen_ch=3)
+        assert conv.us2cycles(us, ro_ch=0) == soc.us2cycles(us, ro_ch=0)
+
+    cycles = conv.us2cycles(durations, gen_ch=1)
+    assert cycles.tolist() == [soc.us2cycles(us, gen_ch=1) for us in durations]
+
+    with pytest.raises(RuntimeError):
+        conv.us2cycles(1, gen_ch=0, ro_ch=0)
+
+
+def test_freq2reg(soc):
+    conv = Converter(soc)
+    freqs = [-100, 0, 100.123, 5400, 6400.5]
+    for ro_ch in [None, 0, 1]:
+        expected = [soc.freq2reg(f, gen_ch=3, ro_ch=ro_ch) for f in freqs]
+        assert conv.freq2reg(freqs, gen_ch=3, ro_ch=ro_ch).tolist() == expected
+        assert [conv.freq2reg(f, gen_ch=3, ro_ch=ro_ch) for f in freqs] == expected
+
+
+def test_deg2reg(soc):
+    conv = Converter(soc)
+    phases = np.array([-90, 0, 45.5, 360, 720.1])
+    expected = [soc.deg2reg(deg, gen_ch=3) for deg in phases]
+    assert conv.deg2reg(phases, gen_ch=3).tolist() == expected
+    assert [conv.deg2reg(deg, gen_ch=3) for deg in phases] == expected
+
+
+def test_memoization(soc, mocker):
+    conv = Converter(soc)
+    conv.us2cycles([0.04, 0.1], gen_ch=3)
+    assert ((("us", soc["gens"][3]["f_fabric"]), 0.1)) in conv.cache
+
+    spy = mocker.spy(np, "round")
+    conv.us2cycles(0.1, gen_ch=3)
+    spy.assert_not_called()
+
+
+def test_eviction(soc, monkeypatch):
+    monkeypatch.setattr(qibosoq.conversions, "MAX_CACHED_VALUES", 3)
+    conv = Converter(soc)
+    for us in (0.1, 0.2, 0.3):
+        conv.us2cycles(us)
+    conv.us2cycles(0.1)  # the least recently used value is now 0.2
+    conv.us2cycles(0.4)
+    key = ("us", conv.f_time)
+    assert list(conv.cache) == [(key, 0.3), (key, 0.1), (key, 0.4)]
+
+
+def test_converter(soc):
+    assert converter(soc) is converter(soc)
+    other = qick.QickConfig(soc.get_cfg())
+    assert converter(other) is not converter(soc)
@@ -0,0 +1,561 @@
+import pathlib
+from dataclasses import replace
+
+import numpy as np
+import pytest
+import qick
+
+qick.QickSoc = None
+
+import qibosoq.configuration
+from qibosoq.components.base import ActiveReset, Config, Parameter, Qubit, Sweeper
+from qibosoq.components.pulses import (
+    Arbitrary,
+    Drag,
+    FlatTop,
+    FluxExponential,
+    Gaussian,
+    Measurement,
+    Rectangular,
+)
+from qibosoq.estimator import (
+    ProgramEstimate,
+    estimate_program,
+    estimate_timeline,
+    merge_sequences,
+    regwi_cost,
+)
+from qibosoq.programs.flux import held_biases, reset_held_biases
+from qibosoq.programs.pulse_sequence import ExecutePulseSequence, ExecuteSequences
+from qibosoq.programs.sweepers import ExecuteSweeps
+
+
+@pytest.fixture(params=[False, True])
+def soc(request):
+    qibosoq.configuration.IS_MULTIPLEXED = request.param
+    if qibosoq.configuration.IS_MULTIPLEXED:
+        file = "qick_config_multiplexed.json"
+    else:
+        file = "qick_config_standard.json"
+    soc = qick.QickConfig(str(pathlib.Path(__file__).parent / file))
+    return soc
+
+
+def drive_sequence():
+    return [
+        Gaussian(
+            frequency=100,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.04,
+            name="pulse0",
+            type="drive",
+            dac=3,
+            adc=0,
+            rel_sigma=5,
+        ),
+        Drag(
+            frequency=300,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.04,
+            name="pulse1",
+            type="drive",
+            dac=3,
+            adc=0,
+            rel_sigma=5,
+            beta=0.1,
+        ),
+        FlatTop(
+            frequency=100,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.1,
+            name="pulse2",
+            type="drive",
+            dac=3,
+            adc=0,
+            rel_sigma=2,
+        ),
+        Rectangular(
+            frequency=100,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0.4,
+            duration=0.04,
+            name="pulse3",
+            type="readout",
+            dac=6,
+            adc=0,
+        ),
+        Measurement(
+            type="readout",
+            frequency=100,
+            start_delay=0,
+            duration=0.04,
+            adc=0,
+            dac=6,
+        ),
+    ]
+
+
+def flux_sequence():
+    return [
+        Rectangular(
+            frequency=100,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.04,
+            name="pulse0",
+            type="readout",
+            dac=6,
+            adc=0,
+        ),
+        FluxExponential(
+            frequency=0,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.04,
+            name="flux0",
+            type="flux",
+            dac=1,
+            adc=None,
+            tau=10,
+            upsilon=1000,
+            weight=0.1,
+        ),
+        Arbitrary(
+            frequency=0,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0.1,
+            duration=0.04,
+            name="flux1",
+            type="flux",
+            dac=2,
+            adc=None,
+            i_values=[0.2] * 64,
+            q_values=[0.2] * 64,
+        ),
+        Rectangular(
+            frequency=0,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.5,
+            name="flux2",
+            type="flux",
+            dac=2,
+            adc=None,
+        ),
+        Rectangular(
+            frequency=100,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0.1,
+            duration=0.04,
+            name="pulse1",
+            type="readout",
+            dac=6,
+            adc=1,
+        ),
+    ]
+
+
+def mux_sequence():
+    return [
+        Rectangular(
+            frequency=100 + 100 * adc,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.04,
+            name=f"pulse{adc}",
+            type="readout",
+            dac=6,
+            adc=adc,
+        )
+        for adc in range(2)
+    ]
+
+
+def compiled_resources(program):
+    program.asm()
+    waveforms = {
+        gen_ch: env["next_addr"]
+        for gen_ch, env in enumerate(program.envelopes)
+        if env["next_addr"] > 0
+    }
+    return len(program.prog_list), waveforms
+
+
+@pytest.mark.parametrize("sequence", [drive_sequence, flux_sequence, mux_sequence])
+def test_estimate_pulse_sequence(soc, sequence):
+    config = Config()
+    qubits = [Qubit(0.1, 0), Qubit(), Qubit(0.2, 2)]
+
+    program = ExecutePulseSequence(soc, config, sequence(), qubits)
+    instructions, waveforms = compiled_resources(program)
+    estimate = estimate_program(soc, config, sequence(), qubits)
+
+    assert estimate.instructions == instructions
+    assert estimate.waveform_memory == waveforms
+    triggers = 2 if sequence is drive_sequence else 1
+    assert estimate.readout_triggers[0] == triggers
+    assert estimate.readout_buffers[0] == triggers * config.reps
+    estimate.check()
+
+
+@pytest.mark.parametrize("threshold", [0.5, 2**25])
+def test_estimate_active_reset(soc, threshold):
+    if qibosoq.configuration.IS_MULTIPLEXED:
+        return
+    config = Config()
+    sequence = drive_sequence()
+    reset = ActiveReset(
+        readout=sequence[3], pi_pulse=sequence[0], threshold=threshold, settle_time=2
+    )
+    qubits = [Qubit(0.1, 0, reset=reset)]
+
+    program = ExecutePulseSequence(soc, config, sequence, qubits)
+    instructions, waveforms = compiled_resources(program)
+    estimate = estimate_program(soc, config, sequence, qubits)
+    assert estimate.instructions == instructions
+    assert estimate.waveform_memory == waveforms
+    assert estimate.readout_triggers[0] == 3
+
+    timeline = estimate_timeline(soc, config, sequence, qubits)
+    assert timeline.relaxation_time == pytest.approx(2, abs=0.01)
+    # the pi pulse of the reset, then the bias going to zero
+    assert [event.kind for event in timeline.events[-2:]] == ["drive", "bias"]
+
+
+@pytest.mark.parametrize("block", [1, 10])
+def test_estimate_interleaved(soc, block):
+    config = Config(interleave_block=block)
+    qubits = [Qubit(0.1, 0)]
+    sequences = [drive_sequence(), drive_sequence()[2:]]
+    sequence = [elem for part in sequences for elem in part]
+
+    program = ExecuteSequences(soc, config, sequences, qubits)
+    instructions, waveforms = compiled_resources(program)
+    estimate = estimate_program(soc, config, sequence, qubits, interleaved=sequences)
+    assert estimate.instructions == instructions
+    assert estimate.waveform_memory == waveforms
+    assert estimate.readout_triggers[0] == 2
+    assert estimate.readout_buffers[0] == 2 * 2 * config.reps
+
+    timeline = estimate_timeline(soc, config, sequence, qubits, interleaved=sequences)
+    durations = [
+        estimate_timeline(soc, config, part, qubits).shot_duration for part in sequences
+    ]
+    assert timeline.shots == 2 * config.reps
+    assert timeline.shot_duration == pytest.approx(np.mean(durations), abs=0.01)
+
+
+def test_estimate_sweeps(soc):
+    config = Config()
+    qubits = [Qubit(0.1, 0)]
+    sweepers = [
+        Sweeper(
+            expts=10,
+            parameters=[Parameter.FREQUENCY, Parameter.DELAY],
+            starts=[0, 0],
+            stops=[100, 1],
+            indexes=[0, 3],
+        ),
+        Sweeper(
+            expts=20,
+            parameters=[Parameter.AMPLITUDE, Parameter.RELATIVE_PHASE],
+            starts=[0, 100],
+            stops=[1, 200],
+            indexes=[0, 1],
+        ),
+    ]
+
+    program = ExecuteSweeps(soc, config, drive_sequence(), qubits, *sweepers)
+    instructions, waveforms = compiled_resources(program)
+    estimate = estimate_program(soc, config, drive_sequence(), qubits, sweepers)
+
+    assert instructions <= estimate.instructions <= instructions + 2
+    assert estimate.waveform_memory == waveforms
+    assert estimate.readout_buffers[0] == 2 * config.reps * 200
+
+    sweepers = [
+        Sweeper(
+            expts=10,
+            parameters=[Parameter.BIAS],
+            starts=[0],
+            stops=[1],
+            indexes=[0],
+        ),
+    ]
+    program = ExecuteSweeps(soc, config, drive_sequence(), qubits, *sweepers)
+    instructions, _ = compiled_resources(program)
+    estimate = estimate_program(soc, config, drive_sequence(), qubits, sweepers)
+    assert instructions <= estimate.instructions <= instructions + 2
+
+
+@pytest.mark.parametrize("index,start,stop", [(0, 0.04, 0.2), (2, 0.1, 0.3)])
+def test_estimate_duration_sweeps(soc, index, start, stop):
+    config = Config()
+    qubits = [Qubit()]
+    sweepers = [
+        Sweeper(
+            expts=10,
+            parameters=[Parameter.DURATION],
+            starts=[start],
+            stops=[stop],
+            indexes=[index],
+        ),
+    ]
+
+    program = ExecuteSweeps(soc, config, drive_sequence(), qubits, *sweepers)
+    instructions, waveforms = compiled_resources(program)
+    estimate = estimate_program(soc, config, drive_sequence(), qubits, sweepers)
+
+    assert estimate.instructions == instructions
+    assert estimate.waveform_memory == waveforms
+
+
+def test_estimate_flux_sweeps(soc):
+    config = Config()
+    qubits = [Qubit(0.1, 0), Qubit(), Qubit(0.2, 2)]
+    sweepers = [
+        Sweeper(
+            expts=10,
+            parameters=[Parameter.AMPLITUDE],
+            starts=[-0.5],
+            stops=[0.5],
+            indexes=[3],
+        ),
+        Sweeper(
+            expts=5, parameters=[Parameter.BIAS], starts=[0], stops=[0.5], indexes=[0]
+        ),
+    ]
+
+    program = ExecuteSweeps(soc, config, flux_sequence(), qubits, *sweepers)
+    instructions, waveforms = compiled_resources(program)
+    estimate = estimate_program(soc, config, flux_sequence(), qubits, sweepers)
+
+    assert estimate.instructions == instructions
+    assert estimate.waveform_memory == waveforms
+
+
+def test_estimate_point_sweeps(soc):
+    config = Config()
+    qubits = [Qubit(0.1, 0)]
+    sweepers = [
+        Sweeper.from_values(
+            parameters=[Parameter.FREQUENCY, Parameter.DELAY],
+            indexes=[0, 3],
+            values=np.array([[0, 300, 100], [0.2, 0, 0.1]]),
+        ),
+        Sweeper(
+            expts=20,
+            parameters=[Parameter.AMPLITUDE],
+            starts=[0],
+            stops=[1],
+            indexes=[1],
+        ),
+    ]
+
+    program = ExecuteSweeps(soc, config, drive_sequence(), qubits, *sweepers)
+    instructions, _ = compiled_resources(program)
+    estimate = estimate_program(soc, config, drive_sequence(), qubits, sweepers)
+
+    assert instructions <= estimate.instructions <= instructions + 2
+    assert estimate.data_memory == len(program.point_table) == 6
+    estimate.check()
+
+    estimate.data_memory = estimate.dmem_size
+    with pytest.raises(MemoryError):
+        estimate.check()
+
+
+def test_estimate_raw(soc):
+    config = Config(reps=1)
+    estimate = estimate_program(soc, config, drive_sequence(), [Qubit()], raw=True)
+    length = soc.us2cycles(0.04, ro_ch=0)
+    assert estimate.decimated_buffers == {0: 2 * length}
+    assert estimate.decimated_limits == {0: soc["readouts"][0]["buf_maxlen"]}
+    estimate.check()
+
+
+def test_estimate_persistent_bias(soc):
+    reset_held_biases()
+    config = Config(persistent_bias=True)
+    qubits = [Qubit(0.1, 0), Qubit(), Qubit(0.2, 2)]
+
+    program = ExecutePulseSequence(soc, config, flux_sequence(), qubits)
+    instructions, _ = compiled_resources(program)
+    estimate = estimate_program(soc, config, flux_sequence(), qubits)
+    assert estimate.instructions == instructions
+
+    timeline = estimate_timeline(soc, config, flux_sequence(), qubits)
+    assert all(event.kind != "bias" for event in timeline.events)
+    assert (
+        timeline.shot_duration
+        < estimate_timeline(soc, Config(), flux_sequence(), qubits).shot_duration
+    )
+
+
+def test_estimate_held_bias(soc):
+    reset_held_biases()
+    config = Config(persistent_bias=True)
+    qubits = [Qubit(0.1, 0), Qubit(), Qubit(0.2, 2)]
+    ExecutePulseSequence(soc, config, flux_sequence(), qubits).update_held_biases()
+
+    # the bias of qubit 0 is kept, the one of qubit 2 is zeroed
+    qubits = [Qubit(0.1, 0), Qubit(), Qubit()]
+    program = ExecutePulseSequence(soc, config, flux_sequence(), qubits)
+    instructions, _ = compiled_resources(program)
+    estimate = estimate_program(soc, config, flux_sequence(), qubits, held=held_biases)
+    assert estimate.instructions == instructions
+    program.update_held_biases()
+
+    # the biases already held are not set again
+    program = ExecutePulseSequence(soc, config, flux_sequence(), qubits)
+    instructions, _ = compiled_resources(program)
+    estimate = estimate_program(soc, config, flux_sequence(), qubits, held=held_biases)
+    assert estimate.instructions == instructions
+    assert estimate_program(soc, config, flux_sequence(), qubits).instructions > (
+        instructions
+    )
+    reset_held_biases()
+
+
+def compiled_time(program):
+    """Sum of the reference time increments of a compiled program (us)."""
+    program.asm()
+    cycles = sum(
+        inst["args"][0] for inst in program.prog_list if inst["name"] == "synci"
+    )
+    return program.soccfg.cycles2us(cycles)
+
+
+@pytest.mark.parametrize("sequence", [drive_sequence, flux_sequence])
+def test_estimate_timeline(soc, sequence):
+    config = Config(relaxation_time=10, reps=100, soft_avgs=2)
+    qubits = [Qubit(0.1, 0), Qubit(), Qubit(0.2, 2)]
+
+    program = ExecutePulseSequence(soc, config, sequence(), qubits)
+    timeline = estimate_timeline(soc, config, sequence(), qubits)
+
+    total = timeline.initialization + timeline.shot_duration
+    assert total == pytest.approx(compiled_time(program), abs=0.01)
+    assert timeline.relaxation_time == pytest.approx(10, abs=0.01)
+    assert 0 < timeline.sequence_duration < timeline.shot_duration - 10
+    assert timeline.overhead >= 0
+    assert timeline.shots == 100
+    assert timeline.eta == pytest.approx(2 * (2 + 100 * timeline.shot_duration) * 1e-6)
+
+    kinds = {event.kind for event in timeline.events}
+    assert {"readout", "acquisition", "bias"} <= kinds
+    readouts = [event for event in timeline.events if event.kind == "acquisition"]
+    assert readouts[0].start >= config.ro_time_of_flight / soc["tprocs"][0]["f_time"]
+    assert timeline.serialized["eta"] == timeline.eta
+
+
+def test_estimate_timeline_sweeps(soc):
+    config = Config(relaxation_time=10)
+    sweeper = Sweeper(
+        expts=10, parameters=[Parameter.DELAY], starts=[0], stops=[1], indexes=[3]
+    )
+    fixed = estimate_timeline(soc, config, drive_sequence(), [Qubit()])
+    timeline = estimate_timeline(soc, config, drive_sequence(), [Qubit()], [sweeper])
+
+    # the swept delay replaces the start delay of the pulse with its average value
+    assert timeline.shot_duration == pytest.approx(fixed.shot_duration + 0.1, abs=0.01)
+    assert timeline.shots == 10 * config.reps
+
+    # the following elements are delayed by the average change in duration
+    sweeper = Sweeper(
+        expts=10,
+        parameters=[Parameter.DURATION],
+        starts=[0.04],
+        stops=[0.24],
+        indexes=[0],
+    )
+    timeline = estimate_timeline(soc, config, drive_sequence(), [Qubit()], [sweeper])
+    assert timeline.shot_duration == pytest.approx(fixed.shot_duration + 0.1, abs=0.01)
+    assert timeline.events[0].duration == pytest.approx(0.14, abs=0.01)
+
+
+def test_merge_sequences(soc):
+    config = Config()
+    qubits = [Qubit()]
+    # a pulse following the readouts, that waits for them when executed alone
+    first = drive_sequence()
+    first.append(replace(first[0], name="after", start_delay=0, dac=2))
+    other = [
+        Rectangular(
+            frequency=100,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0.1,
+            duration=0.2,
+            name=f"other{dac}",
+            type="drive",
+            dac=dac,
+            adc=None,
+        )
+        for dac in (0, 1)
+    ]
+    # the merged sequence is executed without synchronizing the readouts
+    executed = replace(config, sync_readouts=False)
+    merged, origins = merge_sequences(soc, executed, [first, other], qubits)
+    assert sorted(origins) == list(range(len(merged)))
+    assert merged[0].name == "pulse0"
+
+    # every element keeps the time it has in its own sequence
+    def starts(sequence, config):
+        timeline = estimate_timeline(soc, config, sequence, qubits)
+        return sorted(event.start for event in timeline.events)
+
+    expected = sorted(starts(first, config) + starts(other, config))
+    assert starts(merged, executed) == pytest.approx(expected, abs=0.01)
+
+    with pytest.raises(ValueError):
+        merge_sequences(soc, config, [drive_sequence(), drive_sequence()], qubits)
+    # a pulse following the readouts on a generator already used
+    first[-1] = replace(first[-1], dac=3)
+    with pytest.raises(ValueError, match="after"):
+        merge_sequences(soc, executed, [first, other], qubits)
+
+
+def test_regwi_cost():
+    assert regwi_cost(10) == 1
+    assert regwi_cost(2**31) == 2
+    assert regwi_cost(2**31 + 1) == 3
+
+
+def test_check():
+    estimate = ProgramEstimate(instructions=11, pmem_size=10)
+    with pytest.raises(MemoryError):
+        estimate.check()
+
+    estimate = ProgramEstimate(
+        instructions=1,
+        pmem_size=10,
+        waveform_memory={0: 100},
+        waveform_limits={0: 10},
+    )
+    with pytest.raises(MemoryError, match="buffer length must be 10 samples or less"):
+        estimate.check()
+
+    estimate = ProgramEstimate(
+        instructions=1,
+        pmem_size=10,
+        decimated_buffers={0: 100},
+        decimated_limits={0: 10},
+    )
+    with pytest.raises(MemoryError):
+        estimate.check()
+
+    assert estimate.serialized["decimated_buffers"] == {0: 100}
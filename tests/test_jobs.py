@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+
+import pytest
+
+from qibosoq.jobs import JobManager, JobStatus
+
+
+def encode(results):
+    return json.dumps(results).encode("utf-8")
+
+
+@pytest.fixture
+def gate():
+    """Event releasing the jobs waiting on it."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def jobs(gate):
+    def execute(command, job):
+        job.expected = 10
+        while not gate.wait(0.01):
+            job.check_cancelled()
+        if "error" in command:
+            raise ValueError(command["error"])
+        return {"i": command["value"], "q": []}
+
+    manager = JobManager(execute, encode)
+    yield manager
+    manager.shutdown()
+
+
+def wait(jobs, job_id):
+    while jobs.status(job_id)["status"] in ("queued", "running"):
+        time.sleep(0.01)
+    return jobs.status(job_id)
+
+
+def test_jobs(jobs, gate):
+    first = jobs.submit({"value": 1})
+    second = jobs.submit({"value": 2})
+    while first.status is JobStatus.QUEUED:
+        time.sleep(0.01)
+
+    status = jobs.status(first.id)
+    assert status["status"] == "running"
+    assert 0 < status["eta"] <= 10
+    assert jobs.status(second.id) == {
+        "job_id": second.id,
+        "status": "queued",
+        "eta": None,
+        "ahead": 0,
+    }
+    with pytest.raises(RuntimeError, match="running"):
+        jobs.fetch(first.id)
+
+    gate.set()
+    assert wait(jobs, second.id)["status"] == "done"
+    # results can be fetched more than once
+    assert json.loads(jobs.fetch(first.id)) == {"i": 1, "q": []}
+    assert json.loads(jobs.fetch(first.id)) == {"i": 1, "q": []}
+    assert jobs.run({"value": 3}) == {"i": 3, "q": []}
+
+    failed = jobs.submit({"value": 0, "error": "broken"})
+    assert wait(jobs, failed.id)["status"] == "failed"
+    assert "ValueError: broken" in json.loads(jobs.fetch(failed.id))
+    assert "ValueError: broken" in jobs.run({"value": 0, "error": "broken"})
+
+    with pytest.raises(ValueError, match="Unknown"):
+        jobs.status("missing")
+
+
+def test_ahead(jobs, gate):
+    running = jobs.submit({"value": 1})
+    anonymous = jobs.submit({"value": 2}, keep=False)
+    kept = jobs.submit({"value": 3})
+    while running.status is JobStatus.QUEUED:
+        time.sleep(0.01)
+
+    # the not kept jobs queued before are counted, as in the summary
+    assert jobs.status(kept.id)["ahead"] == 1
+    assert jobs.summary()["queued"] == 2
+    jobs.cancel(running.id)
+    gate.set()
+    assert wait(jobs, kept.id)["status"] == "done"
+    assert anonymous.status is JobStatus.DONE
+
+
+def test_cancel(jobs):
+    running = jobs.submit({"value": 1})
+    queued = jobs.submit({"value": 2})
+    while running.status is JobStatus.QUEUED:
+        time.sleep(0.01)
+
+    assert jobs.cancel(queued.id)["status"] == "cancelled"
+    assert "before running" in json.loads(jobs.fetch(queued.id))
+    jobs.cancel(running.id)
+    assert wait(jobs, running.id)["status"] == "cancelled"
+    assert "JobCancelled" in json.loads(jobs.fetch(running.id))
+    # cancelling finished jobs does nothing
+    assert jobs.cancel(running.id)["status"] == "cancelled"
+
+
+def test_shutdown(jobs, gate):
+    running = jobs.submit({"value": 1})
+    queued = jobs.submit({"value": 2})
+    anonymous = jobs.submit({"value": 3}, keep=False)
+    while running.status is JobStatus.QUEUED:
+        time.sleep(0.01)
+
+    # the queued jobs, also the not kept ones, are never executed, while the
+    # running one is waited for
+    threading.Timer(0.1, gate.set).start()
+    jobs.shutdown()
+    assert running.status is JobStatus.DONE
+    assert queued.status is anonymous.status is JobStatus.CANCELLED
+    assert "before running" in anonymous.results
+    assert jobs.summary()["queued"] == 0
+
+
+def test_eviction():
+    jobs = JobManager(lambda command, job: command["value"], encode, memory=10)
+    try:
+        old = jobs.submit({"value": "a" * 8})
+        wait(jobs, old.id)
+        new = jobs.submit({"value": "b" * 8})
+        wait(jobs, new.id)
+        # the oldest results are dropped, the latest are always kept
+        with pytest.raises(ValueError, match="expired"):
+            jobs.fetch(old.id)
+        assert json.loads(jobs.fetch(new.id)) == "b" * 8
+
+        jobs.ttl = 0
+        time.sleep(0.01)
+        with pytest.raises(ValueError, match="expired"):
+            jobs.fetch(new.id)
+    finally:
+        jobs.shutdown()
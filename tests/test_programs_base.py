@@ -1,5 +1,7 @@
 import pathlib
+from dataclasses import replace
 
+import numpy as np
 import pytest
 import qick
 
@@ -259,6 +261,99 @@ def test_body(soc):
     program.body()
 
 
+def test_patch(soc, mocker):
+    drive = Gaussian(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0,
+        duration=0.1,
+        name="pulse0",
+        type="drive",
+        dac=3,
+        adc=0,
+        rel_sigma=5,
+    )
+    readout = Rectangular(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0.1,
+        duration=0.04,
+        name="pulse1",
+        type="readout",
+        dac=6,
+        adc=0,
+    )
+    program = ExecutePulseSequence(soc, Config(), [drive, readout], [Qubit()])
+    program.compile()
+    binprog = program.binprog
+    board = mocker.Mock()
+
+    envelope = program.envelopes[3]["envs"][drive.waveform_name]
+    next_addr = program.envelopes[3]["next_addr"]
+    sequence = [replace(drive, rel_sigma=3), replace(readout)]
+    assert program.patch(sequence, [Qubit()], board)
+    patched = program.envelopes[3]["envs"][drive.waveform_name]
+    assert patched["addr"] == envelope["addr"]
+    assert program.envelopes[3]["next_addr"] == next_addr
+    assert not np.array_equal(patched["data"], envelope["data"])
+    board.load_envelope.assert_called_once()
+    assert program.binprog is binprog
+
+    # going back to the original envelope loads it again
+    assert program.patch([drive, readout], [Qubit()], board)
+    assert np.array_equal(
+        program.envelopes[3]["envs"][drive.waveform_name]["data"], envelope["data"]
+    )
+    assert board.load_envelope.call_count == 2
+
+    # multiplexed readout frequencies are in the generator configuration
+    sequence = [replace(drive, rel_sigma=3), replace(readout, frequency=200)]
+    assert program.patch(sequence, [Qubit()], board) is program.is_mux
+    if program.is_mux:
+        assert program.ro_chs[0]["freq"] == 200
+
+    sequence = [replace(drive, duration=0.2), replace(readout)]
+    assert not program.patch(sequence, [Qubit()], board)
+    assert not program.patch([drive], [Qubit()], board)
+    assert not program.patch([drive, readout], [Qubit(0.1, 0)], board)
+
+
+def test_mux_tones(soc):
+    if not qibosoq.configuration.IS_MULTIPLEXED:
+        pytest.skip("Multiplexed readout only")
+    readouts = [
+        Rectangular(
+            frequency=100 + 100 * adc,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=start_delay,
+            duration=0.04,
+            name=f"pulse{idx}",
+            type="readout",
+            dac=6,
+            adc=adc,
+        )
+        for idx, (adc, start_delay) in enumerate([(1, 0), (0, 0), (1, 0.1)])
+    ]
+    program = ExecutePulseSequence(soc, Config(), readouts, [Qubit()])
+    program.asm()
+    assert program.mux_tones == {6: [1, 0]}
+    masks = [
+        inst["comment"]
+        for inst in program.prog_list
+        if "comment" in inst and "mask" in inst["comment"]
+    ]
+    # the same tones in every group, so that the gain of each tone is unchanged
+    assert masks == ["mask = [0, 1, 2]", "mask = [0, 1, 2]"]
+
+    n_tones = soc["gens"][6]["n_tones"]
+    program.sequence = [replace(readouts[0], adc=adc) for adc in range(n_tones + 1)]
+    with pytest.raises(ValueError, match="multiplexed tones"):
+        program.declare_gen_mux_ro()
+
+
 def test_initialize(soc):
     with pytest.raises(Exception):
         test = BaseProgram(soc, {}, [], [])
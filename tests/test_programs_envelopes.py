@@ -0,0 +1,124 @@
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import qick
+
+qick.QickSoc = None
+
+from qibosoq.components.base import Config, Qubit
+from qibosoq.components.pulses import Drag, FlatTop, FluxExponential, Gaussian, Hann
+from qibosoq.programs.envelopes import (
+    EnvelopeLibrary,
+    flux_exponential_envelope,
+    library,
+    pulse_envelope,
+)
+from qibosoq.programs.pulse_sequence import ExecutePulseSequence
+
+
+@pytest.fixture
+def soc():
+    file = pathlib.Path(__file__).parent / "qick_config_standard.json"
+    return qick.QickConfig(str(file))
+
+
+def make_pulse(cls, **kwargs):
+    return cls(
+        frequency=100,
+        amplitude=0.5,
+        relative_phase=0,
+        start_delay=0,
+        duration=0.1,
+        name="pulse",
+        type="drive",
+        dac=3,
+        adc=0,
+        **kwargs,
+    )
+
+
+def reference_envelope(soc, pulse):
+    """Register the envelope with the qick functions."""
+    program = ExecutePulseSequence(soc, Config(), [pulse], [Qubit()])
+    length = soc.us2cycles(pulse.duration, gen_ch=3)
+    sigma = (length / pulse.rel_sigma) * np.sqrt(2)
+    if isinstance(pulse, Gaussian):
+        program.add_gauss(ch=3, name="ref", sigma=sigma, length=length)
+    else:
+        delta = -soc["gens"][3]["samps_per_clk"] * soc["gens"][3]["f_fabric"] / 2
+        program.add_DRAG(
+            ch=3,
+            name="ref",
+            sigma=sigma,
+            delta=delta,
+            alpha=pulse.beta,
+            length=length,
+        )
+    return program.envelopes[3]["envs"]["ref"]["data"]
+
+
+@pytest.mark.parametrize(
+    "pulse",
+    [make_pulse(Gaussian, rel_sigma=5), make_pulse(Drag, rel_sigma=5, beta=0.2)],
+)
+def test_pulse_envelope(soc, pulse):
+    program = ExecutePulseSequence(soc, Config(), [pulse], [Qubit()])
+    program.add_pulse_to_register(pulse)
+    data = program.envelopes[3]["envs"][pulse.waveform_name]["data"]
+    assert np.array_equal(data, reference_envelope(soc, pulse))
+
+
+def test_pulse_envelope_cache(soc):
+    library.clear()
+    gen = soc["gens"][3]
+    flat_top = make_pulse(FlatTop, rel_sigma=5)
+    first = pulse_envelope(flat_top, 12, gen)
+    second = pulse_envelope(make_pulse(Gaussian, rel_sigma=5), 12, gen)
+    assert first[0] is second[0]
+    assert not first[0].flags.writeable
+
+    hann = pulse_envelope(make_pulse(Hann), 12, gen)
+    assert np.array_equal(hann[0], make_pulse(Hann).i_values(12, int(gen["maxv"])))
+    assert pulse_envelope(make_pulse(Hann), 12, gen)[0] is hann[0]
+
+    with pytest.raises(NotImplementedError):
+        pulse_envelope(make_pulse(FluxExponential, tau=1, upsilon=1, weight=1), 12, gen)
+
+
+def test_flux_exponential_envelope():
+    pulse = make_pulse(FluxExponential, tau=10, upsilon=1000, weight=0.1)
+    i_vals = flux_exponential_envelope(pulse, 64, 1000)
+    assert np.array_equal(i_vals, pulse.i_values(64, 1000))
+    assert flux_exponential_envelope(pulse, 64, 1000) is i_vals
+
+
+def test_envelope_library_eviction():
+    envelopes = EnvelopeLibrary(max_samples=10)
+    envelopes.get("a", lambda: (np.zeros(4), None))
+    envelopes.get("b", lambda: (np.zeros(4), None))
+    envelopes.get("a", lambda: (np.ones(4), None))
+    assert envelopes.hits == 1
+
+    # "b" is the least recently used
+    envelopes.get("c", lambda: (np.zeros(4), None))
+    assert list(envelopes.envelopes) == ["a", "c"]
+    assert envelopes.samples == 8
+
+    # envelopes larger than the library are not stored
+    envelopes.get("d", lambda: (np.zeros(20), None))
+    assert "d" not in envelopes.envelopes
+
+
+def test_envelope_library_threads():
+    envelopes = EnvelopeLibrary(max_samples=40)
+
+    def get(key):
+        return envelopes.get(key % 20, lambda: (np.full(4, key % 20), None))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(get, range(2000)))
+    assert all(envelope[0][0] == key % 20 for key, envelope in enumerate(results))
+    assert envelopes.samples == 4 * len(envelopes.envelopes) <= 40
+    assert envelopes.hits + envelopes.misses == 2000
@@ -1,13 +1,16 @@
+import json
 import pathlib
 
 import pytest
 import qick
+from qick.helpers import NpEncoder
 
 qick.QickSoc = None
 
 import qibosoq.configuration
 from qibosoq.components.base import Config, Qubit
 from qibosoq.components.pulses import Arbitrary, FluxExponential, Gaussian, Rectangular
+from qibosoq.programs.flux import held_biases, reset_held_biases
 from qibosoq.programs.pulse_sequence import ExecutePulseSequence
 
 
@@ -216,3 +219,89 @@ def test_flux_body(soc):
     )
     with pytest.raises(NotImplementedError):
         program = ExecutePulseSequence(soc, config, sequence, qubits)
+
+
+def test_rectangular_flux_pulse(soc):
+    config = Config()
+    flux_pulse = Rectangular(
+        frequency=0,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0,
+        duration=2,
+        name="long_flux",
+        type="flux",
+        dac=1,
+        adc=None,
+    )
+    qubits = [Qubit(0.5, 1)]
+    samples_per_clk = soc["gens"][1]["samps_per_clk"]
+
+    # long pulses use only the edge waveform, loaded once
+    program = ExecutePulseSequence(soc, config, [flux_pulse, flux_pulse], qubits)
+    assert program.envelopes[1]["next_addr"] == 3 * samples_per_clk
+
+    # short pulses fall back to arbitrary waveforms
+    flux_pulse.duration = 0.005
+    program = ExecutePulseSequence(soc, config, [flux_pulse], qubits)
+    duration = soc.us2cycles(0.005, gen_ch=1)
+    assert program.envelopes[1]["next_addr"] == (duration + 1) * samples_per_clk
+
+    flux_pulse.duration = 2
+    flux_pulse.amplitude = 0.6
+    with pytest.raises(ValueError):
+        ExecutePulseSequence(soc, config, [flux_pulse], qubits)
+
+
+def test_persistent_bias(soc):
+    sequence = [
+        Rectangular(
+            frequency=100,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.04,
+            name="pulse4",
+            type="readout",
+            dac=6,
+            adc=0,
+        ),
+    ]
+    qubits = [Qubit(0.1, 0), Qubit(0.2, 2)]
+    reset_held_biases()
+
+    program = ExecutePulseSequence(soc, Config(), sequence, qubits)
+    program.update_held_biases()
+    assert held_biases == {}
+    per_shot = len(program.prog_list)
+
+    config = Config(persistent_bias=True)
+    program = ExecutePulseSequence(soc, config, sequence, qubits)
+    assert len(program.prog_list) < per_shot
+    first = len(program.prog_list)
+    program.update_held_biases()
+    max_gain = int(soc["gens"][0]["maxv"])
+    assert held_biases == {0: int(0.1 * max_gain), 2: int(0.2 * max_gain)}
+
+    # the same biases are not set again
+    program = ExecutePulseSequence(soc, config, sequence, qubits)
+    assert len(program.prog_list) < first
+    program.update_held_biases()
+
+    # biases not needed anymore are released
+    program = ExecutePulseSequence(soc, config, sequence, [Qubit(0.1, 0)])
+    assert program.held_after == {0: int(0.1 * max_gain)}
+    program.update_held_biases()
+    assert held_biases == {0: int(0.1 * max_gain)}
+
+    program = ExecutePulseSequence(soc, Config(), sequence, qubits)
+    program.update_held_biases()
+    assert held_biases == {}
+
+    # programs loaded already compiled leave the record untouched
+    compiled = json.loads(json.dumps(program.dump_compiled(), cls=NpEncoder))
+    held_biases[2] = 100
+    program = ExecutePulseSequence(soc, Config(), sequence, qubits, compiled)
+    program.update_held_biases()
+    assert held_biases == {2: 100}
+    reset_held_biases()
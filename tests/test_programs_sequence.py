@@ -1,14 +1,15 @@
 import pathlib
 
+import numpy as np
 import pytest
 import qick
 
 qick.QickSoc = None
 
 import qibosoq.configuration
-from qibosoq.components.base import Config, Qubit
+from qibosoq.components.base import ActiveReset, Config, Qubit
 from qibosoq.components.pulses import Rectangular
-from qibosoq.programs.pulse_sequence import ExecutePulseSequence
+from qibosoq.programs.pulse_sequence import ExecutePulseSequence, ExecuteSequences
 
 
 @pytest.fixture(params=[False, True])
@@ -129,3 +130,104 @@ def test_flux_body(soc):
 
     program = ExecutePulseSequence(soc, config, sequence, qubits)
     program.body()
+
+
+def interleaved_sequences():
+    drive = Rectangular(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0,
+        duration=0.04,
+        name="pulse0",
+        type="drive",
+        dac=3,
+        adc=0,
+    )
+    readout = Rectangular(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0.04,
+        duration=0.04,
+        name="pulse1",
+        type="readout",
+        dac=6,
+        adc=0,
+    )
+    return [[drive, readout], [readout]]
+
+
+def test_execute_sequences(soc, mocker):
+    config = Config(reps=4, interleave_block=2)
+    program = ExecuteSequences(soc, config, interleaved_sequences(), [Qubit()])
+    program.asm()
+    labels = [inst["label"] for inst in program.prog_list if "label" in inst]
+    assert {"SEQUENCE_1", "SEQUENCE_END", "SEQUENCE_SELECTED"} <= set(labels)
+    assert program.loop_dims == [2, 2, 2]
+    assert program.readouts_per_experiment == 1
+    assert [ro["trigs"] for ro in program.ro_chs.values()] == [1]
+
+    # (blocks, sequences, shots of a block, readouts, 2)
+    length = program.ro_chs[0]["length"]
+    program.acc_buf = [np.zeros((2, 2, 2, 1, 2))]
+    program.acc_buf[0][:, 1] = length
+    shots_i, shots_q = program.collect_shots()
+    assert shots_i == [[[[0.0] * 4]], [[[1.0] * 4]]]
+    assert np.array(shots_q).shape == (2, 1, 1, 4)
+
+    def acquire(*args, **kwargs):
+        # (readouts, sequences, shots of a block, 2)
+        program.rounds_buf = [[np.array([[[[0, 1]] * 2, [[2, 3]] * 2]])]]
+
+    mocker.patch.object(program, "acquire", side_effect=acquire)
+    avg_i, avg_q = program.perform_experiment(soc, average=True)
+    assert avg_i == [[[0.0]], [[2.0]]]
+    assert avg_q == [[[1.0]], [[3.0]]]
+
+
+def test_execute_sequences_errors(soc):
+    sequences = interleaved_sequences()
+    with pytest.raises(ValueError):
+        ExecuteSequences(soc, Config(reps=5, interleave_block=2), sequences, [Qubit()])
+    with pytest.raises(ValueError):
+        ExecuteSequences(soc, Config(), [sequences[0], sequences[0][:1]], [Qubit()])
+
+
+def test_active_reset(soc, mocker):
+    drive, readout = interleaved_sequences()[0]
+    reset = ActiveReset(readout=readout, pi_pulse=drive, threshold=0.5)
+    qubits = [Qubit(reset=reset)]
+    if qibosoq.configuration.IS_MULTIPLEXED:
+        with pytest.raises(NotImplementedError):
+            ExecutePulseSequence(soc, Config(), [drive, readout], qubits)
+        return
+
+    program = ExecutePulseSequence(soc, Config(reps=3), [drive, readout], qubits)
+    assert program.relax_delay == soc.us2cycles(reset.settle_time)
+    program.asm()
+    names = [inst["name"] for inst in program.prog_list if "name" in inst]
+    assert "read" in names and "condj" in names
+    labels = [inst["label"] for inst in program.prog_list if "label" in inst]
+    assert "RESET_0" in labels
+    # the reset readout is acquired after the readout of the sequence
+    assert [ro["trigs"] for ro in program.ro_chs.values()] == [2]
+
+    length = program.ro_chs[0]["length"]
+    program.acc_buf = [np.zeros((3, 2, 2))]
+    program.acc_buf[0][:, 0] = length
+    program.acc_buf[0][:, 1] = 2 * length
+    shots_i, _ = program.collect_shots()
+    assert shots_i == [[[1.0] * 3]]
+
+    def acquire(*args, **kwargs):
+        program.rounds_buf = [[np.array([[0, 1], [2, 3]])]]
+
+    mocker.patch.object(program, "acquire", side_effect=acquire)
+    avg_i, avg_q = program.perform_experiment(soc, average=True)
+    assert avg_i == [[0.0]]
+    assert avg_q == [[1.0]]
+
+    other = Qubit(reset=ActiveReset(readout=readout, pi_pulse=drive, threshold=0))
+    with pytest.raises(ValueError):
+        ExecutePulseSequence(soc, Config(), [drive], [other])
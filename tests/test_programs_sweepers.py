@@ -1,4 +1,6 @@
 import pathlib
+from dataclasses import replace
+from functools import partial
 
 import numpy as np
 import pytest
@@ -8,8 +10,16 @@ qick.QickSoc = None
 
 import qibosoq.configuration
 from qibosoq.components.base import Config, Parameter, Qubit, Sweeper
-from qibosoq.components.pulses import Rectangular
-from qibosoq.programs.sweepers import ExecuteSweeps, reversed_sweepers
+from qibosoq.components.pulses import (
+    Arbitrary,
+    Drag,
+    FlatTop,
+    FluxExponential,
+    Rectangular,
+)
+from qibosoq.estimator import pulse_cycles
+from qibosoq.programs.pulse_sequence import ExecutePulseSequence
+from qibosoq.programs.sweepers import POINTS_ADDRESS, ExecuteSweeps, reversed_sweepers
 
 
 @pytest.fixture(params=[False, True])
@@ -102,6 +112,239 @@ def test_body(execute_sweeps):
     execute_sweeps.body()
 
 
+@pytest.mark.parametrize(
+    "pulse",
+    [
+        Rectangular,
+        partial(Drag, rel_sigma=5, beta=0.1),
+        partial(FlatTop, rel_sigma=5),
+    ],
+)
+def test_duration_sweep(soc, pulse):
+    drive = pulse(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0,
+        duration=0.1,
+        name="pulse0",
+        type="drive",
+        dac=3,
+        adc=0,
+    )
+    readout = Rectangular(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0.1,
+        duration=0.04,
+        name="pulse1",
+        type="readout",
+        dac=6,
+        adc=0,
+    )
+    sweeper = Sweeper(
+        expts=10,
+        parameters=[Parameter.DURATION],
+        starts=[0.1],
+        stops=[0.3],
+        indexes=[0],
+    )
+    program = ExecuteSweeps(soc, Config(), [drive, readout], [Qubit()], sweeper)
+    program.asm()
+
+    lengths = [soc.us2cycles(0.1, gen_ch=3), soc.us2cycles(0.3, gen_ch=3)]
+    step = round((lengths[1] - lengths[0]) / 9)
+    updates = {
+        inst["comment"].split("'")[1]: inst["args"][-1]
+        for inst in program.prog_list
+        if inst["name"] == "mathi"
+        and "comment" in inst
+        and inst["comment"].startswith(" '")
+    }
+    assert updates["gen3_mode"] == step
+    assert updates["shift_0"] == step
+    # the following readout is delayed by the change in duration
+    assert any(
+        inst["name"] == "sync"
+        and inst["args"][1] == program.duration_shift_registers[0].addr
+        for inst in program.prog_list
+    )
+
+    bank = [name for name in program.envelopes[3]["envs"] if "duration_sweep" in name]
+    if drive.style == "arb":
+        assert len(bank) == 10
+        assert updates["gen3_addr"] == lengths[0] + 9 * step
+    else:
+        assert len(bank) == 0
+
+    # the envelopes of swept durations are loaded when building the program
+    if isinstance(drive, (Drag, FlatTop)):
+        patched = [replace(drive, rel_sigma=3), replace(readout)]
+        assert not program.patch(patched, [Qubit()], None)
+
+    sweeper.stops = np.array([300.0])
+    with pytest.raises(ValueError):
+        ExecuteSweeps(soc, Config(), [drive, readout], [Qubit()], sweeper)
+
+
+def test_flat_top_duration_sweep(soc):
+    drive = FlatTop(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0,
+        duration=0.1,
+        name="pulse0",
+        type="drive",
+        dac=3,
+        adc=0,
+        rel_sigma=5,
+    )
+    durations = [0.1, 0.2, 0.3]
+    sweeper = Sweeper(
+        expts=len(durations),
+        parameters=[Parameter.DURATION],
+        starts=[durations[0]],
+        stops=[durations[-1]],
+        indexes=[0],
+    )
+    program = ExecuteSweeps(soc, Config(), [drive], [Qubit()], sweeper)
+    program.asm()
+    mode = [
+        inst["args"][-1]
+        for inst in program.prog_list
+        if inst["name"] in ("regwi", "mathi")
+        and inst.get("comment", "").strip().startswith("'gen3_mode'")
+    ]
+    first, step = mode[0] % 2**16, mode[-1]
+    ramps = program.flat_top_ramps(3, drive.waveform_name)
+    swept = [ramps + first + point * step for point in range(len(durations))]
+
+    # the swept durations include the ramps, as the ones of static pulses
+    for duration, length in zip(durations, swept):
+        pulse = replace(drive, duration=duration)
+        static = ExecutePulseSequence(soc, Config(), [pulse], [Qubit()])
+        for _ in range(2):  # also once the envelope is registered
+            static.add_pulse_to_register(pulse)
+        played = static._gen_mgrs[3].next_pulse["length"]
+        assert length == played == pulse_cycles(soc, pulse)
+        assert length == soc.us2cycles(duration, gen_ch=3)
+
+
+def test_flux_amplitude_sweep(soc):
+    flux = Rectangular(
+        frequency=0,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0,
+        duration=0.1,
+        name="pulse0",
+        type="flux",
+        dac=2,
+        adc=0,
+    )
+    readout = Rectangular(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0.1,
+        duration=0.04,
+        name="pulse1",
+        type="readout",
+        dac=6,
+        adc=0,
+    )
+    amplitude = Sweeper(
+        expts=10,
+        parameters=[Parameter.AMPLITUDE],
+        starts=[-0.5],
+        stops=[0.5],
+        indexes=[0],
+    )
+    bias = Sweeper(
+        expts=5, parameters=[Parameter.BIAS], starts=[-0.2], stops=[0.2], indexes=[0]
+    )
+    qubits = [Qubit(0.1, 2)]
+    max_gain = int(soc["gens"][2]["maxv"])
+
+    program = ExecuteSweeps(soc, Config(), [flux, readout], qubits, amplitude)
+    program.asm()
+    swept = program.flux_sweep_registers[0]
+    assert swept.init_val == int(-0.5 * max_gain)
+    # the sweetspot is added to the swept amplitude
+    sweetspot = int(0.1 * max_gain)
+    assert any(
+        inst["name"] == "mathi"
+        and inst["args"][2] == swept.addr
+        and inst["args"][4] == sweetspot
+        for inst in program.prog_list
+    )
+
+    program = ExecuteSweeps(soc, Config(), [flux, readout], qubits, amplitude, bias)
+    program.asm()
+    swept = program.flux_sweep_registers[0]
+    swept_bias = program.bias_sweep_registers[2][0]
+    assert any(
+        inst["name"] == "math"
+        and tuple(inst["args"][2:]) == (swept.addr, "+", swept_bias.addr)
+        for inst in program.prog_list
+    )
+
+    amplitude.stops = np.array([1.0])
+    with pytest.raises(ValueError):
+        ExecuteSweeps(soc, Config(), [flux, readout], qubits, amplitude)
+
+
+def test_point_sweep(soc, mocker):
+    pulse = Rectangular(
+        frequency=100,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0,
+        duration=0.04,
+        name="pulse0",
+        type="readout",
+        dac=6,
+        adc=0,
+    )
+    sweeper = Sweeper.from_values(
+        parameters=[Parameter.AMPLITUDE, Parameter.FREQUENCY],
+        indexes=[0, 0],
+        values=np.array([[0.5, 0.1, 0.3], [300, -100, 200]]),
+    )
+    program = ExecuteSweeps(soc, Config(), [pulse], [Qubit()], sweeper)
+    program.asm()
+    assert any(inst["name"] == "memr" for inst in program.prog_list)
+
+    max_gain = int(soc["gens"][6]["maxv"])
+    gains = [int(val * max_gain) for val in [0.5, 0.1, 0.3]]
+    register = program.get_gen_reg(6, "freq")
+    freqs = [
+        int(np.int32(np.uint32(register.val2reg(val)))) for val in [300, -100, 200]
+    ]
+    assert program.point_table == gains + freqs
+
+    board = mocker.Mock()
+    mocker.patch("qick.NDAveragerProgram.config_all")
+    program.config_all(board)
+    board.load_mem.assert_called_once_with(
+        program.point_table, mem_sel="dmem", addr=POINTS_ADDRESS
+    )
+
+    sweeper = Sweeper.from_values(
+        parameters=[Parameter.DURATION], indexes=[0], values=np.array([[0.04, 0.1]])
+    )
+    with pytest.raises(NotImplementedError):
+        ExecuteSweeps(soc, Config(), [pulse], [Qubit()], sweeper)
+
+    sweeper = Sweeper.from_values(
+        parameters=[Parameter.AMPLITUDE], indexes=[0], values=np.ones((1, 5000)) / 2
+    )
+    with pytest.raises(MemoryError):
+        ExecuteSweeps(soc, Config(), [pulse], [Qubit()], sweeper)
+
+
 def test_set_bias_sweep(soc):
     config = Config()
     sequence = [
@@ -239,13 +482,35 @@ def test_check_validity_sweep(soc):
             indexes=[0],
         )
     ]
-    with pytest.raises(NotImplementedError):
+    with pytest.raises(ValueError):
         program = ExecuteSweeps(soc, config, sequence_flux, qubits, *sweepers)
 
+    # the bias plus the flux pulse exceed the maximum gain
     qubits_flux = [Qubit(dac=6, bias=0)]
-    with pytest.raises(NotImplementedError):
+    with pytest.raises(ValueError):
         program = ExecuteSweeps(soc, config, sequence_flux, qubits_flux, *sweepers)
 
+    sequence_exponential = [
+        FluxExponential(
+            frequency=0,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.04,
+            name="pulse1",
+            type="flux",
+            dac=6,
+            adc=0,
+            tau=1,
+            upsilon=1,
+            weight=1,
+        ),
+    ]
+    with pytest.raises(NotImplementedError):
+        program = ExecuteSweeps(
+            soc, config, sequence_exponential, qubits_flux, *sweepers
+        )
+
     sweepers = [
         Sweeper(
             expts=1000,
@@ -256,7 +521,7 @@ def test_check_validity_sweep(soc):
         )
     ]
     with pytest.raises(NotImplementedError):
-        program = ExecuteSweeps(soc, config, sequence_flux, qubits, *sweepers)
+        program = ExecuteSweeps(soc, config, sequence_exponential, qubits, *sweepers)
 
     sweepers = [
         Sweeper(
@@ -268,7 +533,26 @@ def test_check_validity_sweep(soc):
         )
     ]
     with pytest.raises(NotImplementedError):
-        program = ExecuteSweeps(soc, config, sequence, qubits, *sweepers)
+        program = ExecuteSweeps(soc, config, sequence_flux, qubits, *sweepers)
+
+    sequence_arbitrary = [
+        Arbitrary(
+            frequency=100,
+            amplitude=0.1,
+            relative_phase=0,
+            start_delay=0,
+            duration=0.04,
+            name="pulse1",
+            type="drive",
+            dac=3,
+            adc=0,
+            i_values=[0.1] * 64,
+            q_values=[0.1] * 64,
+        ),
+        sequence[0],
+    ]
+    with pytest.raises(NotImplementedError):
+        program = ExecuteSweeps(soc, config, sequence_arbitrary, qubits, *sweepers)
 
     sweepers = [
         Sweeper(
@@ -1,15 +1,32 @@
+import asyncio
+import json
 import pathlib
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict
+from multiprocessing.shared_memory import SharedMemory
 
 import numpy as np
 import pytest
 import qick
+from qick.helpers import NpEncoder
 
 qick.QickSoc = None
 import qibosoq
-from qibosoq.components.base import Parameter
+from qibosoq.client import encode_commands, send_commands
+from qibosoq.codec import encode_columns
+from qibosoq.components.base import ActiveReset, OperationCode, Parameter, Qubit
 from qibosoq.components.pulses import Measurement, Rectangular
 from qibosoq.log import define_loggers
-from qibosoq.server import execute_program, load_elements
+from qibosoq.programs.flux import held_biases, reset_held_biases
+import qibosoq.server
+import qibosoq.compiler
+import qibosoq.validation
+from qibosoq.server import execute_program, load_elements, load_qubits
+from qibosoq.shared import segment_names
 
 qibosoq.configuration.MAIN_LOGGER_FILE = "/tmp/test_log_rfsoc.log"
 qibosoq.configuration.PROGRAM_LOGGER_FILE = "/tmp/test_log2_rfsoc.log"
@@ -98,6 +115,40 @@ def test_load_elements():
     sequence_obj = [pulse_1, pulse_2, meas]
 
     assert load_elements(sequence) == sequence_obj
+    # sequences encoded by columns
+    for binary in (False, True):
+        columns = json.loads(json.dumps(encode_columns(sequence_obj, binary)))
+        assert load_elements(columns) == sequence_obj
+
+
+def test_load_qubits():
+    readout = Rectangular(
+        frequency=6400,
+        amplitude=0.05,
+        relative_phase=0,
+        start_delay=0,
+        duration=2,
+        name="readout_pulse",
+        type="readout",
+        dac=1,
+        adc=0,
+    )
+    pi_pulse = Rectangular(
+        frequency=5400,
+        amplitude=0.5,
+        relative_phase=0,
+        start_delay=0,
+        duration=0.04,
+        name="pi_pulse",
+        type="drive",
+        dac=0,
+        adc=0,
+    )
+    reset = ActiveReset(readout=readout, pi_pulse=pi_pulse, threshold=0.1)
+    qubits = [Qubit(bias=0.1, dac=2, reset=reset), Qubit()]
+    assert load_qubits([asdict(qubit) for qubit in qubits]) == qubits
+    # qubits sent by older clients have no reset
+    assert load_qubits([{"bias": None, "dac": None}]) == [Qubit()]
 
 
 def test_execute_program(mocker, soc):
@@ -166,8 +217,528 @@ def test_execute_program(mocker, soc):
         },
     ]
     commands["operation_code"] = 3
-    execute_program(commands, soc)
+    results = execute_program(commands, soc)
+    assert results["metadata"]["eta"] > 10 * 1000 * 100e-6
+
+    commands["operation_code"] = 4
+    estimate = execute_program(commands, soc)
+    assert estimate["instructions"] > 10
+    assert estimate["timeline"]["eta"] == results["metadata"]["eta"]
 
+    commands["sweepers"][0]["values"] = [[0, 0.5, 0.2]]
+    commands["sweepers"][0]["expts"] = 3
+    estimate = execute_program(commands, soc)
+    assert estimate["data_memory"] == 3
+    del commands["sweepers"][0]["values"]
+    commands["sweepers"][0]["expts"] = 10
+
+    commands["operation_code"] = 3
     soc["tprocs"][0]["pmem_size"] = 10
+    with pytest.raises(MemoryError):
+        execute_program(commands, soc)
+
+
+def test_execute_software_sweeps(mocker, soc):
+    res_array = np.array([[0, 0, 0], [1, 1, 1]])
+    mocker.patch(
+        "qibosoq.programs.base.BaseProgram.perform_experiment",
+        return_value=(res_array, res_array),
+    )
+    soc.load_envelope = mocker.Mock()
+    build = mocker.spy(qibosoq.server, "build_program")
+
+    commands = {
+        "operation_code": 1,
+        "cfg": {"reps": 1000},
+        "sequence": [
+            {
+                "shape": "gaussian",
+                "frequency": 5400,  # MHz
+                "amplitude": 0.05,
+                "relative_phase": 0,
+                "start_delay": 0,
+                "duration": 0.1,
+                "name": "drive_pulse",
+                "type": "drive",
+                "dac": 0,
+                "adc": None,
+                "rel_sigma": 5,
+            },
+            {
+                "shape": "rectangular",
+                "frequency": 6400,  # MHz
+                "amplitude": 0.05,
+                "relative_phase": 0,
+                "start_delay": 0.1,
+                "duration": 2,
+                "name": "readout_pulse",
+                "type": "readout",
+                "dac": 1,
+                "adc": 0,
+            },
+        ],
+        "qubits": [{"bias": 0.0, "dac": None}],
+        "software_sweepers": [
+            {
+                "expts": 4,
+                "parameters": [Parameter.REL_SIGMA],
+                "starts": [2],
+                "stops": [5],
+                "indexes": [0],
+            },
+        ],
+    }
+    results = execute_program(commands, soc)
+    # the envelope is patched, without building the program again
+    assert build.call_count == 1
+    assert soc.load_envelope.call_count == 3
+    assert np.array(results["i"]).shape == (2, 3, 4)
+    assert results["metadata"]["eta"] > 4 * 1000 * 100e-6
+
+    commands["software_sweepers"].append(
+        {
+            "expts": 5,
+            "parameters": [Parameter.FREQUENCY],
+            "starts": [6000],
+            "stops": [6400],
+            "indexes": [1],
+        },
+    )
+    build.reset_mock()
+    validate = mocker.spy(qibosoq.validation, "validate_program")
+    walk = mocker.spy(qibosoq.validation, "estimate_resources")
+    results = execute_program(commands, soc)
+    assert build.call_count == 20
+    assert np.array(results["q"]).shape == (2, 3, 4, 5)
+    # validated once, for the template and the extremes of the swept values
+    assert walk.call_count == 1
+    assert validate.call_count == 2
+
+    # the longest pulse does not fit in the envelope memory
+    commands["software_sweepers"] = [
+        {
+            "expts": 10,
+            "parameters": [Parameter.DURATION],
+            "starts": [0.1],
+            "stops": [100],
+            "indexes": [0],
+        },
+    ]
+    build.reset_mock()
+    with pytest.raises(MemoryError):
+        execute_program(commands, soc)
+    assert build.call_count == 0
+
+
+def test_execute_merged_sequences(mocker, soc):
+    res_array = np.array([[0, 0, 0], [1, 1, 1]])
+    perform = mocker.patch(
+        "qibosoq.programs.base.BaseProgram.perform_experiment",
+        return_value=(res_array, res_array),
+    )
+
+    def readout(dac, adc, start_delay):
+        return {
+            "shape": "rectangular",
+            "frequency": 6400,  # MHz
+            "amplitude": 0.05,
+            "relative_phase": 0,
+            "start_delay": start_delay,
+            "duration": 2,
+            "name": "readout_pulse",
+            "type": "readout",
+            "dac": dac,
+            "adc": adc,
+        }
+
+    drive = {
+        "shape": "rectangular",
+        "frequency": 5400,  # MHz
+        "amplitude": 0.05,
+        "relative_phase": 0,
+        "start_delay": 0,
+        "duration": 0.04,
+        "name": "drive_pulse",
+        "type": "drive",
+        "dac": 0,
+        "adc": None,
+    }
+    commands = {
+        "operation_code": 1,
+        "cfg": {"reps": 1000},
+        "sequences": [[drive, readout(1, 0, 0.04)], [readout(2, 1, 0)]],
+        "qubits": [{"bias": 0.0, "dac": None}],
+        "sweepers": [
+            {
+                "expts": 3,
+                "parameters": [Parameter.AMPLITUDE],
+                "starts": [0],
+                "stops": [1],
+                "indexes": [2],
+            },
+        ],
+    }
+    commands["operation_code"] = 3
+    results = execute_program(commands, soc)
+    assert perform.call_count == 1
+    # the second sequence is acquired first
+    assert np.array(results["i"]).tolist() == [[[1, 1, 1]], [[0, 0, 0]]]
+    assert [elem["dac"] for elem in commands["sequence"]] == [0, 2, 1]
+    assert commands["sweepers"][0]["indexes"] == [1]
+    assert commands["cfg"]["sync_readouts"] is False
+
+    commands["sequences"][1][0]["dac"] = 1
+    with pytest.raises(ValueError):
+        execute_program(commands, soc)
+
+
+def test_execute_interleaved_sequences(mocker, soc):
+    results = [[[[0, 0]]], [[[1, 1]]]]
+    perform = mocker.patch(
+        "qibosoq.programs.base.BaseProgram.perform_experiment",
+        return_value=(results, results),
+    )
+    build = mocker.spy(qibosoq.server, "build_program")
+
+    readout = {
+        "shape": "rectangular",
+        "frequency": 6400,  # MHz
+        "amplitude": 0.05,
+        "relative_phase": 0,
+        "start_delay": 0.04,
+        "duration": 2,
+        "name": "readout_pulse",
+        "type": "readout",
+        "dac": 1,
+        "adc": 0,
+    }
+    drive = {
+        "shape": "rectangular",
+        "frequency": 5400,  # MHz
+        "amplitude": 0.05,
+        "relative_phase": 0,
+        "start_delay": 0,
+        "duration": 0.04,
+        "name": "drive_pulse",
+        "type": "drive",
+        "dac": 0,
+        "adc": None,
+    }
+    commands = {
+        "operation_code": 1,
+        "cfg": {"reps": 1000, "interleave_block": 10},
+        "sequence": [drive, readout, readout],
+        "interleaved": [[drive, readout], [readout]],
+        "qubits": [{"bias": 0.0, "dac": None}],
+    }
+    reply = execute_program(commands, soc)
+    assert perform.call_count == 1
+    assert isinstance(build.spy_return, qibosoq.server.ExecuteSequences)
+    assert reply["i"] == results
+
+    commands["operation_code"] = 4
+    estimate = execute_program(commands, soc)
+    assert estimate["readout_buffers"][0] == 2 * 1000
+    assert estimate["timeline"]["eta"] > 2 * 1000 * 100e-6
+
+    commands["sweepers"] = []
+    with pytest.raises(NotImplementedError):
+        execute_program(commands, soc)
+
+
+def test_compile_command(soc):
+    readout = {
+        "shape": "rectangular",
+        "frequency": 6400,  # MHz
+        "amplitude": 0.05,
+        "relative_phase": 0,
+        "start_delay": 0.04,
+        "duration": 2,
+        "name": "readout_pulse",
+        "type": "readout",
+        "dac": 1,
+        "adc": 0,
+    }
+    commands = {
+        "operation_code": 5,
+        "cfg": {"reps": 1000},
+        "sequence": [readout],
+        "qubits": [{"bias": 0.0, "dac": None}],
+    }
+    compiled = execute_program(commands, soc)
+    program = compiled["program"]
+    assert len(program["prog_list"]) > 0
+    assert "LOOP_J" in compiled["asm"]
+    assert compiled["timeline"]["eta"] > 1000 * 100e-6
+    # the dumped program can be sent as JSON
+    assert json.loads(json.dumps(compiled, cls=NpEncoder))["asm"] == compiled["asm"]
+
+    commands["sweepers"] = [
+        {
+            "expts": 10,
+            "parameters": [Parameter.AMPLITUDE],
+            "starts": [0.1],
+            "stops": [0.5],
+            "indexes": [0],
+        }
+    ]
+    compiled = execute_program(commands, soc)
+    assert compiled["program"]["loop_dims"] == [1000, 10]
+
+    # the biases held by the board do not change the compiled programs
+    commands["qubits"] = [{"bias": 0.1, "dac": 0}]
+    reference = execute_program(dict(commands), soc)["asm"]
+    held_biases[2] = 100
+    try:
+        assert execute_program(dict(commands), soc)["asm"] == reference
+    finally:
+        reset_held_biases()
+
+    commands["software_sweepers"] = commands.pop("sweepers")
+    with pytest.raises(NotImplementedError):
+        execute_program(commands, soc)
+
+
+def test_load_soc(monkeypatch):
+    file = str(pathlib.Path(__file__).parent / "qick_config_standard.json")
+    monkeypatch.setattr(qibosoq.configuration, "SOCCFG_LOCATION", file)
+    soc = qibosoq.server.load_soc()
+    assert isinstance(soc, qick.QickConfig)
+    assert soc["tprocs"][0]["pmem_size"] > 0
+
+
+def test_execute_compiled(mocker, soc):
+    results = [[[0, 0]]]
+    perform = mocker.patch(
+        "qibosoq.programs.base.BaseProgram.perform_experiment",
+        return_value=(results, results),
+    )
+    build = mocker.spy(qibosoq.server, "build_program")
+    compile_build = mocker.spy(qibosoq.compiler, "build_program")
+    body = mocker.spy(qibosoq.programs.flux.FluxProgram, "body")
+
+    readout = {
+        "shape": "rectangular",
+        "frequency": 6400,  # MHz
+        "amplitude": 0.05,
+        "relative_phase": 0,
+        "start_delay": 0.04,
+        "duration": 2,
+        "name": "readout_pulse",
+        "type": "readout",
+        "dac": 1,
+        "adc": 0,
+    }
+    commands = {
+        "operation_code": 6,
+        "cfg": {"reps": 1000},
+        "sequence": [readout],
+        "qubits": [{"bias": 0.0, "dac": None}],
+        "sweepers": [
+            {
+                "expts": 10,
+                "parameters": [Parameter.AMPLITUDE],
+                "starts": [0.1],
+                "stops": [0.5],
+                "indexes": [0],
+                "values": [list(np.linspace(0.1, 0.5, 10))],
+            }
+        ],
+    }
+    config = execute_program(commands, soc)
+    assert config["soccfg"] == soc.get_cfg()
+
+    commands["operation_code"] = 5
+    compiled = execute_program(dict(commands), soc)
+    assert compiled["fingerprint"] == config["fingerprint"]
+    assert body.call_count == 1
+    reference = compile_build.spy_return
+    # as received by the server
+    compiled = json.loads(json.dumps(compiled, cls=NpEncoder))
+
+    commands["operation_code"] = 7
+    commands["compiled"] = compiled
+    validate = mocker.spy(qibosoq.server, "validate")
+    asm = mocker.spy(qibosoq.programs.base.BaseProgram, "asm")
+    log = mocker.spy(qibosoq.server, "log_asm")
+    reply = execute_program(commands, soc)
+    assert reply["i"] == results
+    assert perform.call_count == 1
+    assert body.call_count == 1
+    # the program is neither validated nor assembled again
+    assert validate.call_count == asm.call_count == 0
+    log.assert_called_once_with(compiled["asm"])
+    assert reply["metadata"]["eta"] == compiled["timeline"]["eta"]
+    program = build.spy_return
+    assert program.binprog == reference.binprog
+    assert program.asm() == reference.asm()
+    assert program.point_table == reference.point_table
+    assert program.loop_dims == reference.loop_dims == [1000, 10]
+
+    # compiled programs do not release the biases held by the board
+    held_biases[2] = 100
+    try:
+        with pytest.raises(RuntimeError, match="persistent biases"):
+            execute_program(dict(commands), soc)
+    finally:
+        reset_held_biases()
+
+    commands["compiled"] = dict(compiled, fingerprint="other")
     with pytest.raises(RuntimeError):
         execute_program(commands, soc)
+
+
+@contextmanager
+def running_server(soc, unix_socket=None):
+    """Run a server with an event loop in a thread."""
+    server = qibosoq.server.QibosoqServer(soc, jobs=qibosoq.server.job_manager(soc))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+
+    def run(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    try:
+        run(server.start("127.0.0.1", 0, unix_socket))
+        yield server
+    finally:
+        run(server.close())
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        server.jobs.shutdown()
+
+
+@pytest.mark.parametrize("compression", [None, 6])
+def test_server_compression(mocker, monkeypatch, soc, compression):
+    monkeypatch.setattr(qibosoq.configuration, "COMPRESSION_THRESHOLD", 1000)
+    results = {"i": [[0.5] * 10000], "q": [[0.25] * 10000]}
+    execute = mocker.patch("qibosoq.server.execute_program", return_value=results)
+    commands = {"operation_code": 1, "sequence": [{"name": "pulse"}] * 1000}
+
+    with running_server(soc) as server:
+        host, port = server.addresses[0]
+        received = send_commands(commands, host, port, compression)
+
+        # clients not negotiating receive the results until the connection closes
+        with socket.create_connection((host, port)) as sock:
+            sock.sendall(encode_commands(commands))
+            legacy = b"".join(iter(lambda: sock.recv(4096), b""))
+
+    assert received == results
+    assert json.loads(legacy) == results
+    assert execute.call_args[0][0] == commands
+
+
+def test_server_message_size(mocker, monkeypatch, soc):
+    monkeypatch.setattr(qibosoq.configuration, "MAX_MESSAGE_SIZE", 1000)
+    execute = mocker.patch("qibosoq.server.execute_program")
+
+    with running_server(soc) as server:
+        host, port = server.addresses[0]
+        # the header is rejected without waiting for the message
+        with socket.create_connection((host, port)) as sock:
+            sock.sendall((2**30).to_bytes(4, "big"))
+            reply = b"".join(iter(lambda: sock.recv(4096), b""))
+
+    assert "larger than 1000 bytes" in json.loads(reply)
+    execute.assert_not_called()
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="no Unix sockets")
+def test_unix_server(mocker, monkeypatch, soc, tmp_path):
+    monkeypatch.setattr(qibosoq.configuration, "SHARED_MEMORY_THRESHOLD", 1000)
+    results = {"i": [[list(range(10000))]], "q": [[[0.25] * 10]], "metadata": {}}
+    mocker.patch("qibosoq.server.execute_program", return_value=results)
+    commands = {"operation_code": 1}
+
+    path = str(tmp_path / "qibosoq.sock")
+    with running_server(soc, path):
+        received = send_commands(commands, path, None)
+
+    assert isinstance(received["i"][0][0], np.ndarray)
+    np.testing.assert_array_equal(received["i"][0][0], results["i"][0][0])
+    assert received["q"] == results["q"]
+    assert not pathlib.Path(path).exists()
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="no Unix sockets")
+def test_unix_server_segments(mocker, monkeypatch, soc, tmp_path):
+    """Segments never attached by the client are unlinked when the server closes."""
+    monkeypatch.setattr(qibosoq.configuration, "SHARED_MEMORY_THRESHOLD", 1000)
+    results = {"i": [[list(range(10000))]], "q": [[list(range(10000))]]}
+    mocker.patch("qibosoq.server.execute_program", return_value=results)
+
+    path = str(tmp_path / "qibosoq.sock")
+    with running_server(soc, path) as server:
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(path)
+            sock.sendall(encode_commands({"operation_code": 1}, 0))
+            reply = b"".join(iter(lambda: sock.recv(4096), b""))
+        names = segment_names(json.loads(reply[5:]))
+        assert len(names) == 2
+        assert server.segments == set(names)
+    assert server.segments == set()
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name)
+
+
+def test_control_during_acquisition(mocker, soc):
+    """Control operations are answered while the board is acquiring."""
+    release = threading.Event()
+
+    def acquire(data, qick_soc, job=None):
+        release.wait(10)
+        return {"i": [[1.0]], "q": [[2.0]]}
+
+    mocker.patch("qibosoq.server.execute_program", side_effect=acquire)
+    with running_server(soc) as server:
+        host, port = server.addresses[0]
+        acquisition = ThreadPoolExecutor(max_workers=1).submit(
+            send_commands, {"operation_code": 1}, host, port
+        )
+        while server.jobs.current is None:
+            time.sleep(0.01)
+
+        start = time.perf_counter()
+        assert send_commands({"operation_code": OperationCode.PING}, host, port)
+        status = send_commands({"operation_code": OperationCode.STATUS}, host, port)
+        assert status["running"] == server.jobs.current.id
+        config = send_commands({"operation_code": OperationCode.GET_CONFIG}, host, port)
+        assert "fingerprint" in config
+        assert time.perf_counter() - start < 1
+        assert not acquisition.done()
+
+        release.set()
+        assert acquisition.result(10) == {"i": [[1.0]], "q": [[2.0]]}
+        stats = send_commands({"operation_code": OperationCode.STATS}, host, port)
+        assert stats["commands"]["EXECUTE_PULSE_SEQUENCE"] == 1
+        assert stats["commands"]["PING"] == 1
+        assert stats["errors"] == 0
+        status = send_commands({"operation_code": OperationCode.STATUS}, host, port)
+        assert status["running"] is None and status["queued"] == 0
+
+
+def test_jobs(mocker, soc):
+    results = {"i": [[1.0]], "q": [[2.0]]}
+    mocker.patch("qibosoq.server.execute_program", return_value=results)
+    jobs = qibosoq.server.job_manager(soc)
+    try:
+        command = {"operation_code": 1}
+        submitted = {"operation_code": OperationCode.SUBMIT_JOB, "command": command}
+        status = qibosoq.server.job_command(submitted, jobs)
+        job_id = status["job_id"]
+        jobs.get(job_id).future.result()
+
+        fetch = {"operation_code": OperationCode.FETCH_RESULTS, "job_id": job_id}
+        assert json.loads(qibosoq.server.job_command(fetch, jobs)) == results
+        query = {"operation_code": OperationCode.JOB_STATUS, "job_id": job_id}
+        assert qibosoq.server.job_command(query, jobs)["status"] == "done"
+
+        nested = {"operation_code": OperationCode.SUBMIT_JOB, "command": fetch}
+        with pytest.raises(ValueError):
+            qibosoq.server.job_command(nested, jobs)
+    finally:
+        jobs.shutdown()
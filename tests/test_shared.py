@@ -0,0 +1,73 @@
+import json
+import socket
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+import qibosoq.shared
+from qibosoq.shared import (
+    SHARED_KEY,
+    attach_results,
+    segment_names,
+    share_array,
+    share_results,
+    share_values,
+    unlink_segments,
+)
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="shared results need Unix sockets"
+)
+
+
+def test_share_results():
+    results = {
+        "i": [[list(range(1000))], [list(range(10))]],
+        "q": [[0.0] * 10],
+        "metadata": {"eta": 1},
+    }
+    shared = json.loads(json.dumps(share_results(results, threshold=1000)))
+    # ragged results are shared by parts, small arrays are sent as they are
+    assert SHARED_KEY in shared["i"][0]
+    assert shared["i"][1] == [list(range(10))]
+    assert shared["q"] == results["q"]
+
+    attached = attach_results(shared)
+    assert isinstance(attached["i"][0], np.ndarray)
+    np.testing.assert_array_equal(attached["i"][0], results["i"][0])
+    assert attached["i"][1] == results["i"][1]
+    assert attached["metadata"] == results["metadata"]
+
+    # errors and results without i and q are left untouched
+    assert share_results("error", threshold=0) == "error"
+    assert attach_results("error") == "error"
+    assert share_results({"asm": "end"}, threshold=0) == {"asm": "end"}
+
+
+def test_attach_array(monkeypatch, tmp_path):
+    values = np.arange(12.0).reshape(3, 4)
+    descriptor = share_array(values)
+    path = qibosoq.shared.SHM_DIRECTORY / descriptor[SHARED_KEY]
+    mapped = attach_results({"i": descriptor})["i"]
+    np.testing.assert_array_equal(mapped, values)
+    assert not path.exists()
+    mapped += 1  # mapped arrays are writable
+
+    # without the directory of the segments, the values are copied
+    monkeypatch.setattr(qibosoq.shared, "SHM_DIRECTORY", tmp_path)
+    descriptor = share_values(values.tolist(), threshold=0)
+    np.testing.assert_array_equal(attach_results({"i": descriptor})["i"], values)
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(descriptor[SHARED_KEY])
+
+
+def test_unlink_segments():
+    results = share_results({"i": [[0.0] * 1000, [0.0] * 10]}, threshold=1000)
+    names = segment_names(results)
+    assert names == [results["i"][0][SHARED_KEY]]
+    assert segment_names("error") == []
+
+    unlink_segments(names + names)  # already unlinked segments are skipped
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(names[0])
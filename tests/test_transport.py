@@ -0,0 +1,42 @@
+import socket
+import threading
+
+import pytest
+
+from qibosoq.transport import configure_socket, recv_exactly, recv_frame
+
+
+def test_recv_exactly():
+    left, right = socket.socketpair()
+    with left, right:
+        message = bytes(range(256)) * 1000
+
+        def send():
+            # the message arrives in many pieces
+            for start in range(0, len(message), 1000):
+                right.sendall(message[start : start + 1000])
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        received = recv_exactly(left, len(message))
+        thread.join()
+        assert received == message
+
+        right.sendall(b"123")
+        right.shutdown(socket.SHUT_WR)
+        with pytest.raises(ConnectionError, match="after 3 of 4 bytes"):
+            recv_exactly(left, 4)
+
+
+def test_recv_frame():
+    left, right = socket.socketpair()
+    with left, right:
+        right.sendall((5).to_bytes(4, "big") + b"hello" + b"next")
+        assert recv_frame(left) == b"hello"
+        assert recv_exactly(left, 4) == b"next"
+
+
+def test_configure_socket():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        configure_socket(sock)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
@@ -0,0 +1,105 @@
+import json
+import pathlib
+
+import pytest
+
+from qibosoq.components.base import ActiveReset, Config, Parameter, Qubit, Sweeper
+from qibosoq.components.pulses import Gaussian, Measurement, Rectangular
+from qibosoq.conversions import converter
+from qibosoq.validation import (
+    check_readouts,
+    check_resets,
+    convert_batch,
+    merged_indexes,
+    validate_program,
+)
+
+
+def load_soccfg(multiplexed: bool) -> dict:
+    file = (
+        "qick_config_multiplexed.json" if multiplexed else "qick_config_standard.json"
+    )
+    return json.loads((pathlib.Path(__file__).parent / file).read_text())
+
+
+def readout(adc: int, dac: int = 6, **kwargs) -> Rectangular:
+    values = dict(
+        frequency=6400,
+        amplitude=0.1,
+        relative_phase=0,
+        start_delay=0,
+        duration=1,
+        name=f"ro_{adc}",
+        type="readout",
+        dac=dac,
+        adc=adc,
+    )
+    values.update(kwargs)
+    return Rectangular(**values)
+
+
+def test_check_readouts():
+    soccfg = load_soccfg(multiplexed=True)
+    with pytest.raises(RuntimeError):
+        check_readouts(soccfg, [], is_mux=False)
+    check_readouts(soccfg, [readout(adc) for adc in range(4)], is_mux=True)
+    with pytest.raises(ValueError, match="4 multiplexed tones"):
+        check_readouts(soccfg, [readout(adc) for adc in range(5)], is_mux=True)
+    gaussian = Gaussian(**{**readout(0).__dict__, "shape": "gaussian", "rel_sigma": 5})
+    with pytest.raises(TypeError):
+        check_readouts(soccfg, [gaussian], is_mux=True)
+    # measurements do not use generators
+    measurement = Measurement(
+        type="readout", frequency=6400, start_delay=0, duration=1, adc=0, dac=6
+    )
+    check_readouts(soccfg, [measurement], is_mux=True)
+
+
+def test_check_resets():
+    sequence = [readout(0, dac=1)]
+    reset = ActiveReset(readout=readout(1, dac=1), pi_pulse=sequence[0], threshold=0)
+    with pytest.raises(ValueError, match="ADC 1"):
+        check_resets(sequence, [reset], is_mux=False)
+    with pytest.raises(NotImplementedError):
+        check_resets(sequence, [reset], is_mux=True)
+
+
+def test_merged_indexes():
+    origins = [2, 0, 1]
+    parameters = [Parameter.AMPLITUDE, Parameter.BIAS]
+    assert merged_indexes(parameters, [2, 2], origins) == [0, 2]
+    with pytest.raises(NotImplementedError):
+        merged_indexes([Parameter.DELAY], [0], origins)
+
+
+def test_validate_program():
+    soccfg = load_soccfg(multiplexed=False)
+    sequence = [readout(0, dac=1)]
+    qubits = [Qubit()]
+    estimate = validate_program(soccfg, Config(), sequence, qubits, is_mux=False)
+    assert estimate.readout_triggers == {0: 1}
+
+    sweeper = Sweeper(
+        expts=10, parameters=[Parameter.BETA], indexes=[0], starts=[0], stops=[1]
+    )
+    with pytest.raises(NotImplementedError, match="software"):
+        validate_program(soccfg, Config(), sequence, qubits, [sweeper], is_mux=False)
+    with pytest.raises(NotImplementedError, match="Interleaved"):
+        validate_program(
+            soccfg,
+            Config(),
+            sequence * 2,
+            qubits,
+            raw=True,
+            is_mux=False,
+            interleaved=[sequence, sequence],
+        )
+
+
+def test_convert_batch():
+    soccfg = load_soccfg(multiplexed=False)
+    sequences = [[readout(0, dac=1, duration=duration)] for duration in (1, 2)]
+    convert_batch(soccfg, sequences)
+    conv = converter(soccfg)
+    fclk = conv.gen_fclk[1]
+    assert conv.cache[(("us", fclk), 2.0)] == round(2 * fclk)